@@ -4,8 +4,6 @@ import os
 import re
 import sys
 import time
-import random
-import colorama
 import datetime
 import pandas as pd
 from bs4 import BeautifulSoup
@@ -16,111 +14,174 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as ec
 from selenium.common.exceptions import TimeoutException
 
-pd.set_option('display.max_colwidth', -1)
+import driver_pool
+import fetch_backends
+import company_crawler
+import row_extractor
+import query_planner
+import count_cache
+import frontier
+import result_store
+import page_store
+import seen_index
+import recrawl_scheduler
+import metrics
+import browser_profile
+import browser_rows
+import pagination_replay
+import pacing
+import sort_planner
+import paths
+import search_query
+# timestamped console lines, kept in a module of their own so tools that need no browser can log too
+from console import log_time
+
+try:
+    pd.set_option('display.max_colwidth', -1)
+except ValueError:  # pandas 1.0 and later take None for no limit
+    pd.set_option('display.max_colwidth', None)
 pd.set_option('display.colheader_justify', 'left')
-colorama.init()
-
-
-def log_time(kind='general', color_str=None):
-    if color_str is None:
-        if kind == 'error' or kind.startswith('e'):
-            color_str = colorama.Fore.RED
-        elif kind == 'info' or kind.startswith('i'):
-            color_str = colorama.Fore.YELLOW
-        elif kind == 'overwrite' or kind.startswith('o'):
-            color_str = colorama.Fore.MAGENTA
-        elif kind == 'write' or kind.startswith('w'):
-            color_str = colorama.Fore.CYAN
-        elif kind == 'highlight' or kind.startswith('h'):
-            color_str = colorama.Fore.GREEN
-        else:
-            color_str = colorama.Fore.WHITE
 
-    print(color_str + str(datetime.datetime.now()) + colorama.Fore.RESET, end=' ')
+# multiplies every pacing wait, the benchmark harness sets it to 0 to measure the scraper without the delays
+pause_scale = 1.
 
+# spaces the requests of this process, speeds up while the site responds well and backs off on timeouts,
+# errors and slow responses, see pacing.py
+pacer = pacing.AIMDPacer()
 
-def calc_pause(base_seconds=3., variable_seconds=5.):
-    return base_seconds + random.random() * variable_seconds
+# request budget shared by the worker processes of a sharded crawl, see supervisor.py
+request_budget = None
 
+# lease of the sort pass running in this process, renewed every heartbeat_seconds while a request waits for the
+# pacer, so that a pacer backed off to its floor never outlasts the lease, see crawl_frontier
+lease_heartbeat = None
+heartbeat_seconds = 60.
 
-def set_pause(kind=1, t=None):
-    log_time('info')
-    if t is not None:
-        kind_str = 'specific'
-    else:
-        if kind == 5:
-            kind_str = 'ultra long'
-            t = calc_pause(base_seconds=1000, variable_seconds=1000)
-        elif kind == 4:
-            kind_str = 'very long'
-            t = calc_pause(base_seconds=100, variable_seconds=100)
-        elif kind == 3:
-            kind_str = 'long'
-            t = calc_pause(base_seconds=10, variable_seconds=10)
-        elif kind == 2:
-            kind_str = 'short'
-            t = calc_pause(base_seconds=3., variable_seconds=3.)
-        else:
-            kind_str = 'very short'
-            t = calc_pause(base_seconds=0.5, variable_seconds=0.5)
 
-    print('{} pause: {}s...'.format(kind_str, t))
-
-    time.sleep(t)
+def throttle():
+    """
+    wait for the pacer and, in a sharded crawl, the shared request budget before sending a request
+    """
+    t = pacer.reserve() * pause_scale
+    if t > 0:
+        if t >= 1:
+            log_time('info')
+            print('pacing: {:.1f}s at {:.3f} requests/s...'.format(t, pacer.rate))
+        with metrics.timer('pacing_wait'):
+            t_end = time.time() + t
+            while True:
+                t_left = t_end - time.time()
+                if t_left <= 0:
+                    break
+                time.sleep(min(t_left, heartbeat_seconds))
+                heartbeat = lease_heartbeat
+                if heartbeat is not None and t_left > heartbeat_seconds:
+                    heartbeat()  # a lost lease is noticed by the sort pass at its next click
+    if request_budget is not None:
+        request_budget.acquire()
 
 
-def init_driver(driver_type='Chrome'):
+def init_driver(driver_type='Chrome', profile=None):
+    """
+    :param driver_type: 
+    :param profile: browser_profile.BrowserProfile, defaults to a visible browser loading everything
+    :return: 
+    """
+    if profile is None:
+        profile = browser_profile.default_profile()
     log_time('info')
-    print('initiating driver: {}'.format(driver_type))
-    if driver_type == 'Chrome':
-        dr = webdriver.Chrome()
-    elif driver_type.startswith('Pha'):
-        dr = webdriver.PhantomJS()
-    elif driver_type.startswith('Fi'):
-        dr = webdriver.Firefox()
-    else:
-        assert False
-    dr.set_window_size(1920, 600)
+    print('initiating driver: {}{}'.format(driver_type, ' (headless)' if profile.headless else ''))
+    user_data_dir = None
+    with metrics.timer('driver_launch'):
+        if driver_type == 'Chrome':
+            if profile.user_data_dir is not None:
+                user_data_dir = browser_profile.claim_user_data_dir(profile.user_data_dir)
+            try:
+                dr = webdriver.Chrome(options=browser_profile.chrome_options(profile, user_data_dir))
+            except:
+                browser_profile.release_user_data_dir(user_data_dir)
+                raise
+            browser_profile.apply_blocking(dr, profile)
+        elif driver_type.startswith('Pha'):
+            dr = webdriver.PhantomJS()
+        elif driver_type.startswith('Fi'):
+            dr = webdriver.Firefox(options=browser_profile.firefox_options(profile))
+        else:
+            assert False
+    dr.set_window_size(*profile.window_size)
     dr.wait = WebDriverWait(dr, 5)
-    dr.set_page_load_timeout(25)
+    dr.set_page_load_timeout(profile.page_load_timeout)
+    dr.profile = profile
+    dr.user_data_dir = user_data_dir
     return dr
 
 
 def quit_driver(dr):
     log_time('info')
     print('closing driver...')
-    dr.quit()
+    try:
+        dr.quit()
+    finally:
+        browser_profile.release_user_data_dir(getattr(dr, 'user_data_dir', None))
 
 
-def load_url(driver=None, url=None, n_attempts_limit=3):
+def record_transferred_bytes(driver, page_kind):
+    """
+    count the bytes the browser received since the previous call, for profiles that measure them
+    :param driver: 
+    :param page_kind: label of the counter, e.g. 'search', 'company' or 'search_clicks'
+    :return: number of bytes, None if not measured
+    """
+    profile = getattr(driver, 'profile', None)
+    if profile is None or not profile.measure_bytes:
+        return None
+    n_bytes = browser_profile.transferred_bytes(browser_profile.performance_events(driver))
+    metrics.inc('browser_bytes', n_bytes, page=page_kind)
+    metrics.inc('browser_pages', page=page_kind)
+    return n_bytes
+
+
+def load_url(driver=None, url=None, n_attempts_limit=3, quit_on_failure=True):
     """
     page loader with n_attempts
     :param driver: 
     :param url: 
     :param n_attempts_limit: 
+    :param quit_on_failure: set to False for pooled drivers, the pool decides what to do with them
     :return: 
     """
+    page_kind = 'search' if '/companies?' in url else 'company'
+    browser_profile.drain_performance_log(driver)  # whatever the session loaded before this page
     n_attempts = 0
     page_loaded = False
     while n_attempts < n_attempts_limit and not page_loaded:
         try:
-            driver.get(url)
+            throttle()
+            t0 = time.time()
+            with metrics.timer('page_load'):
+                driver.get(url)
+            pacer.success(time.time() - t0, kind='page')
             page_loaded = True
+            n_bytes = record_transferred_bytes(driver, page_kind)
             log_time()
-            print('page loaded successfully: {}'.format(url))
+            if n_bytes is None:
+                print('page loaded successfully: {}'.format(url))
+            else:
+                print('page loaded successfully ({:.1f} KB): {}'.format(n_bytes / 1024., url))
         except TimeoutException:
             n_attempts += 1
             log_time('error')
             print('loading page timeout', url, 'attempt {}'.format(n_attempts))
-            set_pause(1)
+            pacer.failure('timeout')
         except:
             n_attempts += 1
             log_time('error')
             print('loading page unknown error', url, 'attempt {}'.format(n_attempts))
-            set_pause(1)
+            pacer.failure('page_load')
 
     if n_attempts == n_attempts_limit:
-        driver.quit()
+        if quit_on_failure:
+            driver.quit()
         log_time('error')
         print('loading page failed after {} attempts, now give up:'.format(n_attempts_limit), url)
         return False
@@ -136,7 +197,16 @@ class AngelScraper:
                  skip_stage_filter=False,
                  skip_signal_filter=False,
                  skip_featured_filter=False,
-                 market_label_file='market_labels.txt'
+                 market_label_file='market_labels.txt',
+                 driver_pool_size=2,
+                 driver_max_uses=50,
+                 driver_profile='lean',
+                 count_cache_ttl=3 * 24 * 3600,
+                 min_request_rate=0.02,
+                 max_request_rate=1.,
+                 working_dir=None,
+                 output_dir=None,
+                 worker=None  # name of the worker process in a sharded crawl, e.g. 'w0'
                  ):
 
         self.root_url = 'https://angel.co/companies?'
@@ -161,29 +231,98 @@ class AngelScraper:
         self.signal_filters = ['']
         self.featured_filters = ['']
 
-        # specifying a set of folders
-        self.working_dir = '/Users/dingran/github/angellist-webscrape'
-        self.code_dir = os.path.join(self.working_dir, 'code')
-
-        self.output_dir = os.path.join(self.working_dir, 'output')
-        self.url_list_folder = os.path.join(self.output_dir, 'url_lists')
-        self.results_folder = os.path.join(self.output_dir, 'results')
-        self.company_page_folder = os.path.join(self.output_dir, 'company_pages')
-        self.index_page_folder = os.path.join(self.output_dir, 'index_pages')
-        self.market_label_size_file_dir = os.path.join(self.output_dir, 'market_label_size')
-        self.debug_dir = os.path.join(self.output_dir, 'debug')
-
-        for d in [self.output_dir, self.url_list_folder, self.results_folder, self.company_page_folder,
-                  self.index_page_folder, self.market_label_size_file_dir, self.debug_dir]:
-            if not os.path.exists(d):
-                os.makedirs(d)
+        # specifying a set of folders, see paths.ScraperPaths
+        self.paths = paths.ScraperPaths(working_dir, output_dir)
+        self.working_dir = self.paths.working_dir
+        self.code_dir = self.paths.code_dir
+        self.output_dir = self.paths.output_dir
+        self.url_list_folder = self.paths.url_list_folder
+        self.results_folder = self.paths.results_folder
+        self.company_page_folder = self.paths.company_page_folder
+        self.index_page_folder = self.paths.index_page_folder
+        self.market_label_size_file_dir = self.paths.market_label_size_file_dir
+        self.debug_dir = self.paths.debug_dir
+        self.metrics_dir = self.paths.metrics_dir
+        self.paths.makedirs()
+
+        # stage timings and counters of this run, every observation goes to the event log as a json line
+        # the totals are written as json lines and prometheus text on close
+        # workers of a sharded crawl start within the same second, the worker name or pid keeps their files apart
+        self.worker = worker
+        self.run_id = '{}_{}'.format(datetime.datetime.now().strftime('%Y%m%d_%H%M%S'), worker or os.getpid())
+        metrics.REGISTRY.open_event_log(os.path.join(self.metrics_dir, 'events_{}.jsonl'.format(self.run_id)))
+
+        # company counts of search pages, fresh entries are not probed again
+        self.count_cache = count_cache.CountCache(self.paths.state_file('count_cache'),
+                                                  ttl=count_cache_ttl)
+        self.last_probe_cached = False
+
+        # compressed, deduplicated archive of company and index pages
+        self.page_store = page_store.PageStore(self.paths.page_store_dir)
+
+        # companies already crawled under any query, their cached details are reused instead of re-parsed
+        self.seen_index = seen_index.SeenIndex(self.paths.state_file('seen_companies'))
+
+        # per company revisit schedule, adapts to how often each page actually changes
+        self.recrawl_scheduler = recrawl_scheduler.RecrawlScheduler(self.paths.state_file('recrawl_schedule'))
+
+        # yield of every sort pass, decides the order of the sort passes and ends passes returning known companies
+        self.sort_planner = sort_planner.SortPassPlanner(self.paths.state_file('sort_planner'))
+
+        # typed results, appended per click to a parquet dataset partitioned by crawl date and query
+        # when the dataset is written, the per row .txt records next to the company pages are skipped
+        self.result_dataset_dir = self.paths.result_dataset_dir
+        if result_store.pa is not None:
+            self.result_sink = result_store.ParquetResultSink(self.result_dataset_dir)
+        else:
+            self.result_sink = None
 
         # settings
         self.parser = 'lxml'
+        # 'lxml' for compiled xpath selectors, 'bs4' for BeautifulSoup, 'js' to read the new rows in the browser
+        # without transferring the page source on every click
+        self.row_extraction = 'lxml'
+        self.verify_js_rows = True  # with 'js', check the rows of every sort pass against BeautifulSoup
+        # 'click' loads every batch of rows by clicking "more", 'replay' captures the request of the first click
+        # from the browser network log and fetches the remaining batches over http, the browser is released
+        # after the first click; needs a profile logging network events (the lean one) and html row extraction
+        self.pagination = 'click'
+        self.replay_page_size = 100  # rows per replayed request, when the request has a page size parameter
         self.visit_inner = True  # inner pages are comapny detail pages
-        self.inner_page_redownload = False  # if inn
+        self.inner_page_redownload = False  # if True, refresh every company page, otherwise only those due
 
         self.mute_display = False
+        # requests per second of this process adapt between min_request_rate and max_request_rate
+        self.pacer = pacer
+        self.pacer.set_limits(min_request_rate, max_request_rate)
+        self.row_wait_timeout = 5.  # seconds to wait for new rows after a click on "more"
+
+        # browser launch settings: 'lean' runs headless, returns at DOMContentLoaded and blocks images, fonts,
+        # media and third party trackers, 'default' is a visible browser loading everything
+        if driver_profile == 'lean':
+            self.driver_profile = browser_profile.lean_profile(os.path.join(self.output_dir, 'browser_profile'))
+        elif driver_profile == 'default':
+            self.driver_profile = browser_profile.default_profile()
+        else:
+            self.driver_profile = driver_profile  # a browser_profile.BrowserProfile
+
+        # long-lived browser sessions shared by index pages, count probes and inner pages
+        self.driver_pool = driver_pool.DriverPool(size=driver_pool_size, max_uses=driver_max_uses,
+                                                  profile=self.driver_profile)
+
+        # fetch backend per page type: 'http' or 'selenium', anything other than selenium falls back to it
+        # when the page comes back without the expected content
+        # index pages are always loaded with selenium since the "more" button has to be clicked
+        self.fetch_backend_config = dict(count='selenium', company='http')
+        self.fetch_validators = dict(count=lambda page: fetch_backends.page_has_class(page, 'count'),
+                                     company=lambda page: fetch_backends.page_has_class(page, 'product_desc'))
+        self.fetch_backends = dict(selenium=fetch_backends.SeleniumBackend(self.driver_pool))
+
+        # company pages are fetched concurrently per batch of rows, the budget only caps how many are in flight:
+        # their rate is set by the pacer, which every fetch backend waits for, like any other request
+        self.company_page_budget = company_crawler.PolitenessBudget(requests_per_second=None,
+                                                                    max_in_flight=2,
+                                                                    jitter_seconds=0.)
 
         # markets filters
         if market_label_file is None:
@@ -227,7 +366,7 @@ class AngelScraper:
         # raised money
         raised_pair_list = [(0, 1),
                             (1, 400000),
-                            (400000, 10000000),
+                            (400000, 1000000),
                             (1000000, 1500000),
                             (1500000, 2000000),
                             (2000000, 2500000),
@@ -269,28 +408,72 @@ class AngelScraper:
             self.stage_filters.insert(0, '')
 
         self.url_df = None
-        self.search_page_url_list_file = os.path.join(self.url_list_folder,
-                                                      'url_list_{}.csv'.format(datetime.date.today()))
+        self.search_page_url_list_file = self.paths.url_list_file()
+
+    def canonical_url(self, url):
+        return search_query.canonical_url(url, self.root_url)
 
-    def generate_url_list_of_search_pages(self, use_existing_url_list=False):
+    def probe_company_count(self, target_url):
+        return self.get_company_count_on_search_page(target_url=target_url)
+
+    def generate_url_list_adaptive(self):
+        """
+        bisect the signal and raised ranges, then enumerate featured, stage, location and market filters,
+        only as deep as needed to get every query under the 400 companies limit
+        :return: list of url dicts
+        """
+        numeric_dims = []
+        if not self.skip_signal_filter:
+            numeric_dims.append(query_planner.NumericDimension('signal', 0, 10, min_width=0.1))
+        if not self.skip_raised_filter:
+            numeric_dims.append(query_planner.NumericDimension('raised', 0, 1000000000000000, min_width=50000,
+                                                               log_scale=True, integer=True))
+
+        categorical_dims = []
+        for name, filters in [('featured', self.featured_filters),
+                              ('stage', self.stage_filters),
+                              ('location', self.location_filters),
+                              ('market', self.market_filters)]:
+            values = [x for x in filters if x]
+            if values:
+                categorical_dims.append((name, values))
+
+        planner = query_planner.AdaptivePlanner(self.root_url, self.probe_company_count,
+                                                numeric_dims, categorical_dims)
+        url_list = planner.plan()
+        for x in url_list:
+            x['fname'] = self.url_to_base_fname(x['url'])
+        return url_list
+
+    def generate_url_list_of_search_pages(self, use_existing_url_list=False, adaptive=False):
         """
         Use filters to generaty urls of searches, append them to self.url_list
         :param use_existing_url_list: 
+        :param adaptive: use the recursive planner instead of the fixed nested filter loops
         :return: 
         """
 
         tmp_raised_filters = self.raised_filters
         tmp_stage_filters = self.stage_filters
 
-        if not use_existing_url_list:
+        if not use_existing_url_list and adaptive:
+            self.url_df = pd.DataFrame(self.generate_url_list_adaptive()).drop_duplicates(subset='url')
+
+            log_time()
+            print('Writing url list file: {}'.format(self.search_page_url_list_file))
+            self.url_df.to_csv(self.search_page_url_list_file)
+        elif not use_existing_url_list:
 
             url_list = []
             for mf in self.market_filters:
                 for ff in self.featured_filters:
                     for lf in self.location_filters:
                         for sf in self.signal_filters:
-                            target_url = self.root_url + mf + ff + lf + sf[0]
+                            target_url = self.canonical_url(self.root_url + mf + ff + lf + sf[0])
                             company_count = self.get_company_count_on_search_page(target_url=target_url)
+                            if company_count is None:
+                                self.skip_failed_probe(target_url)
+                                continue
                             if company_count > 0:
                                 url_list.append(dict(url=target_url,
                                                      fname=self.url_to_base_fname(target_url),
@@ -301,23 +484,17 @@ class AngelScraper:
                                 log_time()
                                 print('empty list, not adding to the url_list: {}'.format(target_url))
 
-                            if random.random() < .6:
-                                set_pause(2)
-                            elif random.random() < .95:
-                                set_pause(1)
-
                             if company_count > 400:
                                 # if number of companies too great, sub divide using stage and raised filter
                                 log_time()
                                 print('index page too long (>400), further dividing...')
 
                                 for tsf in tmp_stage_filters:
-                                    url_div1 = target_url + tsf
+                                    url_div1 = self.canonical_url(target_url + tsf)
                                     company_count_div1 = self.get_company_count_on_search_page(target_url=url_div1)
-                                    if random.random() < .6:
-                                        set_pause(2)
-                                    elif random.random() < .95:
-                                        set_pause(1)
+                                    if company_count_div1 is None:
+                                        self.skip_failed_probe(url_div1)
+                                        continue
                                     if company_count_div1 > 0:
                                         url_list.append(dict(url=url_div1,
                                                              fname=self.url_to_base_fname(url_div1),
@@ -333,13 +510,12 @@ class AngelScraper:
                                         print('index page still too long (>400), further further dividing...')
 
                                         for trf in tmp_raised_filters:
-                                            url_div1_div1 = url_div1 + trf
+                                            url_div1_div1 = self.canonical_url(url_div1 + trf)
                                             company_count_div1_div1 = self.get_company_count_on_search_page(
                                                 target_url=url_div1_div1)
-                                            if random.random() < .6:
-                                                set_pause(2)
-                                            elif random.random() < .95:
-                                                set_pause(1)
+                                            if company_count_div1_div1 is None:
+                                                self.skip_failed_probe(url_div1_div1)
+                                                continue
                                             if company_count_div1_div1 > 0:
                                                 url_list.append(dict(url=url_div1_div1,
                                                                      fname=self.url_to_base_fname(url_div1_div1),
@@ -352,12 +528,11 @@ class AngelScraper:
                                                     'empty list, not adding to the url_list: {}'.format(url_div1_div1))
 
                                 for trf in tmp_raised_filters:
-                                    url_div2 = target_url + trf
+                                    url_div2 = self.canonical_url(target_url + trf)
                                     company_count_div2 = self.get_company_count_on_search_page(target_url=url_div2)
-                                    if random.random() < .6:
-                                        set_pause(2)
-                                    elif random.random() < .95:
-                                        set_pause(1)
+                                    if company_count_div2 is None:
+                                        self.skip_failed_probe(url_div2)
+                                        continue
                                     if company_count_div2 > 0:
                                         url_list.append(dict(url=url_div2,
                                                              fname=self.url_to_base_fname(url_div2),
@@ -368,7 +543,9 @@ class AngelScraper:
                                         log_time()
                                         print('empty list, not adding to the url_list: {}'.format(url_div2))
 
-            self.url_df = pd.DataFrame(url_list).drop_duplicates()
+            # the '' stage and raised filters give back the parent query, and the raised split of a query appears
+            # both under its '' stage split and directly, one row per canonical url is enough
+            self.url_df = pd.DataFrame(url_list).drop_duplicates(subset='url')
 
             log_time()
             print('Writing url list file: {}'.format(self.search_page_url_list_file))
@@ -377,18 +554,103 @@ class AngelScraper:
             log_time()
             print('Reading url list file: {}'.format(self.search_page_url_list_file))
             self.url_df = pd.read_csv(self.search_page_url_list_file)
+            # lists written before the urls were canonical hold several spellings of the same query
+            self.url_df['url'] = self.url_df['url'].map(self.canonical_url)
+            self.url_df['fname'] = self.url_df['url'].map(self.url_to_base_fname)
+            self.url_df = self.url_df.drop_duplicates(subset='url')
 
         log_time()
         print('Length of url_list: {}'.format(len(self.url_df)))
 
+    def skip_failed_probe(self, url):
+        """
+        a search page that could not be loaded has no count, it is left out of the url list rather than guessed,
+        the next plan probes it again once the failure has expired from the count cache
+        :param url: 
+        """
+        metrics.inc('count_probes_skipped')
+        log_time('error')
+        print('count probe failed, not adding to the url_list: {}'.format(url))
+
     def url_to_base_fname(self, url):
         """
         translate search page url to filename in a consiste manner
         :param url: 
         :return: 
         """
-        fname = 'results_' + url.replace(self.root_url, '').replace('&', '_') + '.csv'
-        return fname
+        return search_query.base_fname(url)
+
+    def get_fetch_backend(self, name):
+        if name not in self.fetch_backends:
+            if name == 'http':
+                try:
+                    self.fetch_backends[name] = fetch_backends.HttpBackend()
+                except ImportError:
+                    log_time('error')
+                    print('http backend not available, using selenium instead')
+                    self.fetch_backends[name] = self.fetch_backends['selenium']
+            else:
+                assert False, 'unknown fetch backend: {}'.format(name)
+        return self.fetch_backends[name]
+
+    def fetch_page(self, page_type, url, keep_invalid=False):
+        """
+        fetch a page with the backend configured for page_type, falling back to selenium
+        :param page_type: 'count' or 'company'
+        :param url: 
+        :param keep_invalid: return the last page fetched when none has the expected content
+        :return: page source or None
+        """
+        backend = self.get_fetch_backend(self.fetch_backend_config.get(page_type, 'selenium'))
+        backends = [backend]
+        if backend is not self.fetch_backends['selenium']:
+            backends.append(self.fetch_backends['selenium'])
+        return fetch_backends.fetch_page(url, backends, is_valid=self.fetch_validators.get(page_type),
+                                         keep_invalid=keep_invalid)
+
+    def company_page_filename(self, inner_url):
+        return os.path.join(self.company_page_folder, inner_url.replace('/', ']]]') + '.html')
+
+    def company_page_due(self, inner_url):
+        return (self.inner_page_redownload or not self.page_store.has(inner_url)
+                or self.recrawl_scheduler.is_due(inner_url))
+
+    def fetch_company_page(self, inner_url):
+        """
+        fetch a company page, with a conditional request when the backend supports it and the page is archived
+        :param inner_url: 
+        :return: page source or None, for a 304 the archived page is returned
+        """
+        backend = self.get_fetch_backend(self.fetch_backend_config.get('company', 'selenium'))
+        if hasattr(backend, 'fetch_if_modified'):
+            archived = self.page_store.has(inner_url)
+            validators = self.recrawl_scheduler.validators(inner_url) if archived else None
+            page, not_modified, etag, last_modified = backend.fetch_if_modified(inner_url, validators)
+            if not_modified:
+                # the archived copy is parsed again and recorded as unchanged
+                self.recrawl_scheduler.not_modified()
+                return self.page_store.get(inner_url)
+            if page is not None:
+                self.recrawl_scheduler.set_validators(inner_url, etag, last_modified)
+                if self.fetch_validators['company'](page):
+                    return page
+            log_time('error')
+            print('{} backend did not return the expected page, falling back to selenium: {}'.format(
+                backend.name, inner_url))
+            return fetch_backends.fetch_page(inner_url, [self.fetch_backends['selenium']])
+        return self.fetch_page('company', inner_url)
+
+    def prefetch_company_pages(self, inner_urls):
+        """
+        concurrently download the company pages of a batch of rows
+        :param inner_urls: 
+        :return: dict of url -> page source for the pages downloaded
+        """
+        return company_crawler.crawl_company_pages(
+            inner_urls,
+            fetch=self.fetch_company_page,
+            save=lambda url, page: self.page_store.put(url, page),
+            budget=self.company_page_budget)
 
     def get_company_count_on_search_page(self, driver_in=None, target_url=None):
         """
@@ -397,43 +659,60 @@ class AngelScraper:
         :param target_url: 
         :return: 
         """
+        target_url = self.canonical_url(target_url)
         log_time('highlight')
         print('*** New search, target_url: {}'.format(target_url))
         sys.stdout.flush()
 
+        self.last_probe_cached, company_count = self.count_cache.get(target_url)
+        if self.last_probe_cached:
+            log_time('highlight')
+            print('*** cached count: {} companies'.format(company_count))
+            return company_count
+
         if driver_in is None:
-            driver = init_driver()
+            # a page without the count is parsed anyway, so that it takes the failure path below
+            page = self.fetch_page('count', target_url, keep_invalid=True)
+            if page is None:
+                self.count_cache.put(target_url, None, ok=False)
+                return None
         else:
-            driver = driver_in
-
-        if not load_url(driver, target_url):
-            return None
+            if not load_url(driver_in, target_url):
+                self.count_cache.put(target_url, None, ok=False)
+                return None
+            page = driver_in.page_source
 
-        page = driver.page_source
-        if driver_in is None:
-            quit_driver(driver)
-        soup = BeautifulSoup(page, self.parser)
+        with metrics.timer('parse_count'):
+            soup = BeautifulSoup(page, self.parser)
         parser_count = re.compile(r'([\d,]+)')
         try:
             company_count = soup.select('div.top div.count')[0].get_text().replace(',', '')
             company_count = int(parser_count.search(company_count).group(1))
         except:
+            metrics.error('parse_count', kind='count_not_found')
+            pacer.failure('count_parse')  # blocked or throttled pages come back without the count
             failed_case_fname = os.path.join(self.debug_dir,
                                              'failed_{}.html'.format(str(datetime.datetime.now())))
             log_time('error')
             print('failed to get company count page, saving page as {}'.format(failed_case_fname))
-            with open(failed_case_fname, 'w') as failed_f:
-                failed_f.write(page.encode('utf-8'))
+            with open(failed_case_fname, 'w', encoding='utf-8') as failed_f:
+                failed_f.write(page)
 
             company_count = 0
+            self.count_cache.put(target_url, company_count, ok=False)
+        else:
+            self.count_cache.put(target_url, company_count)
 
         log_time('highlight')
         print('*** found {} companies'.format(company_count))
 
         return company_count
 
-    def parse_all_search_pages(self, use_file=None):
-        if use_file is None:  # then use self.url_df
+    def parse_all_search_pages(self, use_file=None, use_frontier=False):
+        if use_frontier:
+            # durable job queue, resumes exactly where a killed run stopped and can be shared by several workers
+            self.crawl_frontier(self.open_frontier(enqueue=True))
+        elif use_file is None:  # then use self.url_df
             self.url_df = self.url_df.iloc[np.random.permutation(len(self.url_df))]
             # shuffle to help resuming at random entry point
             for idx, row in self.url_df.iterrows():
@@ -441,29 +720,142 @@ class AngelScraper:
         else:
             assert 0
 
+    def open_frontier(self, enqueue=False):
+        """
+        open the job queue of today's url list
+        :param enqueue: add a job for every (url, sort key) of self.url_df that is not queued yet
+        :return: 
+        """
+        fr = frontier.Frontier(self.search_page_url_list_file.replace('.csv', '_frontier.sqlite'))
+        if enqueue:
+            n_new = fr.add_jobs((row for _, row in self.url_df.iterrows()), self.get_click_sort_list)
+            log_time()
+            print('{} new jobs in frontier'.format(n_new))
+        return fr
+
+    def crawl_frontier(self, fr, worker_id=None, poll_seconds=60):
+        """
+        lease and run sort passes until the frontier is drained
+        :param fr: frontier.Frontier
+        :param worker_id: defaults to hostname-pid
+        :param poll_seconds: how often to look again while the only jobs left are leased by someone else
+        :return: 
+        """
+        global lease_heartbeat
+        if worker_id is None:
+            worker_id = frontier.default_worker_id()
+        # a single wait of a backed off pacer stays well within the lease
+        pacer.max_wait = fr.lease_seconds / 3.
+
+        while True:
+            job = fr.lease(worker_id)
+            if job is None:
+                # jobs still leased by other workers, or by an earlier run that died, are not done yet:
+                # wait until they complete or their lease expires and they can be taken over
+                n_leased, wait = fr.leased_elsewhere()
+                if not n_leased:
+                    break
+                log_time('info')
+                print('{} jobs leased by other workers, next lease expires in {:.0f}s'.format(n_leased, wait))
+                time.sleep(min(wait + 1, poll_seconds))
+                continue
+            job_id, url_dict, click_sort = job
+            log_time('highlight')
+            print('worker {} leased job {}: {} sort={}'.format(worker_id, job_id, url_dict['url'], click_sort))
+            heartbeat = lambda: fr.heartbeat(job_id, worker_id)
+            # clicks send a heartbeat each, the requests in between renew the lease while they wait for the pacer
+            lease_heartbeat = heartbeat
+            try:
+                ok = self.parse_one_sort_pass(url_dict, click_sort, heartbeat=heartbeat)
+            except Exception as e:
+                log_time('error')
+                print('job {} failed: {!r}'.format(job_id, e))
+                fr.fail(job_id, worker_id, error=repr(e))
+                continue
+            finally:
+                lease_heartbeat = None
+            if ok is None:
+                continue  # the lease was lost, the job belongs to another worker now
+            if ok:
+                fr.complete(job_id, worker_id)
+            else:
+                fr.fail(job_id, worker_id, error='page could not be parsed')
+
+        fr.report()
+
+    def get_click_sort_list(self, company_count):
+        if company_count > 400:
+            # using several clicks to get more companies, the follow-up sorts in the order of their yield so far
+            return self.sort_planner.order(['signal', 'joined', 'raised'])
+        return ['signal']
+
+    def query_cost(self, url_dict):
+        """
+        clicks a crawl of the query is expected to take, over all its sort passes
+        """
+        n_passes = len(self.get_click_sort_list(url_dict['company_count']))
+        return n_passes * (min(url_dict['company_count'], 400) / 20. + 2)
+
+    def select_covering_queries(self, target_coverage=1., min_new=1):
+        """
+        drop the queries of self.url_df whose companies other queries also return, as seen in earlier crawls,
+        and rewrite the url list; queries without a crawl so far are all kept
+        :param target_coverage: share of the companies collected so far the remaining queries must still return
+        :param min_new: queries adding fewer companies than this to the cover are dropped
+        """
+        url_dicts = [row.to_dict() for _, row in self.url_df.iterrows()]
+        selected, summary = query_planner.greedy_query_cover(url_dicts, self.sort_planner.links_by_url(),
+                                                             cost_fn=self.query_cost,
+                                                             target_coverage=target_coverage, min_new=min_new)
+        self.url_df = pd.DataFrame(selected, columns=self.url_df.columns)
+
+        log_time()
+        print('query cover: {n_selected} of {n_queries} queries kept ({n_unobserved} not crawled yet), '
+              '{n_covered}/{n_companies} known companies covered, '
+              'expected clicks on crawled queries {cost_observed:.0f} -> {cost_selected:.0f}'.format(**summary))
+        metrics.set_gauge('cover_queries', summary['n_selected'])
+        print('Writing url list file: {}'.format(self.search_page_url_list_file))
+        self.url_df.to_csv(self.search_page_url_list_file)
+        return summary
+
     def parse_one_search_page(self, url_dict=None):
         assert url_dict is not None
 
         log_time('highlight')
         print('parsing single page')
         print(url_dict)
+
+        for click_sort in self.get_click_sort_list(url_dict['company_count']):
+            self.parse_one_sort_pass(url_dict, click_sort)
+
+    def parse_one_sort_pass(self, url_dict, click_sort, heartbeat=None):
+        """
+        load a search page, apply one sort order and click through "more" until the rows are exhausted
+        :param url_dict: row of self.url_df
+        :param click_sort: 'signal', 'joined' or 'raised'
+        :param heartbeat: optional callable, called once per click and before the pass file is written to signal
+            progress, the pass is abandoned and its rows dropped when it returns False
+        :return: False if the page could not be parsed at all or the replayed pagination failed before the last
+            page, None if the pass was abandoned
+        """
         url = url_dict['url']
-        result_fname_tempalte = os.path.join(self.results_folder, url_dict['fname']).replace('.csv',
-                                                                                             '_sort=<sort_key>_click={'
-                                                                                             '}.csv')
+        result_fname = os.path.join(self.results_folder, url_dict['fname']).replace(
+            '.csv', '_sort={}.csv'.format(click_sort))
         company_count = url_dict['company_count']
         signal_score = url_dict['signal']
         featured = url_dict['featured']
 
-        if company_count > 400:
-            click_sort_list = ['signal', 'joined', 'raised']  # using several clicks to get more companies
-        else:
-            click_sort_list = ['signal']
-
-        for click_sort in click_sort_list:
-            result_fname = result_fname_tempalte.replace('<sort_key>', click_sort)
-            driver = init_driver()
-            load_url(driver=driver, url=url)
+        driver = self.driver_pool.checkout()
+        csv_sink = None
+        dataset_writer = None
+        pager = None
+        broken = False
+        lease_lost = False
+        truncated = False  # the rows of a pass that could not reach its last page are dropped with the lease
+        # the driver, the pass file and the replay session are given back however the pass ends, a crawl of
+        # the frontier carries on with the next job and must not find the pool drained
+        try:
+            load_url(driver=driver, url=url, quit_on_failure=False)
 
             N_click_max = company_count / 20 + 2
             N_click = 1
@@ -473,7 +865,8 @@ class AngelScraper:
             more_button = None
             if company_count > 0:
                 try:
-                    more_button = driver.wait.until(ec.element_to_be_clickable((By.CLASS_NAME, 'more')))
+                    with metrics.timer('ready_wait'):
+                        more_button = driver.wait.until(ec.element_to_be_clickable((By.CLASS_NAME, 'more')))
                 except TimeoutException:
                     last_page_flag = True
                     log_time('error')
@@ -492,202 +885,339 @@ class AngelScraper:
                         log_time('error')
                         print('failed to click click_sort={} at {}'.format(click_sort, url))
 
-                page = driver.page_source
-                soup = BeautifulSoup(page, self.parser)
+                if self.row_extraction == 'js':
+                    page = None
+                    results = browser_rows.BrowserRowExtractor(driver)
+                else:
+                    with metrics.timer('page_source'):
+                        page = driver.page_source
+                    # the page before any click is all a query of up to 20 companies has, the reparse needs it
+                    with metrics.timer('archive_write'):
+                        self.page_store.put(page_store.index_page_key(url, click_sort, N_click, self.run_id), page,
+                                            kind='index')
+                    results = row_extractor.IncrementalRowExtractor(method=self.row_extraction, parser=self.parser)
 
                 try:
-                    results = soup(class_='results')[0]('div', attrs={'data-_tn': 'companies/row'})
-                    N_rows_new = len(results)
+                    with metrics.timer('parse_rows'):
+                        N_rows_new = results.update(page)
                 except:
+                    if page is None:
+                        page = driver.page_source
                     failed_case_fname = os.path.join(self.debug_dir,
                                                      'failed_{}.html'.format(str(datetime.datetime.now())))
                     log_time('error')
                     print('failed to get results from page, saving page as {}'.format(failed_case_fname))
                     with open(failed_case_fname, 'w', encoding='utf-8') as failed_f:
-                        failed_f.write(page.encode('utf-8'))
-                    quit_driver(driver)
-                    set_pause(1)
-                    continue
+                        failed_f.write(page)
+                    broken = True
+                    return False
             else:
                 log_time('error')
                 print('empty search result with target_url=={}'.format(url))
-                quit_driver(driver)
-                set_pause(1)
-                continue
+                return True
 
-            entries = []
+            # rows are appended to the file of the pass click by click, only the rows of the current click are held
+            csv_sink = result_store.CsvResultSink(result_fname)
+            if self.result_sink is not None:
+                dataset_writer = self.result_sink.open_pass(url, click_sort)
+            pass_peak_mb = metrics.current_rss_mb()
+            sort_pass = self.sort_planner.start_pass(url, click_sort)
 
             while N_click < N_click_max:
-                output_fname = result_fname.format(N_click)
+                if heartbeat is not None and not heartbeat():
+                    lease_lost = True
+                    self.abandon_pass(url, click_sort, N_click)
+                    return None
                 start_row = N_rows
                 N_rows = N_rows_new
-
-                if os.path.exists(output_fname):
-                    log_time('overwrite')
-                    print(output_fname, 'exsits, skipping')
+                entries = []
+
+                links = [results.al_link(i) for i in range(start_row, N_rows)]
+                sort_pass.record(links)
+
+                # companies seen under another query or sort pass get their cached details attached directly
+                # pages not archived yet or due for a revisit are downloaded
+                known_details = dict()
+                to_fetch = []
+                for link in links:
+                    if self.company_page_due(link):
+                        to_fetch.append(link)
+                    else:
+                        details = self.seen_index.lookup(link)
+                        if details is not None:
+                            known_details[link] = details
+
+                if self.visit_inner:
+                    with metrics.timer('company_pages'):
+                        prefetched = self.prefetch_company_pages(to_fetch)
+                    metrics.inc('company_pages_fetched', len(prefetched))
                 else:
-                    for i in range(start_row, N_rows):
-                        entry = dict()
-                        a = results[i]
-                        title = a.select('a.startup-link')[0]['title']
-                        title = title.encode('ascii', errors='replace')
-                        entry['featured'] = featured
-                        entry['score'] = signal_score
-                        entry['title'] = title
-                        print(datetime.datetime.now(),
-                              'N_click = {}, row = {}/{}, {}'.format(N_click, i, N_rows - 1, title))
-
-                        inner_url = a.select('a.startup-link')[0]['href']
-                        entry['al_link'] = inner_url
-                        entry['signal'] = a.select('div.column.signal')[0]('img')[0]['alt']
-
-                        date_obj = a.select('div.column.joined > div.value')
-                        if date_obj:
-                            date_str = date_obj[0].get_text().encode('ascii', errors='replace')
-                            # print(date_str)
-                            date_str = date_str.decode('utf-8').strip().replace('?', '')
-                            entry['joined_date'] = datetime.datetime.strptime(date_str, '%b %y')
-                        else:
-                            entry['joined_date'] = None
-
-                        location_obj = a.select('div.column.location div.tag')
-                        if location_obj:
-                            entry['location'] = location_obj[0].get_text().strip()
-
-                        market_obj = a.select('div.column.market div.tag')
-                        if market_obj:
-                            entry['market'] = market_obj[0].get_text().strip()
-
-                        try:
-                            entry['website'] = a.select('div.column.website a')[0]['href']
-                        except:
-                            pass
-
-                        entry['size'] = a.select('div.column.company_size div.value')[0].get_text().strip()
-                        entry['stage'] = a.select('div.column.stage div.value')[0].get_text().strip()
-                        money = a.select('div.column.raised div.value')[0].get_text().strip()
-                        money = re.sub(r'[^\d.]', '', money)
-                        if money:
-                            entry['raised'] = float(money)
-
-                        inner_page_filename = os.path.join(self.company_page_folder,
-                                                           inner_url.replace('/', ']]]') + '.html')
-                        if self.visit_inner:
-                            inner_page = None
-
-                            if (not self.inner_page_redownload) and os.path.exists(inner_page_filename):
+                    prefetched = dict()
+
+                for i in range(start_row, N_rows):
+                    with metrics.timer('extract_row'):
+                        entry = results.extract(i, featured=featured, signal_score=signal_score)
+                    print(datetime.datetime.now(),
+                          'N_click = {}, row = {}/{}, {}'.format(N_click, i, N_rows - 1, entry['title']))
+                    inner_url = entry['al_link']
+
+                    if inner_url in known_details:
+                        entry.update(known_details[inner_url])
+                        entries.append(entry)
+                        continue
+
+                    inner_page_filename = self.company_page_filename(inner_url)
+                    if self.visit_inner:
+                        inner_page = prefetched.get(inner_url)
+
+                        if inner_page is None:
+                            if (not self.inner_page_redownload) and self.page_store.has(inner_url):
                                 log_time('overwrite')
-                                print('{} exists, wont re-download'.format(inner_page_filename))
-                                with open(inner_page_filename, 'r') as fi:
-                                    inner_page = fi.read()
+                                print('{} exists, wont re-download'.format(inner_url))
+                                inner_page = self.page_store.get(inner_url)
                             else:
-                                inner_driver = init_driver()
-                                if load_url(driver=inner_driver, url=inner_url):
-
-                                    inner_page = inner_driver.page_source
-                                    inner_driver.quit()
-                                    with open(inner_page_filename, 'w', encoding='utf-8') as p:
-                                        if sys.version_info[0] == 3:
-                                            if isinstance(inner_page, bytes):
-                                                p.write(inner_page.decode('utf-8', 'replace'))
-                                            else:
-                                                p.write(inner_page)
-                                        else:
-                                            if isinstance(inner_page, unicode):
-                                                p.write(inner_page.encode('utf-8'))
-                                            else:
-                                                p.write(inner_page)
-
-                                    if random.random() < 0.1:
-                                        set_pause(3)
-                                    elif random.random() < .6:
-                                        set_pause(2)
-                                    elif random.random() < .95:
-                                        set_pause(1)
-
-                                else:
-                                    quit_driver(inner_driver)
-                                    continue
-
-                            if inner_page is not None:
-                                inner_soup = BeautifulSoup(inner_page, self.parser)
-                                try:
-                                    product_desc = inner_soup.select('div.product_desc div.content')[
-                                        0].get_text().strip()
-                                    # print product_desc
-                                    entry['product_desc'] = product_desc
-                                except:
-                                    log_time('error')
-                                    print('cannnot get product_desc')
-
+                                continue  # download failed
+
+                        if inner_page is not None:
+                            with metrics.timer('parse_details'):
+                                details = row_extractor.extract_details(inner_page)
+                            if 'product_desc' not in details:
+                                metrics.error('parse_details', kind='no_product_desc')
+                                log_time('error')
+                                print('cannnot get product_desc')
+                            entry.update(details)
+                            self.seen_index.add(inner_url, details)
+                            if inner_url in prefetched:
+                                self.recrawl_scheduler.record(inner_url, recrawl_scheduler.fingerprint(details))
+
+                    if self.result_sink is None:
                         with open(inner_page_filename.replace('.html', '.txt'), 'w') as f_record:
                             # print entry
                             f_record.write(str(entry))
 
-                        entries.append(entry)
+                    entries.append(entry)
+
+                log_time('write')
+                print('Writing {} rows to {}'.format(len(entries), result_fname))
+                with metrics.timer('write_results'):
+                    csv_sink.append(entries)
+                if dataset_writer is not None:
+                    with metrics.timer('write_dataset'):
+                        dataset_writer.append(entries, N_click)
+                metrics.inc('rows', N_rows - start_row)
+                if self.row_extraction != 'js':
+                    results.release(N_rows)  # the browser rows are kept for the final verification
+                pass_peak_mb = max(pass_peak_mb, metrics.current_rss_mb())
+
+                if sort_pass.should_stop():
+                    log_time('info')
+                    print('stopping sort={} after {} clicks, {:.0%} of the recent rows were new to the query'.format(
+                        click_sort, N_click, sort_pass.recent_yield()))
+                    break
 
-                    df_entries = pd.DataFrame(entries)
-                    log_time('write')
-                    print('Writing {}'.format(output_fname))
-                    df_entries.to_csv(output_fname, index=False, encoding='utf-8')
+                if last_page_flag:
+                    log_time('error')
+                    print('stopping')
+                    break
 
-                    if last_page_flag:
+                # the next batch waits for the pacer, in fetch_next or before the click
+                N_click += 1
+                metrics.inc('clicks')
+                if pager is not None:
+                    page = pager.fetch_next()
+                    if page is None:
+                        # the browser is gone and a fresh one would start over at the first batch, the pass is
+                        # reported as failed so that the frontier retries it rather than completing it short
                         log_time('error')
-                        print('stopping')
-                        set_pause(1)
-                        break
-
-                if random.random() < 0.01:
-                    set_pause(5)
-                elif random.random() < 0.05:
-                    set_pause(4)
-                elif random.random() < 0.1:
-                    set_pause(3)
-                elif random.random() < .9:
-                    set_pause(2)
-                else:
-                    set_pause(1)
+                        print('pagination replay failed before the last page, N_click = {}, {} rows'.format(
+                            N_click, N_rows - 1))
+                        metrics.error('replay_fetch', kind='truncated_pass')
+                        truncated = True
+                        return False
+                    with metrics.timer('archive_write'):
+                        self.page_store.put(page_store.index_page_key(url, click_sort, N_click, self.run_id), page,
+                                            kind='index')
+                    with metrics.timer('parse_rows'):
+                        N_rows_new = results.update(page)
+                    last_page_flag = pager.last_page
+                    continue
 
-                N_click += 1
                 try:
+                    throttle()
                     more_button.click()
-                except:
+                except Exception as e:
+                    metrics.error('click', e)
                     log_time('error')
                     print('more button not clickable, N_click = {}'.format(N_click))
-                    set_pause(1)
+                    pacer.failure('click')
                     break
 
-                page_loaded = False
-                N_tries = 0
-                while not page_loaded and N_tries < 10:
-                    N_tries += 1
-                    page = driver.page_source
-                    page_filename = os.path.join(self.index_page_folder,
-                                                 url.replace('/', ']]]') + '_click_{}.html'.format(
-                                                     N_click))
-                    with open(page_filename, 'w', encoding='utf-8') as p:
-                        if sys.version_info[0] == 3:
-                            if isinstance(page, bytes):
-                                p.write(page.decode('utf-8', 'replace'))
-                            else:
-                                p.write(page)
-                        else:
-                            if type(page) is unicode:
-                                p.write(page.encode('ascii', errors='ignore'))
-                            else:
-                                p.write(page)
-                    soup = BeautifulSoup(page, self.parser)
-                    results = soup(class_='results')[0]('div', attrs={'data-_tn': 'companies/row'})
-                    N_rows_new = len(results)
-                    if N_rows_new > N_rows:
-                        page_loaded = True
-
-                    time.sleep(0.5)
+                # the row count is watched inside the page, the page source is transferred once the rows are there
+                t0 = time.time()
+                with metrics.timer('row_wait'):
+                    n_rows_loaded = browser_rows.wait_for_row_growth(driver, N_rows, timeout=self.row_wait_timeout)
+                if n_rows_loaded > N_rows:
+                    pacer.success(time.time() - t0, kind='rows')
+                else:
+                    pacer.failure('row_timeout')
+                if self.row_extraction == 'js':
+                    with metrics.timer('parse_rows'):
+                        N_rows_new = results.update()
+                else:
+                    with metrics.timer('page_source'):
+                        page = driver.page_source
+                    with metrics.timer('archive_write'):
+                        self.page_store.put(page_store.index_page_key(url, click_sort, N_click, self.run_id), page,
+                                            kind='index')
+                    with metrics.timer('parse_rows'):
+                        N_rows_new = results.update(page)
+                if N_rows_new <= N_rows:
+                    metrics.error('row_wait', kind='no_new_rows')
                 try:
-                    more_button = driver.wait.until(ec.element_to_be_clickable((By.CLASS_NAME, 'more')))
+                    with metrics.timer('ready_wait'):
+                        more_button = driver.wait.until(ec.element_to_be_clickable((By.CLASS_NAME, 'more')))
                 except TimeoutException:
                     last_page_flag = True
                     log_time('error')
                     print('exhausted page length, with N_click == {}'.format(N_click))
 
-            quit_driver(driver)
+                if self.pagination == 'replay' and self.row_extraction != 'js' and not last_page_flag:
+                    pager = self.start_replay(driver, url, page, N_rows_new)
+                    if pager is not None:
+                        # selenium was only needed to bootstrap the session
+                        record_transferred_bytes(driver, 'search_clicks')
+                        self.driver_pool.checkin(driver)
+                        driver = None
+
+            # the pass file replaces the previous one only while the job is still ours, a lease that expired during
+            # the last click belongs to another worker, whose file must not be overwritten
+            if heartbeat is not None and not heartbeat():
+                lease_lost = True
+                self.abandon_pass(url, click_sort, N_click)
+                return None
+            csv_sink.close()
+            metrics.REGISTRY.record_memory('{} sort={}'.format(url, click_sort), pass_peak_mb)
+            log_time('highlight')
+            print(sort_pass.finish(company_count))
+
+            if pager is not None:
+                log_time('highlight')
+                print('pagination replay: {} requests, {:.1f} KB'.format(pager.n_requests, pager.n_bytes / 1024.))
+                return True
+
+            if self.row_extraction == 'js':
+                # the last snapshot holds every row of the pass, which is all the reparse needs
+                with metrics.timer('page_source'):
+                    page = driver.page_source
+                with metrics.timer('archive_write'):
+                    self.page_store.put(page_store.index_page_key(url, click_sort, N_click, self.run_id), page,
+                                        kind='index')
+                if self.verify_js_rows:
+                    self.verify_browser_rows(results, page, url, click_sort)
+
+            record_transferred_bytes(driver, 'search_clicks')
+            return True
+        except:
+            broken = True
+            raise
+        finally:
+            if csv_sink is not None:
+                csv_sink.close(keep=not (lease_lost or truncated))
+            if dataset_writer is not None:
+                dataset_writer.close(keep=not (lease_lost or truncated))
+            if pager is not None:
+                pager.close()
+            if driver is not None:
+                self.driver_pool.checkin(driver, broken=broken)
+
+    @staticmethod
+    def abandon_pass(url, click_sort, N_click):
+        log_time('error')
+        print('lease of {} sort={} lost after {} clicks, abandoning the pass'.format(url, click_sort, N_click))
+        metrics.error('lease', kind='lost')
+
+    def start_replay(self, driver, url, page, n_rows):
+        """
+        find the pagination request of the last click in the network log of driver and set up its replay
+        :param driver: 
+        :param url: search page url
+        :param page: page source after the click
+        :param n_rows: rows on page, header included
+        :return: pagination_replay.ReplayPager or None, in which case clicking goes on
+        """
+        events = browser_profile.performance_events(driver)
+        if getattr(driver, 'profile', None) is not None and driver.profile.measure_bytes:
+            metrics.inc('browser_bytes', browser_profile.transferred_bytes(events), page='search_clicks')
+        request = pagination_replay.find_pagination_request(events, url)
+        if request is None:
+            log_time('error')
+            print('no pagination request found in the network log, clicking on: {}'.format(url))
+            metrics.error('replay_capture', kind='no_request')
+            return None
+        try:
+            pager = pagination_replay.ReplayPager(request, page, n_rows, cookies=driver.get_cookies(),
+                                                  user_agent=driver.execute_script('return navigator.userAgent;'),
+                                                  referer=url, page_size=self.replay_page_size)
+        except ImportError as e:
+            log_time('error')
+            print('pagination replay not available ({}), clicking on'.format(e))
+            return None
+        log_time('info')
+        print('replaying pagination request: {} {}'.format(request['method'], request['url']))
+        return pager
+
+    def verify_browser_rows(self, results, page, url, click_sort):
+        """
+        compare the rows read in the browser with the BeautifulSoup reference path on the final snapshot
+        """
+        with metrics.timer('verify_rows'):
+            mismatches = browser_rows.compare_with_soup(results, page, parser=self.parser)
+        metrics.inc('verified_rows', len(results) - 1)
+        if mismatches:
+            metrics.inc('row_mismatches', len(mismatches))
+            log_time('error')
+            print('{} rows read in the browser differ from BeautifulSoup at {} sort={}, first: row {}: {} != {}'.format(
+                len(mismatches), url, click_sort, *mismatches[0]))
+        return not mismatches
+
+    def close(self):
+        """
+        shut down pooled browser sessions and report how many launches the pool saved
+        """
+        for backend in self.fetch_backends.values():
+            if hasattr(backend, 'close'):
+                backend.close()
+        self.driver_pool.close()
+        self.driver_pool.report()
+        log_time('highlight')
+        print(self.count_cache.report())
+        self.count_cache.close()
+        log_time('highlight')
+        print(self.recrawl_scheduler.report())
+        self.recrawl_scheduler.close()
+        log_time('highlight')
+        print(self.seen_index.report())
+        self.seen_index.close()
+        log_time('highlight')
+        print(self.page_store.report())
+        self.page_store.close()
+        log_time('highlight')
+        print(self.pacer.report())
+        log_time('highlight')
+        print(self.sort_planner.report())
+        self.sort_planner.close()
+        self.write_metrics()
+
+    def write_metrics(self):
+        """
+        print the run summary and export the stage timings of this run
+        """
+        metrics.REGISTRY.write_jsonl(os.path.join(self.metrics_dir, 'metrics_{}.jsonl'.format(self.run_id)))
+        if self.worker is None:
+            metrics.REGISTRY.write_prometheus(os.path.join(self.metrics_dir, 'angel_scraper.prom'))
+        else:
+            prom_file = os.path.join(self.metrics_dir, 'angel_scraper_{}.prom'.format(self.worker))
+            metrics.REGISTRY.write_prometheus(prom_file, labels=dict(worker=self.worker))
+        metrics.REGISTRY.close_event_log()
+        log_time('highlight')
+        print(metrics.REGISTRY.summary())
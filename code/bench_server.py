@@ -0,0 +1,263 @@
+from __future__ import print_function
+import json
+import time
+import random
+import datetime
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qsl
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qsl
+
+ROWS_PER_PAGE = 20
+# stand-ins for what a real page drags along: a signal image per row and a third party tracker
+SIGNAL_IMAGE = b'\x89PNG\r\n\x1a\n' + b'\x00' * 4096
+ANALYTICS_SCRIPT = '/* tracker */ var _q = [];' + ' ' * 50000
+# the tracker comes from a third party host, which benchmark browsers resolve to the stand-in, see TRACKER_HOST_RULES
+TRACKER_HOST = 'www.google-analytics.com'
+TRACKER_HOST_RULES = 'MAP {} 127.0.0.1'.format(TRACKER_HOST)
+STAGES = ['Series A', 'Series B', 'Acquired', 'Series C', 'Series D', 'Seed', 'IPO', '-']
+LOCATIONS = ['New York City', 'San Francisco', 'London', 'Berlin', 'Singapore', 'Austin']
+MARKETS = ['SaaS', 'E-Commerce', 'Big Data', 'Health Care', 'Education', 'Fintech']
+
+# the more button and the sort headers fetch the next rows as json, the way the live site loads them
+PAGE_SCRIPT = '''
+<script>
+(function () {
+  var page = 1, sort = 'signal';
+  var results = document.querySelector('div.results');
+  function load(replace) {
+    var x = new XMLHttpRequest();
+    var sep = location.search ? '&' : '?';
+    x.open('GET', '/companies/more' + location.search + sep + 'page=' + page + '&per_page=20&sort=' + sort);
+    x.setRequestHeader('X-Requested-With', 'XMLHttpRequest');
+    x.onload = function () {
+      var d = JSON.parse(x.responseText);
+      if (replace) {
+        var rows = results.querySelectorAll('div[data-_tn="companies/row"]');
+        for (var i = 1; i < rows.length; i++) { rows[i].parentNode.removeChild(rows[i]); }
+      }
+      results.insertAdjacentHTML('beforeend', d.html);
+      var more = document.querySelector('div.more');
+      if (more) { more.style.display = d.last_page ? 'none' : 'block'; }
+    };
+    x.send();
+  }
+  var more = document.querySelector('div.more');
+  if (more) { more.addEventListener('click', function () { page += 1; load(false); }); }
+  var headers = document.querySelectorAll('div.column.sortable');
+  for (var i = 0; i < headers.length; i++) {
+    headers[i].addEventListener('click', function () { sort = this.getAttribute('data-sort'); page = 1; load(true); });
+  }
+})();
+</script>
+'''
+
+
+def make_universe(n_companies=5000, seed=0):
+    rnd = random.Random(seed)
+    companies = []
+    for i in range(n_companies):
+        joined = datetime.date(2010, 1, 1) + datetime.timedelta(days=rnd.randint(0, 2500))
+        companies.append(dict(
+            slug='company-{}'.format(i),
+            title='Company {}'.format(i),
+            signal=round(rnd.random() * 10, 1),
+            raised=int(10 ** rnd.uniform(3, 9)) if rnd.random() < .6 else 0,
+            stage=rnd.choice(STAGES),
+            location=rnd.choice(LOCATIONS),
+            market=rnd.choice(MARKETS),
+            featured=rnd.random() < .1,
+            joined=joined,
+            size=rnd.choice(['1-10', '11-50', '51-200', '201-500']),
+            website='http://company{}.com'.format(i) if rnd.random() < .8 else None,
+            desc='Company {} builds {} software.'.format(i, rnd.choice(MARKETS).lower())))
+    return companies
+
+
+def filter_companies(companies, params):
+    def num(name, default):
+        for k, v in params:
+            if k == name:
+                return float(v)
+        return default
+
+    signal_min, signal_max = num('signal[min]', 0), num('signal[max]', 10)
+    raised_min, raised_max = num('raised[min]', 0), num('raised[max]', 1e18)
+    stages = [v.replace('+', ' ') for k, v in params if k == 'stage']
+    featured = any(k == 'featured' for k, v in params)
+    selected = []
+    for c in companies:
+        if not signal_min <= c['signal'] <= signal_max:
+            continue
+        if not raised_min <= c['raised'] <= raised_max:
+            continue
+        if stages and c['stage'] not in stages:
+            continue
+        if featured and not c['featured']:
+            continue
+        selected.append(c)
+    return selected
+
+
+def sort_companies(companies, sort_key):
+    if sort_key == 'joined':
+        return sorted(companies, key=lambda c: c['joined'], reverse=True)
+    if sort_key == 'raised':
+        return sorted(companies, key=lambda c: c['raised'], reverse=True)
+    return sorted(companies, key=lambda c: c['signal'], reverse=True)
+
+
+def render_row(c, base_url):
+    website = '<a href="{0}">{0}</a>'.format(c['website']) if c['website'] else ''
+    raised = '${:,}'.format(c['raised']) if c['raised'] else '-'
+    return ('<div class="base startup" data-_tn="companies/row">'
+            '<div class="column company_col"><a class="startup-link" href="{base}/{slug}" title="{title}">'
+            '{title}</a></div>'
+            '<div class="column signal"><img alt="{signal}" src="/signal.png"/></div>'
+            '<div class="column joined"><div class="value">{joined}</div></div>'
+            '<div class="column location"><div class="tag">{location}</div></div>'
+            '<div class="column market"><div class="tag">{market}</div></div>'
+            '<div class="column website">{website}</div>'
+            '<div class="column company_size"><div class="value">{size}</div></div>'
+            '<div class="column stage"><div class="value">{stage}</div></div>'
+            '<div class="column raised"><div class="value">{raised}</div></div>'
+            '</div>').format(base=base_url, slug=c['slug'], title=c['title'], signal=int(c['signal']),
+                             joined=c['joined'].strftime('%b %y'), location=c['location'], market=c['market'],
+                             website=website, size=c['size'], stage=c['stage'], raised=raised)
+
+
+def render_header_row():
+    return ('<div class="base header" data-_tn="companies/row">'
+            '<div class="column signal sortable" data-sort="signal">Signal</div>'
+            '<div class="column joined sortable" data-sort="joined">Joined</div>'
+            '<div class="column raised sortable" data-sort="raised">Raised</div>'
+            '</div>')
+
+
+def tracker_tag(base_url):
+    return '<script async src="http://{}:{}/analytics.js"></script>'.format(TRACKER_HOST, urlsplit(base_url).port)
+
+
+def render_search_page(companies, base_url, sort_key='signal'):
+    rows = sort_companies(companies, sort_key)[:ROWS_PER_PAGE]
+    more = '<div class="more">More</div>' if len(companies) > ROWS_PER_PAGE else ''
+    return ('<html><head><title>Startups</title>{tracker}</head><body>'
+            '<div class="top"><div class="count">{count:,} Companies</div></div>'
+            '<div class="results">{header}{rows}</div>{more}{script}</body></html>').format(
+        count=len(companies), header=render_header_row(), rows=''.join(render_row(c, base_url) for c in rows),
+        more=more, script=PAGE_SCRIPT, tracker=tracker_tag(base_url))
+
+
+def render_company_page(c, base_url):
+    return ('<html><head>{tracker}</head><body><h1>{title}</h1><div class="product_desc"><div class="content">'
+            '{desc}</div></div></body></html>').format(title=c['title'], desc=c['desc'],
+                                                       tracker=tracker_tag(base_url))
+
+
+class BenchServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, n_companies=5000, latency_ms=0., latency_jitter_ms=0., error_rate=0., seed=0,
+                 port=0, result_cap=400):
+        """
+        local stand-in for the companies search and company pages
+        :param n_companies: size of the synthetic universe
+        :param latency_ms: added to every response
+        :param latency_jitter_ms: uniform random extra latency
+        :param error_rate: fraction of requests answered with a 500
+        :param seed:
+        :param port: 0 picks a free port
+        :param result_cap: max companies a search pages through, like the live site
+        """
+        HTTPServer.__init__(self, ('127.0.0.1', port), BenchHandler)
+        self.companies = make_universe(n_companies, seed)
+        self.by_slug = dict((c['slug'], c) for c in self.companies)
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.result_cap = result_cap
+        self.rnd = random.Random(seed)
+        self.n_requests = 0
+        self.n_errors = 0
+        self.n_bytes = 0
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class BenchHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='text/html; charset=utf-8'):
+        data = body if isinstance(body, bytes) else body.encode('utf-8')
+        self.server.n_bytes += len(data)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        srv = self.server
+        srv.n_requests += 1
+        delay = srv.latency_ms + srv.rnd.random() * srv.latency_jitter_ms
+        if delay:
+            time.sleep(delay / 1000.)
+        if srv.rnd.random() < srv.error_rate:
+            srv.n_errors += 1
+            return self._send(500, 'injected error')
+
+        parts = urlsplit(self.path)
+        params = parse_qsl(parts.query)
+        if parts.path == '/companies':
+            companies = filter_companies(srv.companies, params)
+            return self._send(200, render_search_page(companies, srv.base_url))
+        if parts.path == '/companies/more':
+            companies = filter_companies(srv.companies, params)
+            page = int(dict(params).get('page', 1))
+            per_page = min(int(dict(params).get('per_page', ROWS_PER_PAGE)), 100)
+            sort_key = dict(params).get('sort', 'signal')
+            capped = sort_companies(companies, sort_key)[:srv.result_cap]
+            rows = capped[(page - 1) * per_page:page * per_page]
+            body = json.dumps(dict(html=''.join(render_row(c, srv.base_url) for c in rows), page=page,
+                                   last_page=page * per_page >= len(capped)))
+            return self._send(200, body, 'application/json')
+        if parts.path == '/signal.png':
+            return self._send(200, SIGNAL_IMAGE, 'image/png')
+        if parts.path == '/analytics.js':
+            return self._send(200, ANALYTICS_SCRIPT, 'application/javascript')
+        if parts.path.lstrip('/') in srv.by_slug:
+            return self._send(200, render_company_page(srv.by_slug[parts.path.lstrip('/')], srv.base_url))
+        return self._send(404, 'not found')
+
+
+if __name__ == '__main__':
+    server = BenchServer().start()
+    print('serving {} synthetic companies at {}/companies'.format(len(server.companies), server.base_url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
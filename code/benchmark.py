@@ -0,0 +1,391 @@
+from __future__ import print_function
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import datetime
+import tempfile
+import resource
+import subprocess
+import multiprocessing
+
+import pandas as pd
+
+import AngelScraper as AS
+import bench_server
+import row_extractor
+import company_crawler
+import metrics
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    rss = resource.getrusage(who).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss / 1024. / 1024.  # bytes on mac
+    return rss / 1024.  # kilobytes on linux
+
+
+def make_scraper(output_dir):
+    """
+    scraper writing to a scratch folder, with the politeness delays turned off
+    """
+    AS.pause_scale = 0.
+    a = AS.AngelScraper(output_dir=output_dir, count_cache_ttl=0)
+    # the third party tracker of the stand-in resolves to it as well, no request leaves the machine
+    a.driver_profile.host_resolver_rules = bench_server.TRACKER_HOST_RULES
+    a.company_page_budget = company_crawler.PolitenessBudget(requests_per_second=None, max_in_flight=8,
+                                                             jitter_seconds=0.)
+    return a
+
+
+def search_urls(base_url, n):
+    """
+    distinct search urls over the filters the stand-in server understands
+    """
+    urls = []
+    for featured in ['', '&featured=Featured']:
+        for stage in [''] + ['&stage={}'.format(x.replace(' ', '+')) for x in bench_server.STAGES[:-1]]:
+            for signal in range(10):
+                urls.append('{}/companies?signal[min]={}&signal[max]={}{}{}'.format(
+                    base_url, signal, signal + 1, stage, featured))
+    return urls[:n]
+
+
+def loaded_page(base_url, url, n_clicks, sort_key='signal'):
+    """
+    html of a search page after n_clicks on "more", the way page_source looks in the browser
+    :return: list of page sources, one per click
+    """
+    import requests
+    first = requests.get(url).text
+    pages = [first]
+    if '</div><div class="more">' not in first:
+        return pages
+    head, tail = first.split('</div><div class="more">', 1)
+    rows = ''
+    for page in range(2, n_clicks + 1):
+        d = requests.get(url.replace('/companies?', '/companies/more?') + '&page={}&sort={}'.format(
+            page, sort_key)).json()
+        rows += d['html']
+        pages.append(head + rows + '</div><div class="more">' + tail)
+        if d['last_page']:
+            break
+    return pages
+
+
+def scenario_count_probe(base_url, output_dir, n_pages):
+    """
+    get_company_count_on_search_page over distinct urls with the http backend, every probe misses the cache
+    """
+    a = make_scraper(output_dir)
+    a.fetch_backend_config['count'] = 'http'
+    urls = search_urls(base_url, n_pages)
+    n_failed = 0
+    t0 = time.time()
+    for url in urls:
+        try:
+            count = a.get_company_count_on_search_page(target_url=url)
+        except Exception:  # the selenium fallback cannot start without a browser
+            count = None
+        if count is None:
+            n_failed += 1
+    elapsed = time.time() - t0
+    a.close()
+    return dict(pages=len(urls), failed=n_failed, seconds=elapsed, pages_per_sec=len(urls) / elapsed)
+
+
+def scenario_row_parse(base_url, output_dir, n_pages, n_clicks=20):
+    """
+    incremental row extraction of pages growing click by click, lxml against BeautifulSoup
+    """
+    jobs = [loaded_page(base_url, url, n_clicks) for url in search_urls(base_url, n_pages)]
+    result = dict(pages=sum(len(x) for x in jobs))
+    for method in ['lxml', 'bs4']:
+        n_rows = 0
+        t0 = time.time()
+        for pages in jobs:
+            results = row_extractor.IncrementalRowExtractor(method=method)
+            start_row = 1
+            for page in pages:
+                n = results.update(page)
+                for i in range(start_row, n):
+                    results.extract(i)
+                n_rows += n - start_row
+                start_row = n
+        elapsed = time.time() - t0
+        result['rows'] = n_rows
+        result['{}_ms_per_row'.format(method)] = 1000. * elapsed / max(n_rows, 1)
+        result['{}_pages_per_sec'.format(method)] = result['pages'] / elapsed
+    return result
+
+
+def scenario_search_page(base_url, output_dir, n_pages):
+    """
+    parse_one_search_page end to end: browser, clicks on "more", company pages over http, result files
+    """
+    a = make_scraper(output_dir)
+    a.root_url = base_url + '/companies?'
+    try:
+        a.driver_pool.checkin(a.driver_pool.checkout())
+    except Exception as e:
+        a.close()
+        return dict(skipped='no browser available ({})'.format(type(e).__name__))
+
+    n_rows = 0
+    n_clicks = 0
+    t0 = time.time()
+    for url in search_urls(base_url, n_pages):
+        count = a.get_company_count_on_search_page(target_url=url)
+        url_dict = dict(url=url, fname=a.url_to_base_fname(url), company_count=count or 0, signal=None,
+                        featured='&featured=Featured' if 'featured' in url else '')
+        a.parse_one_search_page(url_dict=url_dict)
+        for sort_key in a.get_click_sort_list(url_dict['company_count']):
+            f = os.path.join(a.results_folder, url_dict['fname'].replace('.csv', '_sort={}.csv'.format(sort_key)))
+            if os.path.exists(f):
+                n_rows += len(pd.read_csv(f))
+                n_clicks += 1  # the initial load of the pass
+    n_clicks += sum(v for (name, _), v in metrics.REGISTRY.counters.items() if name == 'clicks')
+    elapsed = time.time() - t0
+    a.close()
+    return dict(pages=n_clicks, rows=n_rows, seconds=elapsed, pages_per_sec=n_clicks / elapsed,
+                ms_per_row=1000. * elapsed / max(n_rows, 1))
+
+
+def scenario_browser_profile(base_url, output_dir, n_pages):
+    """
+    bytes and load time per search and company page, default browser profile against the lean one
+    """
+    import browser_profile
+    urls = search_urls(base_url, n_pages)
+    urls += ['{}/company-{}'.format(base_url, i) for i in range(n_pages)]
+    result = dict(pages=len(urls))
+    for name, profile in [('default', browser_profile.default_profile()),
+                          ('lean', browser_profile.lean_profile(os.path.join(output_dir, 'browser_profile')))]:
+        profile.measure_bytes = True
+        profile.host_resolver_rules = bench_server.TRACKER_HOST_RULES
+        try:
+            dr = AS.init_driver(profile=profile)
+        except Exception as e:
+            return dict(skipped='no browser available ({})'.format(type(e).__name__))
+        n_bytes = 0
+        t0 = time.time()
+        for url in urls:
+            browser_profile.drain_performance_log(dr)
+            dr.get(url)
+            n_bytes += AS.record_transferred_bytes(dr, 'bench') or 0
+        elapsed = time.time() - t0
+        AS.quit_driver(dr)
+        result['{}_kb_per_page'.format(name)] = n_bytes / 1024. / len(urls)
+        result['{}_ms_per_page'.format(name)] = 1000. * elapsed / len(urls)
+    return result
+
+
+def scenario_pagination_replay(base_url, output_dir, n_pages, n_clicks=25):
+    """
+    replay of the pagination request against clicking through every batch, rows must come out identical
+    the captured request is built the way the devtools log reports the xhr of the stand-in's "more" button
+    """
+    import pagination_replay
+    n_click_requests = 0
+    n_replay_requests = 0
+    n_rows = 0
+    n_mismatches = 0
+    t_replay = 0.
+    for url in search_urls(base_url, n_pages):
+        pages = loaded_page(base_url, url, n_clicks)
+        n_click_requests += len(pages) - 1
+        clicked = row_extractor.IncrementalRowExtractor()
+        clicked.update(pages[-1])
+        if len(pages) < 2:
+            continue
+
+        t0 = time.time()
+        xhr_url = url.replace('/companies?', '/companies/more?') + '&page=2&per_page=20&sort=signal'
+        events = [('Network.requestWillBeSent', dict(type='XHR', request=dict(
+            url=xhr_url, method='GET', headers={'X-Requested-With': 'XMLHttpRequest'})))]
+        request = pagination_replay.find_pagination_request(events, url)
+        replayed = row_extractor.IncrementalRowExtractor()
+        n = replayed.update(pages[1])
+        pager = pagination_replay.ReplayPager(request, pages[1], n, referer=url)
+        n_replay_requests += 1  # the click that issued the captured request
+        while not pager.last_page:
+            page = pager.fetch_next()
+            if page is None:
+                break
+            replayed.update(page)
+        pager.close()
+        n_replay_requests += pager.n_requests
+        t_replay += time.time() - t0
+
+        links = [clicked.al_link(i) for i in range(1, len(clicked))]
+        replayed_links = [replayed.al_link(i) for i in range(1, len(replayed))]
+        n_rows += len(links)
+        n_mismatches += int(links != replayed_links)
+    return dict(rows=n_rows, click_requests=n_click_requests, replay_requests=n_replay_requests,
+                mismatched_pages=n_mismatches, replay_ms_per_row=1000. * t_replay / max(n_rows, 1))
+
+
+def scenario_get_results(base_url, output_dir, n_pages, n_clicks=20):
+    """
+    get_results.py on click files seeded from the stand-in server, run as its own process
+    """
+    results_folder = os.path.join(output_dir, 'results')
+    if not os.path.exists(results_folder):
+        os.makedirs(results_folder)
+    n_files = 0
+    for url in search_urls(base_url, n_pages):
+        fname = 'results_' + url.split('/companies?', 1)[1].replace('&', '_') + '.csv'
+        results = row_extractor.IncrementalRowExtractor()
+        entries = []
+        for click, page in enumerate(loaded_page(base_url, url, n_clicks), 1):
+            start_row = max(len(entries) + 1, 1)
+            for i in range(start_row, results.update(page)):
+                entries.append(results.extract(i))
+            pd.DataFrame(entries).to_csv(os.path.join(results_folder, fname.replace(
+                '.csv', '_sort=signal_click={}.csv'.format(click))), index=False, encoding='utf-8')
+            n_files += 1
+
+    env = dict(os.environ, ANGEL_OUTPUT_DIR=output_dir)
+    t0 = time.time()
+    with open(os.devnull, 'w') as devnull:
+        rc = subprocess.call([sys.executable, 'get_results.py', '--full'], cwd=CODE_DIR, env=env,
+                             stdout=devnull, stderr=devnull)
+    elapsed = time.time() - t0
+    n_rows = sum(len(pd.read_csv(f)) for f in glob.glob(os.path.join(results_folder, '*.csv')))
+    return dict(files=n_files, rows=n_rows, seconds=elapsed, returncode=rc, ms_per_row=1000. * elapsed / n_rows,
+                peak_rss_mb=peak_rss_mb(resource.RUSAGE_CHILDREN))
+
+
+def _wall_ms(cmd, env, n_runs=3):
+    """
+    best of n_runs wall clock of a fresh interpreter running cmd, None if it fails
+    """
+    best = None
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(n_runs):
+            t0 = time.time()
+            if subprocess.call(cmd, cwd=CODE_DIR, env=env, stdout=devnull, stderr=devnull) != 0:
+                return None
+            elapsed = 1000. * (time.time() - t0)
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def scenario_cli_startup(base_url, output_dir, n_pages):
+    """
+    cold start of every cli subcommand: parsing and dispatch for all, a full run of the commands that need no
+    browser or network on an empty output folder, against a bare interpreter and an import of the scraper
+    """
+    env = dict(os.environ, ANGEL_OUTPUT_DIR=output_dir)
+    result = dict(python_ms=_wall_ms([sys.executable, '-c', 'pass'], env),
+                  import_scraper_ms=_wall_ms([sys.executable, '-c', 'import AngelScraper'], env))
+    for command in ['plan', 'crawl', 'merge', 'reparse', 'stats']:
+        result['{}_help_ms'.format(command)] = _wall_ms([sys.executable, 'cli.py', command, '--help'], env)
+    for command in ['stats', 'merge']:
+        result['{}_run_ms'.format(command)] = _wall_ms([sys.executable, 'cli.py', command], env)
+    return result
+
+
+SCENARIOS = [
+    ('count_probe', scenario_count_probe),
+    ('row_parse', scenario_row_parse),
+    ('search_page', scenario_search_page),
+    ('browser_profile', scenario_browser_profile),
+    ('pagination_replay', scenario_pagination_replay),
+    ('get_results', scenario_get_results),
+    ('cli_startup', scenario_cli_startup),
+]
+
+
+def _run_in_child(fn, base_url, output_dir, n_pages, queue):
+    if not os.environ.get('BENCH_VERBOSE'):
+        sys.stdout = open(os.devnull, 'w')
+    AS.pause_scale = 0.  # every request is paced, scenarios without a scraper included
+    result = fn(base_url, output_dir, n_pages)
+    result.setdefault('peak_rss_mb', peak_rss_mb())
+    queue.put(result)
+
+
+def run_scenario(fn, base_url, n_pages):
+    """
+    each scenario runs in its own process against its own scratch folder, so peak rss is per scenario
+    """
+    output_dir = tempfile.mkdtemp(prefix='angel_bench_')
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_run_in_child, args=(fn, base_url, output_dir, n_pages, queue))
+    p.start()
+    p.join()
+    shutil.rmtree(output_dir, ignore_errors=True)
+    if p.exitcode != 0:
+        return dict(error='exit code {}'.format(p.exitcode))
+    return queue.get()
+
+
+def compare(results, previous_file, tolerance=0.2):
+    """
+    flag throughput drops and parse time or memory increases beyond tolerance against a previous run
+    """
+    with open(previous_file) as f:
+        previous = json.load(f)['results']
+    for name, result in results.items():
+        for k, v in result.items():
+            old = previous.get(name, {}).get(k)
+            if not isinstance(v, float) or not isinstance(old, float) or old == 0:
+                continue
+            change = (v - old) / old
+            worse = change < -tolerance if k.endswith('per_sec') else change > tolerance
+            if k.endswith(('per_sec', 'per_row', 'per_page', '_mb', '_ms')) and worse:
+                AS.log_time('error')
+                print('regression in {} {}: {:.3f} -> {:.3f} ({:+.0%})'.format(name, k, old, v, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='offline benchmark against a local stand-in of the companies pages')
+    parser.add_argument('--scenarios', default=','.join(x[0] for x in SCENARIOS))
+    parser.add_argument('--pages', type=int, default=20, help='search urls per scenario')
+    parser.add_argument('--companies', type=int, default=5000)
+    parser.add_argument('--latency-ms', type=float, default=0.)
+    parser.add_argument('--jitter-ms', type=float, default=0.)
+    parser.add_argument('--error-rate', type=float, default=0.)
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(CODE_DIR), 'output', 'benchmarks'))
+    parser.add_argument('--compare', default=None, help='json file of a previous run')
+    args = parser.parse_args()
+
+    server = bench_server.BenchServer(n_companies=args.companies, latency_ms=args.latency_ms,
+                                      latency_jitter_ms=args.jitter_ms, error_rate=args.error_rate).start()
+    AS.log_time('info')
+    print('stand-in server at {}, {} companies, latency {}+{}ms, error rate {}'.format(
+        server.base_url, args.companies, args.latency_ms, args.jitter_ms, args.error_rate))
+
+    selected = args.scenarios.split(',')
+    results = dict()
+    for name, fn in SCENARIOS:
+        if name not in selected:
+            continue
+        AS.log_time('info')
+        print('running scenario {}'.format(name))
+        results[name] = run_scenario(fn, server.base_url, args.pages)
+        AS.log_time('highlight')
+        print('{}: {}'.format(name, ', '.join('{}={:.3f}'.format(k, v) if isinstance(v, float) else
+                                              '{}={}'.format(k, v) for k, v in sorted(results[name].items()))))
+    server.stop()
+
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+    output_file = os.path.join(args.output, 'bench_{}.json'.format(datetime.datetime.now().strftime('%Y%m%d_%H%M%S')))
+    with open(output_file, 'w') as f:
+        json.dump(dict(args=vars(args), results=results), f, indent=2, sort_keys=True)
+    AS.log_time('write')
+    print(output_file)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+from __future__ import print_function
+import os
+import json
+import fcntl
+import threading
+
+from selenium import webdriver
+
+# resources the scraper never reads: the signal column only needs the alt attribute of its image
+BLOCKED_RESOURCE_PATTERNS = ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.webp', '*.ico',
+                             '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+                             '*.mp4', '*.webm', '*.mp3', '*.m4a']
+
+# analytics, ads, chat widgets and social embeds
+BLOCKED_HOST_PATTERNS = ['*google-analytics.com*', '*googletagmanager.com*', '*googleadservices.com*',
+                         '*doubleclick.net*', '*googlesyndication.com*', '*facebook.net*', '*facebook.com/tr*',
+                         '*connect.facebook.*', '*platform.twitter.com*', '*ads-twitter.com*',
+                         '*platform.linkedin.com*', '*snap.licdn.com*', '*hotjar.com*', '*segment.io*',
+                         '*cdn.segment.com*', '*mixpanel.com*', '*intercom.io*', '*intercomcdn.com*',
+                         '*optimizely.com*', '*newrelic.com*', '*nr-data.net*', '*quantserve.com*',
+                         '*scorecardresearch.com*']
+
+_user_data_lock = threading.Lock()
+_claimed = dict()  # session folder -> locked file descriptor, for the live sessions of this process
+
+
+class BrowserProfile:
+    def __init__(self,
+                 headless=False,
+                 page_load_strategy='normal',  # 'eager' returns at DOMContentLoaded, without images and iframes
+                 blocked_url_patterns=None,
+                 disable_extensions=False,
+                 user_data_dir=None,  # sessions get their own subfolder, reused across runs
+                 disk_cache_mb=None,
+                 window_size=(1920, 600),
+                 page_load_timeout=25,
+                 measure_bytes=False,  # sum the bytes the browser received for each page
+                 host_resolver_rules=None  # chrome --host-resolver-rules, e.g. to point hosts at a local stand-in
+                 ):
+        """
+        launch settings of a browser session
+        """
+        self.headless = headless
+        self.page_load_strategy = page_load_strategy
+        self.blocked_url_patterns = list(blocked_url_patterns or [])
+        self.disable_extensions = disable_extensions
+        self.user_data_dir = user_data_dir
+        self.disk_cache_mb = disk_cache_mb
+        self.window_size = window_size
+        self.page_load_timeout = page_load_timeout
+        self.measure_bytes = measure_bytes
+        self.host_resolver_rules = host_resolver_rules
+
+
+def default_profile():
+    """
+    the settings used before profiles existed: a visible browser loading everything
+    """
+    return BrowserProfile()
+
+
+def lean_profile(user_data_dir=None):
+    """
+    headless, returns at DOMContentLoaded, skips images, media, fonts and third party trackers
+    """
+    return BrowserProfile(headless=True,
+                          page_load_strategy='eager',
+                          blocked_url_patterns=BLOCKED_RESOURCE_PATTERNS + BLOCKED_HOST_PATTERNS,
+                          disable_extensions=True,
+                          user_data_dir=user_data_dir,
+                          disk_cache_mb=50,
+                          measure_bytes=True)
+
+
+def _lock_session(d):
+    """
+    exclusive lock on the lock file next to a session folder, held until released or the process exits,
+    so worker processes of a sharded crawl never claim the same folder, even before chrome has started in it
+    :return: file descriptor, None if another process holds the folder
+    """
+    fd = os.open(d + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        os.close(fd)
+        return None
+    return fd
+
+
+def claim_user_data_dir(base_dir):
+    """
+    first session folder under base_dir that no other session holds and no running chrome has locked,
+    reusing the folder keeps the disk cache of scripts and styles across sessions and runs
+    """
+    if not os.path.exists(base_dir):
+        os.makedirs(base_dir)
+    with _user_data_lock:
+        i = 0
+        while True:
+            d = os.path.join(base_dir, 'session_{}'.format(i))
+            i += 1
+            if d in _claimed:
+                continue
+            fd = _lock_session(d)
+            if fd is None:
+                continue
+            if os.path.lexists(os.path.join(d, 'SingletonLock')):
+                os.close(fd)  # a chrome started outside the scraper
+                continue
+            if not os.path.exists(d):
+                os.makedirs(d)
+            _claimed[d] = fd
+            return d
+
+
+def release_user_data_dir(d):
+    with _user_data_lock:
+        fd = _claimed.pop(d, None)
+    if fd is not None:
+        os.close(fd)  # releases the lock
+
+
+def chrome_options(profile, user_data_dir=None):
+    options = webdriver.ChromeOptions()
+    options.page_load_strategy = profile.page_load_strategy
+    if profile.headless:
+        options.add_argument('--headless=new')
+    if profile.disable_extensions:
+        options.add_argument('--disable-extensions')
+        options.add_argument('--disable-component-extensions-with-background-pages')
+    if any(x in BLOCKED_RESOURCE_PATTERNS for x in profile.blocked_url_patterns):
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    if user_data_dir is not None:
+        options.add_argument('--user-data-dir={}'.format(user_data_dir))
+    if profile.disk_cache_mb:
+        options.add_argument('--disk-cache-size={}'.format(profile.disk_cache_mb * 1024 * 1024))
+    if profile.host_resolver_rules:
+        options.add_argument('--host-resolver-rules={}'.format(profile.host_resolver_rules))
+    options.add_argument('--no-first-run')
+    options.add_argument('--disable-background-networking')
+    if profile.measure_bytes:
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    return options
+
+
+def firefox_options(profile):
+    options = webdriver.FirefoxOptions()
+    options.page_load_strategy = profile.page_load_strategy
+    if profile.headless:
+        options.add_argument('-headless')
+    if any(x in BLOCKED_RESOURCE_PATTERNS for x in profile.blocked_url_patterns):
+        options.set_preference('permissions.default.image', 2)
+    return options
+
+
+def apply_blocking(dr, profile):
+    """
+    block url patterns for the whole session through the devtools protocol, chrome only
+    """
+    if not profile.blocked_url_patterns or not hasattr(dr, 'execute_cdp_cmd'):
+        return False
+    dr.execute_cdp_cmd('Network.enable', {})
+    dr.execute_cdp_cmd('Network.setBlockedURLs', {'urls': profile.blocked_url_patterns})
+    return True
+
+
+def performance_events(dr):
+    """
+    devtools network events logged since the previous call, the log is drained by reading it
+    :return: list of (method, params)
+    """
+    try:
+        entries = dr.get_log('performance')
+    except Exception:
+        return []
+    events = []
+    for entry in entries:
+        message = json.loads(entry['message'])['message']
+        events.append((message['method'], message.get('params', {})))
+    return events
+
+
+def drain_performance_log(dr):
+    """
+    discard the logged events, for sessions with a byte measuring profile
+    """
+    profile = getattr(dr, 'profile', None)
+    if profile is not None and profile.measure_bytes:
+        performance_events(dr)
+
+
+def transferred_bytes(events):
+    """
+    bytes received over the network, including headers, for the requests in events
+    """
+    return int(sum(params.get('encodedDataLength', 0) for method, params in events
+                   if method == 'Network.loadingFinished'))
@@ -0,0 +1,132 @@
+from __future__ import print_function
+import time
+
+import row_extractor
+
+# same rows as row_extractor.X_ROWS, the first one is the table header
+ROW_SELECTOR = 'div[data-_tn="companies/row"]'
+
+# resolves as soon as the row count exceeds arguments[0], or with the current count after arguments[1] ms
+WAIT_FOR_ROWS_JS = '''
+var n = arguments[0], timeout = arguments[1], done = arguments[arguments.length - 1];
+var selector = arguments[2];
+function count() { return document.querySelectorAll(selector).length; }
+if (count() > n) { done(count()); return; }
+var timer = null;
+var observer = new MutationObserver(function () {
+  var c = count();
+  if (c > n) { observer.disconnect(); clearTimeout(timer); done(c); }
+});
+observer.observe(document.body, {childList: true, subtree: true});
+timer = setTimeout(function () { observer.disconnect(); done(count()); }, timeout);
+'''
+
+COUNT_ROWS_JS = 'return document.querySelectorAll(arguments[0]).length;'
+
+# raw strings of every row from arguments[0] on, in row_extractor.ROW_FIELDS order, null for missing elements
+# the selectors mirror row_extractor.extract_row_soup
+EXTRACT_ROWS_JS = '''
+var offset = arguments[0];
+if (document.querySelector('div.results') === null) { return null; }
+var rows = document.querySelectorAll(arguments[1]);
+function q(row, selector) { return row.querySelector(selector); }
+function attr(el, name) { return el === null ? null : el.getAttribute(name); }
+function text(el) { return el === null ? null : el.textContent; }
+var out = [];
+for (var i = offset; i < rows.length; i++) {
+  var r = rows[i];
+  var link = q(r, 'a.startup-link');
+  var signal = q(r, 'div.column.signal');
+  out.push([attr(link, 'title'), attr(link, 'href'), attr(signal === null ? null : q(signal, 'img'), 'alt'),
+            text(q(r, 'div.column.joined > div.value')), text(q(r, 'div.column.location div.tag')),
+            text(q(r, 'div.column.market div.tag')), attr(q(r, 'div.column.website a'), 'href'),
+            text(q(r, 'div.column.company_size div.value')), text(q(r, 'div.column.stage div.value')),
+            text(q(r, 'div.column.raised div.value'))]);
+}
+return {n: rows.length, rows: out};
+'''
+
+
+def count_rows(driver):
+    return driver.execute_script(COUNT_ROWS_JS, ROW_SELECTOR)
+
+
+def wait_for_row_growth(driver, n_rows, timeout=5., poll_seconds=0.1):
+    """
+    block until the page holds more than n_rows rows, without transferring the page source
+    a MutationObserver in the page resolves the wait on the first mutation adding rows,
+    drivers without async script support fall back to polling the row count
+    :param driver:
+    :param n_rows: row count before the click, header included
+    :param timeout: seconds
+    :param poll_seconds: interval of the fallback polling
+    :return: row count when the wait returned
+    """
+    try:
+        driver.set_script_timeout(timeout + 5)
+        return driver.execute_async_script(WAIT_FOR_ROWS_JS, n_rows, int(timeout * 1000), ROW_SELECTOR)
+    except Exception:
+        pass
+
+    t_end = time.time() + timeout
+    n = count_rows(driver)
+    while n <= n_rows and time.time() < t_end:
+        time.sleep(poll_seconds)
+        n = count_rows(driver)
+    return n
+
+
+class BrowserRowExtractor:
+    def __init__(self, driver):
+        """
+        same interface as row_extractor.IncrementalRowExtractor, but the rows are read by one script in the page
+        that returns only the rows appended since the last update, the page source is never transferred
+        :param driver:
+        """
+        self.driver = driver
+        self.rows = []  # raw field lists, row 0 is the table header
+
+    def __len__(self):
+        return len(self.rows)
+
+    def update(self, page=None):
+        """
+        :param page: ignored, the rows are read from the live page
+        :return: total number of rows, raises ValueError if the page has no results container
+        """
+        result = self.driver.execute_script(EXTRACT_ROWS_JS, len(self.rows), ROW_SELECTOR)
+        if result is None:
+            raise ValueError('no results container on page')
+        self.rows.extend(result['rows'][:max(0, int(result['n']) - len(self.rows))])
+        return len(self.rows)
+
+    def al_link(self, i):
+        return self.rows[i][1]
+
+    def extract(self, i, featured=None, signal_score=None):
+        return row_extractor.extract_row_fields(self.rows[i], featured, signal_score)
+
+
+def compare_with_soup(results, page, parser='lxml'):
+    """
+    check the rows read in the browser against the BeautifulSoup reference path on a snapshot of the page
+    :param results: BrowserRowExtractor
+    :param page: page source taken after the last update
+    :param parser:
+    :return: list of (row index, browser entry, soup entry) that differ
+    """
+    soup_results = row_extractor.IncrementalRowExtractor(method='bs4', parser=parser)
+    n_rows = min(soup_results.update(page), len(results))
+    mismatches = []
+    for i in range(1, n_rows):
+        try:
+            expected = soup_results.extract(i)
+        except (IndexError, KeyError, ValueError, AttributeError):
+            expected = None
+        try:
+            entry = results.extract(i)
+        except (IndexError, KeyError, ValueError, AttributeError):
+            entry = None
+        if entry != expected:
+            mismatches.append((i, entry, expected))
+    return mismatches
@@ -0,0 +1,221 @@
+from __future__ import print_function
+import os
+import sys
+import glob
+import json
+import sqlite3
+import argparse
+
+import paths
+
+# every command imports what it needs when it runs: selenium, pandas, lxml and bs4 load in hundreds of
+# milliseconds, a merge or a look at the stats should not pay for the browser stack
+
+
+def make_scraper(args):
+    import AngelScraper as AS
+    a = AS.AngelScraper(working_dir=args.working_dir, output_dir=args.output_dir)
+    if args.url_list is not None:
+        a.search_page_url_list_file = args.url_list
+    return a
+
+
+def cmd_plan(args):
+    a = make_scraper(args)
+    try:
+        a.generate_url_list_of_search_pages(use_existing_url_list=False, adaptive=args.adaptive)
+        if args.cover:
+            a.select_covering_queries(target_coverage=args.coverage)
+    finally:
+        a.close()
+    return 0
+
+
+def cmd_crawl(args):
+    url_list = args.url_list or paths.ScraperPaths(args.working_dir, args.output_dir).url_list_file()
+    if not os.path.exists(url_list):
+        print('no url list at {}, run plan first'.format(url_list))
+        return 1
+    a = make_scraper(args)
+    try:
+        a.generate_url_list_of_search_pages(use_existing_url_list=True)
+        if args.workers > 1:
+            import supervisor
+            supervisor.run_sharded(a, n_workers=args.workers, requests_per_second=args.rps, burst=args.burst)
+        else:
+            a.parse_all_search_pages(use_frontier=args.frontier)
+    finally:
+        a.close()
+    return 0
+
+
+def cmd_merge(args):
+    p = paths.ScraperPaths(args.working_dir, args.output_dir)
+
+    if args.parquet:
+        # read the typed dataset instead of the per pass csv files, only the result columns are loaded
+        import result_store
+        from result_merger import RESULT_COLUMNS
+
+        df = result_store.load_results(p.result_dataset_dir, columns=RESULT_COLUMNS)
+        df = df.drop_duplicates(subset='al_link')
+        print(df.head())
+        print(df.count())
+        output_file = os.path.join(p.output_dir, 'results_so_far_dataset.csv')
+        df.to_csv(output_file, index=False, encoding='utf-8')
+        print(output_file)
+        return 0
+
+    import pandas as pd
+    from tqdm import tqdm
+    from result_merger import StreamingMerger
+
+    f_list = glob.glob(os.path.join(p.results_folder, '*.csv'))
+    print(len(f_list))
+
+    # by default only result files added since the last merge are processed, --full rebuilds from scratch
+    merger = StreamingMerger(p.merged_results_file, p.merge_state_file, incremental=not args.full)
+    n_new = merger.merge(f_list, progress=tqdm)
+    merger.close()
+
+    print('merged {} files, read {} rows, appended {} new companies, {} companies in total'.format(
+        merger.n_files_merged, merger.n_rows_read, n_new, len(merger.seen)))
+    if os.path.exists(p.merged_results_file) and os.path.getsize(p.merged_results_file):
+        print(pd.read_csv(p.merged_results_file, nrows=5).head())
+    print(p.merged_results_file)
+    return 0
+
+
+def cmd_reparse(args):
+    # archived pages only, neither the scraper nor a browser is needed
+    import reparse
+    p = paths.ScraperPaths(args.working_dir, args.output_dir)
+    reparse.reparse_archive(p, output_folder=args.output_folder, processes=args.processes)
+    return 0
+
+
+def _query(db_file, sql, params=()):
+    """
+    rows of a read-only query on a state file, None if the file or the table does not exist yet
+    """
+    if not os.path.exists(db_file):
+        return None
+    conn = sqlite3.connect(db_file, timeout=60)
+    try:
+        return conn.execute(sql, params).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def cmd_stats(args):
+    """
+    state of the output folder, read straight from the files without loading the scraper
+    """
+    p = paths.ScraperPaths(args.working_dir, args.output_dir)
+    url_list = args.url_list or p.url_list_file()
+    if os.path.exists(url_list):
+        with open(url_list) as f:
+            print('url list {}: {} queries'.format(url_list, max(0, sum(1 for _ in f) - 1)))
+    else:
+        print('url list {}: not planned yet'.format(url_list))
+
+    states = _query(url_list.replace('.csv', '_frontier.sqlite'), 'SELECT state, COUNT(*) FROM jobs GROUP BY state')
+    if states:
+        print('frontier: {}'.format(', '.join('{} {}'.format(n, state) for state, n in sorted(states))))
+
+    result_files = glob.glob(os.path.join(p.results_folder, '*.csv'))
+    print('result files: {} ({:.1f} MB)'.format(len(result_files),
+                                                sum(os.path.getsize(f) for f in result_files) / 1048576.))
+    merged = _query(p.merge_state_file, 'SELECT COUNT(*) FROM seen')
+    if merged:
+        print('merged companies: {} in {}'.format(merged[0][0], p.merged_results_file))
+    seen = _query(p.state_file('seen_companies'), 'SELECT COUNT(*) FROM companies')
+    if seen:
+        print('companies with details: {}'.format(seen[0][0]))
+    pages = _query(os.path.join(p.page_store_dir, 'index.sqlite'), 'SELECT kind, COUNT(*) FROM pages GROUP BY kind')
+    if pages:
+        print('archived pages: {}'.format(', '.join('{} {}'.format(n, kind) for kind, n in sorted(pages))))
+    passes = _query(p.state_file('sort_planner'), 'SELECT COUNT(*), COALESCE(SUM(clicks), 0), '
+                                                   'COALESCE(SUM(stopped_early), 0) FROM passes')
+    if passes and passes[0][0]:
+        print('sort passes: {}, {} clicks, {} stopped early'.format(*passes[0]))
+
+    # totals of the last run, as written by AngelScraper.write_metrics
+    runs = sorted(glob.glob(os.path.join(p.metrics_dir, 'metrics_*.jsonl')), key=os.path.getmtime)
+    if runs:
+        stages = []
+        wall = None
+        with open(runs[-1]) as f:
+            for line in f:
+                x = json.loads(line)
+                if x['type'] == 'stage':
+                    stages.append((x['total'], x['stage'], x['count']))
+                elif x['type'] == 'run':
+                    wall = x['wall']
+        totals = dict()
+        for total, stage, count in stages:
+            t, n = totals.get(stage, (0., 0))
+            totals[stage] = (t + total, n + count)
+        print('last run {}: {}'.format(os.path.basename(runs[-1]),
+                                       '{:.0f}s wall clock'.format(wall) if wall is not None else 'unfinished'))
+        for stage, (total, count) in sorted(totals.items(), key=lambda x: -x[1][0])[:args.top]:
+            print('  {:<18} {:>8} {:>10.1f}s'.format(stage, count, total))
+    return 0
+
+
+def add_folder_options(parser, default=None):
+    parser.add_argument('--working-dir', default=default, help='defaults to $ANGEL_WORKING_DIR or the repository')
+    parser.add_argument('--output-dir', default=default, help='defaults to $ANGEL_OUTPUT_DIR or <working dir>/output')
+    parser.add_argument('--url-list', default=default, help='url list csv, defaults to the list of today')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='angel.co company search scraper')
+    add_folder_options(parser)
+    # the folder options are accepted after the subcommand too, main.py and get_results.py put them there
+    folders = argparse.ArgumentParser(add_help=False)
+    add_folder_options(folders, default=argparse.SUPPRESS)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    plan_cmd = commands.add_parser('plan', parents=[folders], help='probe the search filters and write the url list')
+    plan_cmd.add_argument('--adaptive', action='store_true', help='split only the queries above the result cap')
+    plan_cmd.add_argument('--cover', action='store_true',
+                          help='keep only the queries needed to return the companies of earlier crawls')
+    plan_cmd.add_argument('--coverage', type=float, default=1., help='share of those companies to keep with --cover')
+    plan_cmd.set_defaults(fn=cmd_plan)
+
+    crawl_cmd = commands.add_parser('crawl', parents=[folders], help='page through every search url of the url list')
+    crawl_cmd.add_argument('--frontier', action='store_true', help='run from the durable job queue, resumable')
+    crawl_cmd.add_argument('--workers', type=int, default=1, help='worker processes sharing one request budget')
+    crawl_cmd.add_argument('--rps', type=float, default=0.5, help='requests per second over all workers')
+    crawl_cmd.add_argument('--burst', type=int, default=1)
+    crawl_cmd.set_defaults(fn=cmd_crawl)
+
+    merge_cmd = commands.add_parser('merge', parents=[folders], help='collect the result files into one csv')
+    merge_cmd.add_argument('--full', action='store_true', help='rebuild from scratch instead of adding new files')
+    merge_cmd.add_argument('--parquet', action='store_true', help='read the parquet dataset instead of the csv files')
+    merge_cmd.set_defaults(fn=cmd_merge)
+
+    reparse_cmd = commands.add_parser('reparse', parents=[folders],
+                                      help='rebuild result files from the archived pages, offline')
+    reparse_cmd.add_argument('--output-folder', default=None, help='defaults to <output dir>/results_reparse')
+    reparse_cmd.add_argument('--processes', type=int, default=None)
+    reparse_cmd.set_defaults(fn=cmd_reparse)
+
+    stats_cmd = commands.add_parser('stats', parents=[folders],
+                                    help='progress of the url list, results, archive and last run')
+    stats_cmd.add_argument('--top', type=int, default=8, help='stages of the last run to show')
+    stats_cmd.set_defaults(fn=cmd_stats)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.fn(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
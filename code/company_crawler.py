@@ -0,0 +1,119 @@
+from __future__ import print_function
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import AngelScraper as AS
+import metrics
+
+
+class PolitenessBudget:
+    def __init__(self,
+                 requests_per_second=0.5,
+                 max_in_flight=2,
+                 jitter_seconds=1.,
+                 burst=1
+                 ):
+        """
+        per-host token bucket, caps the request rate and the number of concurrent requests
+        :param requests_per_second: sustained rate per host, None to only cap the concurrency and leave the rate
+            to the caller, e.g. the pacer every fetch backend waits for
+        :param max_in_flight: max concurrent requests across all hosts
+        :param jitter_seconds: a random delay in [0, jitter_seconds) is added before every request
+        :param burst: bucket capacity, number of requests that may go out back to back
+        """
+        self.requests_per_second = None if requests_per_second is None else float(requests_per_second)
+        self.max_in_flight = max_in_flight
+        self.jitter_seconds = jitter_seconds
+        self.burst = burst
+
+        self._buckets = dict()  # host -> [tokens, last refill time]
+        self._lock = threading.Lock()
+
+    def _reserve(self, host):
+        """
+        take a token for host, returns how long the caller has to wait before using it
+        """
+        if self.requests_per_second is None:
+            wait = random.random() * self.jitter_seconds
+            metrics.observe('politeness_wait', wait)
+            return wait
+        with self._lock:
+            now = time.time()
+            tokens, last = self._buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.requests_per_second)
+            tokens -= 1
+            self._buckets[host] = [tokens, now]
+        wait = 0. if tokens >= 0 else -tokens / self.requests_per_second
+        wait += random.random() * self.jitter_seconds
+        metrics.observe('politeness_wait', wait)
+        return wait
+
+    def acquire(self, url):
+        time.sleep(self._reserve(urlparse(url).netloc))
+
+    async def acquire_async(self, url):
+        await asyncio.sleep(self._reserve(urlparse(url).netloc))
+
+
+async def _crawl(urls, fetch, save, budget):
+    loop = asyncio.get_running_loop()
+    in_flight = asyncio.Semaphore(budget.max_in_flight)
+    pages = dict()
+
+    with ThreadPoolExecutor(max_workers=budget.max_in_flight) as executor:
+        async def crawl_one(url):
+            # a page that fails is left out of the batch, the other fetches and the sort pass carry on
+            try:
+                async with in_flight:
+                    await budget.acquire_async(url)
+                    page = await loop.run_in_executor(executor, fetch, url)
+                if page is not None and save is not None:
+                    save(url, page)
+            except Exception as e:
+                metrics.error('company_fetch', e)
+                AS.log_time('error')
+                print('company page failed: {} ({}: {})'.format(url, type(e).__name__, e))
+                return
+            if page is not None:
+                pages[url] = page
+
+        await asyncio.gather(*[crawl_one(url) for url in urls])
+
+    return pages
+
+
+def crawl_company_pages(urls, fetch, save=None, budget=None):
+    """
+    fetch a batch of company pages concurrently under a politeness budget
+    :param urls:
+    :param fetch: blocking callable url -> page source or None, run in a thread pool
+    :param save: optional callable (url, page), called as each page arrives
+    :param budget: PolitenessBudget
+    :return: dict of url -> page source for the pages that were fetched, a fetch or save that raises is counted
+        as an error of company_fetch and its page left out
+    """
+    if budget is None:
+        budget = PolitenessBudget()
+    urls = list(dict.fromkeys(urls))  # dedup, keep order
+    if not urls:
+        return dict()
+
+    AS.log_time('info')
+    print('fetching {} company pages, {} req/s, {} in flight'.format(
+        len(urls), 'paced' if budget.requests_per_second is None else budget.requests_per_second,
+        budget.max_in_flight))
+    t0 = time.time()
+
+    loop = asyncio.new_event_loop()
+    try:
+        pages = loop.run_until_complete(_crawl(urls, fetch, save, budget))
+    finally:
+        loop.close()
+
+    AS.log_time('info')
+    print('fetched {}/{} company pages in {:.1f}s'.format(len(pages), len(urls), time.time() - t0))
+    return pages
@@ -0,0 +1,24 @@
+from __future__ import print_function
+import datetime
+
+import colorama
+
+colorama.init()
+
+
+def log_time(kind='general', color_str=None):
+    if color_str is None:
+        if kind == 'error' or kind.startswith('e'):
+            color_str = colorama.Fore.RED
+        elif kind == 'info' or kind.startswith('i'):
+            color_str = colorama.Fore.YELLOW
+        elif kind == 'overwrite' or kind.startswith('o'):
+            color_str = colorama.Fore.MAGENTA
+        elif kind == 'write' or kind.startswith('w'):
+            color_str = colorama.Fore.CYAN
+        elif kind == 'highlight' or kind.startswith('h'):
+            color_str = colorama.Fore.GREEN
+        else:
+            color_str = colorama.Fore.WHITE
+
+    print(color_str + str(datetime.datetime.now()) + colorama.Fore.RESET, end=' ')
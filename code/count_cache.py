@@ -0,0 +1,64 @@
+from __future__ import print_function
+import time
+import sqlite3
+
+import search_query
+
+
+class CountCache:
+    def __init__(self, db_file, ttl=3 * 24 * 3600, failure_ttl=3600):
+        """
+        persistent cache of company counts of search pages, keyed by search_query.query_key, the key of the
+        result files and dataset partitions of the same query
+        :param db_file: sqlite file
+        :param ttl: seconds a successful count stays fresh
+        :param failure_ttl: seconds a failed probe is remembered, so that it is not retried right away
+        """
+        self.db_file = db_file
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.conn = sqlite3.connect(db_file)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS company_count ('
+                          'key TEXT PRIMARY KEY, url TEXT, company_count INTEGER, ok INTEGER, ts REAL)')
+        self.conn.commit()
+
+        self.n_hits = 0
+        self.n_negative_hits = 0
+        self.n_misses = 0
+
+    def get(self, url):
+        """
+        :param url:
+        :return: (fresh, company_count), for a remembered failure company_count is what the failed probe returned
+        """
+        row = self.conn.execute('SELECT company_count, ok, ts FROM company_count WHERE key = ?',
+                                (search_query.query_key(url),)).fetchone()
+        if row is not None:
+            company_count, ok, ts = row
+            age = time.time() - ts
+            if ok and age < self.ttl:
+                self.n_hits += 1
+                return True, company_count
+            if not ok and age < self.failure_ttl:
+                self.n_negative_hits += 1
+                return True, company_count
+        self.n_misses += 1
+        return False, None
+
+    def put(self, url, company_count, ok=True):
+        """
+        :param url:
+        :param company_count:
+        :param ok: False records a failed probe, which is only remembered for failure_ttl
+        """
+        self.conn.execute('INSERT OR REPLACE INTO company_count VALUES (?, ?, ?, ?, ?)',
+                          (search_query.query_key(url), search_query.canonical_url(url), company_count, int(ok),
+                           time.time()))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def report(self):
+        return 'count cache: {} hits, {} remembered failures, {} misses'.format(
+            self.n_hits, self.n_negative_hits, self.n_misses)
@@ -0,0 +1,170 @@
+from __future__ import print_function
+import threading
+from contextlib import contextmanager
+
+import AngelScraper as AS
+
+
+class DriverPool:
+    def __init__(self,
+                 size=2,  # one for the index page, one for inner pages
+                 max_uses=50,  # recycle a session after this many pages
+                 driver_type='Chrome',
+                 driver_factory=None,
+                 profile=None
+                 ):
+        """
+        a fixed number of long-lived webdriver sessions with checkout/checkin semantics,
+        so that we do not pay for a browser launch on every page
+        :param size: max number of live sessions
+        :param max_uses: a session is quit and replaced after serving this many checkouts
+        :param driver_type: passed to init_driver
+        :param driver_factory: callable returning a new driver, defaults to init_driver
+        :param profile: browser_profile.BrowserProfile passed to init_driver
+        """
+        self.size = size
+        self.max_uses = max_uses
+        self.driver_type = driver_type
+        self.driver_factory = driver_factory
+        self.profile = profile
+
+        self._idle = []
+        self._uses = dict()
+        self._n_live = 0
+        self._cond = threading.Condition()
+
+        # stats
+        self.n_launches = 0
+        self.n_checkouts = 0
+        self.n_recycled = 0
+        self.n_crashed = 0
+
+    def _launch(self):
+        if self.driver_factory is not None:
+            dr = self.driver_factory()
+        else:
+            dr = AS.init_driver(self.driver_type, profile=self.profile)
+        with self._cond:
+            self.n_launches += 1
+            self._uses[id(dr)] = 0
+        return dr
+
+    def _close(self, dr):
+        with self._cond:
+            self._uses.pop(id(dr), None)
+        try:
+            AS.quit_driver(dr)
+        except:
+            pass
+
+    @staticmethod
+    def is_healthy(dr):
+        """
+        cheap round trip to the browser, fails if the session crashed or was quit
+        """
+        try:
+            dr.current_url
+            return True
+        except:
+            return False
+
+    @staticmethod
+    def reset(dr):
+        """
+        wipe cookies and storage so the next borrower sees a fresh session
+        """
+        try:
+            try:
+                dr.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+            except:
+                pass  # about:blank and some error pages do not expose storage
+            dr.delete_all_cookies()
+            dr.get('about:blank')
+            return True
+        except:
+            return False
+
+    def checkout(self):
+        with self._cond:
+            while not self._idle and self._n_live >= self.size:
+                self._cond.wait()
+            if self._idle:
+                dr = self._idle.pop()
+            else:
+                dr = None
+                self._n_live += 1
+            self.n_checkouts += 1
+
+        if dr is not None and not self.is_healthy(dr):
+            AS.log_time('error')
+            print('pooled driver is not responding, replacing it')
+            with self._cond:
+                self.n_crashed += 1
+            self._close(dr)
+            dr = None
+
+        if dr is None:
+            try:
+                dr = self._launch()
+            except:
+                with self._cond:
+                    self._n_live -= 1
+                    self._cond.notify()
+                raise
+        return dr
+
+    def checkin(self, dr, broken=False):
+        """
+        return a driver to the pool
+        :param dr:
+        :param broken: set if the page load failed or the session is in an unknown state
+        :return:
+        """
+        # use counts change under the lock, like in checkout, the reset talks to the browser and runs outside it
+        reuse = False
+        with self._cond:
+            if id(dr) in self._uses:
+                self._uses[id(dr)] += 1
+                if broken:
+                    self.n_crashed += 1
+                elif self._uses[id(dr)] >= self.max_uses:
+                    self.n_recycled += 1
+                else:
+                    reuse = True
+        keep = reuse and self.reset(dr)
+
+        if not keep:
+            self._close(dr)
+        with self._cond:
+            if keep:
+                self._idle.append(dr)
+            else:
+                self._n_live -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def driver(self):
+        dr = self.checkout()
+        try:
+            yield dr
+        except:
+            self.checkin(dr, broken=True)
+            raise
+        else:
+            self.checkin(dr)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._n_live -= len(idle)
+        for dr in idle:
+            self._close(dr)
+
+    @property
+    def launches_saved(self):
+        return max(self.n_checkouts - self.n_launches, 0)
+
+    def report(self):
+        AS.log_time('highlight')
+        print('driver pool: {} checkouts, {} launches, {} launches saved, {} recycled, {} crashed'.format(
+            self.n_checkouts, self.n_launches, self.launches_saved, self.n_recycled, self.n_crashed))
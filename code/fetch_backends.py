@@ -0,0 +1,151 @@
+from __future__ import print_function
+import re
+
+import AngelScraper as AS
+import metrics
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_5) AppleWebKit/537.36 (KHTML, like Gecko) '
+                  'Chrome/59.0.3071.115 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.8',
+}
+
+
+def report_failure(e):
+    """
+    tell the pacer about a request that raised
+    """
+    AS.pacer.failure('timeout' if isinstance(e, requests.Timeout) else 'http_error')
+
+
+def report_response(r):
+    """
+    tell the pacer how a response went, rate limiting and server errors back off, anything else is healthy
+    """
+    if r.status_code == 429 or r.status_code >= 500:
+        AS.pacer.failure('status_{}'.format(r.status_code))
+    else:
+        AS.pacer.success(r.elapsed.total_seconds(), kind='http')
+
+
+class SeleniumBackend:
+    """
+    fetch a fully rendered page with a pooled browser session
+    """
+    name = 'selenium'
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def fetch(self, url):
+        with metrics.timer('driver_checkout'):
+            driver = self.pool.checkout()
+        if not AS.load_url(driver=driver, url=url, quit_on_failure=False):
+            self.pool.checkin(driver, broken=True)
+            return None
+        page = driver.page_source
+        self.pool.checkin(driver)
+        return page
+
+
+class HttpBackend:
+    """
+    fetch raw html with a keep-alive http session, no javascript is executed
+    """
+    name = 'http'
+
+    def __init__(self, pool_size=4, timeout=25, n_retries=2, headers=None):
+        if requests is None:
+            raise ImportError('requests is required for the http fetch backend')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=n_retries)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(DEFAULT_HEADERS if headers is None else headers)
+
+    def fetch(self, url):
+        try:
+            AS.throttle()
+            with metrics.timer('http_fetch'):
+                r = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            AS.log_time('error')
+            print('http fetch failed: {} ({})'.format(url, type(e).__name__))
+            report_failure(e)
+            return None
+        report_response(r)
+        if r.status_code != 200:
+            metrics.error('http_fetch', kind='status_{}'.format(r.status_code))
+            AS.log_time('error')
+            print('http fetch got status {}: {}'.format(r.status_code, url))
+            return None
+        return r.text
+
+    def fetch_if_modified(self, url, validators=None):
+        """
+        conditional get
+        :param url:
+        :param validators: If-None-Match / If-Modified-Since headers from a previous response
+        :return: (page or None, not modified flag, etag, last-modified)
+        """
+        try:
+            AS.throttle()
+            with metrics.timer('http_fetch'):
+                r = self.session.get(url, timeout=self.timeout, headers=validators)
+        except requests.RequestException as e:
+            AS.log_time('error')
+            print('http fetch failed: {} ({})'.format(url, type(e).__name__))
+            report_failure(e)
+            return None, False, None, None
+        report_response(r)
+        if r.status_code == 304:
+            metrics.inc('not_modified')
+            return None, True, r.headers.get('ETag'), r.headers.get('Last-Modified')
+        if r.status_code != 200:
+            metrics.error('http_fetch', kind='status_{}'.format(r.status_code))
+            AS.log_time('error')
+            print('http fetch got status {}: {}'.format(r.status_code, url))
+            return None, False, None, None
+        return r.text, False, r.headers.get('ETag'), r.headers.get('Last-Modified')
+
+    def close(self):
+        self.session.close()
+
+
+def page_has_class(page, class_name):
+    """
+    cheap check that some element in the raw html carries class_name, avoids building a soup tree
+    """
+    return re.search(r'class="[^"]*\b{}\b'.format(re.escape(class_name)), page) is not None
+
+
+def fetch_page(url, backends, is_valid=None, keep_invalid=False):
+    """
+    try backends in order, falling through when a fetch fails or the page lacks the expected content
+    :param url:
+    :param backends: list of objects with a fetch(url) method
+    :param is_valid: callable taking the page source, returns False if the page should be re-fetched
+    :param keep_invalid: when no backend returns a valid page, return the last page fetched anyway,
+        for callers that handle a page without the expected content themselves
+    :return: page source or None
+    """
+    invalid_page = None
+    for i, backend in enumerate(backends):
+        page = backend.fetch(url)
+        if page is not None and (is_valid is None or is_valid(page)):
+            return page
+        if page is not None:
+            invalid_page = page
+        if i + 1 < len(backends):
+            AS.log_time('error')
+            print('{} backend did not return the expected page, falling back to {}: {}'.format(
+                backend.name, backends[i + 1].name, url))
+    return invalid_page if keep_invalid else None
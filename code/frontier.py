@@ -0,0 +1,152 @@
+from __future__ import print_function
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+
+import AngelScraper as AS
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def default_worker_id():
+    return '{}-{}'.format(socket.gethostname(), os.getpid())
+
+
+class Frontier:
+    def __init__(self, db_file, lease_seconds=900, max_attempts=3):
+        """
+        durable queue of (search url, sort key) jobs shared by any number of scraper processes
+        a job is leased to one worker at a time, the lease expires unless the worker keeps sending heartbeats,
+        so jobs of killed workers go back to the queue
+        several machines can share the queue through the same sqlite file on a network drive that supports
+        file locking
+        :param db_file: sqlite file
+        :param lease_seconds: how long a lease lasts without a heartbeat
+        :param max_attempts: a job is marked failed after this many leases
+        """
+        self.db_file = db_file
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        # heartbeats also come from the threads waiting for the pacer, the lock keeps them out of a transaction
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_file, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                          'id INTEGER PRIMARY KEY, url TEXT, sort_key TEXT, url_dict TEXT, state TEXT, '
+                          'attempts INTEGER DEFAULT 0, lease_owner TEXT, lease_expires REAL, updated REAL, '
+                          'last_error TEXT, UNIQUE (url, sort_key))')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires)')
+
+    def add_jobs(self, url_dicts, sort_key_fn):
+        """
+        enqueue one job per search url and sort key, jobs already in the queue are left untouched
+        :param url_dicts: iterable of url dicts, e.g. rows of AngelScraper.url_df
+        :param sort_key_fn: company_count -> list of sort keys
+        :return: number of new jobs
+        """
+        now = time.time()
+        n_new = 0
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                for url_dict in url_dicts:
+                    url_dict = dict((k, v.item() if hasattr(v, 'item') else v) for k, v in dict(url_dict).items())
+                    for sort_key in sort_key_fn(url_dict['company_count']):
+                        cur = self.conn.execute('INSERT OR IGNORE INTO jobs (url, sort_key, url_dict, state, '
+                                                'updated) VALUES (?, ?, ?, ?, ?)',
+                                                (url_dict['url'], sort_key, json.dumps(url_dict), PENDING, now))
+                        n_new += cur.rowcount
+                self.conn.execute('COMMIT')
+            except:
+                self.conn.execute('ROLLBACK')
+                raise
+        return n_new
+
+    def lease(self, worker_id):
+        """
+        atomically take the next pending job, or a leased job whose lease has expired
+        :param worker_id:
+        :return: (job id, url dict, sort key), or None when there is nothing left to do
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                # expired leases that used up all attempts are given up
+                self.conn.execute('UPDATE jobs SET state = ?, updated = ? '
+                                  'WHERE state = ? AND lease_expires < ? AND attempts >= ?',
+                                  (FAILED, now, LEASED, now, self.max_attempts))
+                row = self.conn.execute('SELECT id, url_dict, sort_key FROM jobs '
+                                        'WHERE state = ? OR (state = ? AND lease_expires < ?) '
+                                        'ORDER BY attempts, id LIMIT 1', (PENDING, LEASED, now)).fetchone()
+                if row is not None:
+                    self.conn.execute('UPDATE jobs SET state = ?, lease_owner = ?, lease_expires = ?, updated = ?, '
+                                      'attempts = attempts + 1 WHERE id = ?',
+                                      (LEASED, worker_id, now + self.lease_seconds, now, row[0]))
+                self.conn.execute('COMMIT')
+            except:
+                self.conn.execute('ROLLBACK')
+                raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def heartbeat(self, job_id, worker_id):
+        """
+        extend the lease
+        :return: False if the lease was lost, e.g. it expired and another worker took the job
+        """
+        now = time.time()
+        with self._lock:
+            cur = self.conn.execute('UPDATE jobs SET lease_expires = ?, updated = ? '
+                                    'WHERE id = ? AND lease_owner = ? AND state = ?',
+                                    (now + self.lease_seconds, now, job_id, worker_id, LEASED))
+            return cur.rowcount == 1
+
+    def leased_elsewhere(self):
+        """
+        jobs held by other workers, or by a run that died without giving them back
+        :return: (number of leased jobs, seconds until the first lease expires)
+        """
+        n, first_expiry = self.conn.execute('SELECT COUNT(*), MIN(lease_expires) FROM jobs WHERE state = ?',
+                                            (LEASED,)).fetchone()
+        return n, max(0., first_expiry - time.time()) if n else 0.
+
+    def complete(self, job_id, worker_id):
+        self.conn.execute('UPDATE jobs SET state = ?, updated = ? WHERE id = ? AND lease_owner = ?',
+                          (DONE, time.time(), job_id, worker_id))
+
+    def fail(self, job_id, worker_id, error=None):
+        """
+        give the job back, it is retried until max_attempts is reached
+        """
+        self.conn.execute('UPDATE jobs SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+                          'lease_expires = NULL, updated = ?, last_error = ? WHERE id = ? AND lease_owner = ?',
+                          (self.max_attempts, FAILED, PENDING, time.time(), error, job_id, worker_id))
+
+    def release_worker(self, worker_id, error=None):
+        """
+        give back every job leased by a worker that died, without waiting for the leases to expire
+        :return: number of jobs released
+        """
+        cur = self.conn.execute('UPDATE jobs SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+                                'lease_expires = NULL, updated = ?, last_error = ? WHERE lease_owner = ? AND state = ?',
+                                (self.max_attempts, FAILED, PENDING, time.time(), error, worker_id, LEASED))
+        return cur.rowcount
+
+    def stats(self):
+        return dict(self.conn.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+
+    def report(self):
+        AS.log_time('highlight')
+        print('frontier {}: {}'.format(self.db_file, ', '.join(
+            '{} {}'.format(v, k) for k, v in sorted(self.stats().items()))))
+
+    def close(self):
+        self.conn.close()
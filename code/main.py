@@ -1,6 +1,6 @@
-import AngelScraper as AS
+import sys
 
-a = AS.AngelScraper()
+import cli
 
-a.generate_url_list_of_search_pages(use_existing_url_list=True)
-a.parse_all_search_pages()
\ No newline at end of file
+# same as: python cli.py crawl, the url list of today has to exist, see python cli.py plan
+sys.exit(cli.main(['crawl'] + sys.argv[1:]))
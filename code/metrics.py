@@ -0,0 +1,315 @@
+from __future__ import print_function
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+# upper bounds in seconds, from a fast parse to an ultra long pause
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 25., 60., 300., 3600., float('inf'))
+
+# stages where the scraper waits on purpose, reported apart from the real overhead
+PAUSE_STAGES = ('pause', 'pacing_wait', 'politeness_wait', 'budget_wait')
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _label_str(key, extra=None):
+    items = list(key) + (extra or [])
+    if not items:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in items) + '}'
+
+
+def current_rss_mb():
+    """
+    resident memory of this process, read from /proc where available, otherwise the peak so far
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1048576.
+    except (IOError, OSError, ValueError):
+        pass
+    if resource is None:
+        return 0.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.  # kB on linux
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """
+        upper bound of the bucket holding the q-th observation
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    def __init__(self):
+        """
+        timers and counters of the scraping stages, shared by all threads of a process
+        """
+        self._lock = threading.Lock()
+        self.histograms = dict()  # (stage, labels) -> Histogram
+        self.counters = dict()  # (name, labels) -> value
+        self.gauges = dict()  # (name, labels) -> last value
+        self.memory_marks = []  # (label, peak resident MB) per sort pass
+        self.t_start = time.time()
+        self.event_log = None
+
+    def open_event_log(self, file_name):
+        """
+        every observation is also appended to file_name as one json line
+        """
+        self.close_event_log()
+        self.event_log = open(file_name, 'a')
+
+    def close_event_log(self):
+        if self.event_log is not None:
+            self.event_log.close()
+            self.event_log = None
+
+    def _log_event(self, event):
+        if self.event_log is not None:
+            self.event_log.write(json.dumps(event) + '\n')
+
+    def observe(self, stage, seconds, **labels):
+        key = (stage, _label_key(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+            self._log_event(dict(ts=time.time(), type='timer', stage=stage, seconds=seconds, labels=labels))
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            self._log_event(dict(ts=time.time(), type='counter', name=name, value=value, labels=labels))
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.gauges[key] = value
+            self._log_event(dict(ts=time.time(), type='gauge', name=name, value=value, labels=labels))
+
+    def record_memory(self, label, peak_mb):
+        """
+        memory high-water mark of one unit of work, e.g. a sort pass
+        """
+        with self._lock:
+            self.memory_marks.append((label, peak_mb))
+            self._log_event(dict(ts=time.time(), type='memory', label=label, peak_mb=peak_mb))
+        self.set_gauge('pass_peak_rss_mb', peak_mb)
+
+    def error(self, stage, exc=None, kind=None):
+        """
+        count an error of a stage by exception type, or by kind when there is no exception
+        """
+        self.inc('errors', stage=stage, type=type(exc).__name__ if exc is not None else kind or 'unknown')
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        """
+        time the enclosed block, exceptions are counted as errors of the stage and re-raised
+        """
+        t0 = time.time()
+        try:
+            yield
+        except Exception as e:
+            self.error(stage, e)
+            raise
+        finally:
+            self.observe(stage, time.time() - t0, **labels)
+
+    def stage_totals(self):
+        """
+        :return: dict of stage -> (count, total seconds), summed over labels
+        """
+        totals = dict()
+        with self._lock:
+            for (stage, _), h in self.histograms.items():
+                count, total = totals.get(stage, (0, 0.))
+                totals[stage] = (count + h.count, total + h.total)
+        return totals
+
+    def summary(self):
+        """
+        per run table of where the wall clock time went
+        """
+        wall = time.time() - self.t_start
+        totals = self.stage_totals()
+        lines = ['run summary: {:.1f}s wall clock'.format(wall),
+                 '{:<18} {:>8} {:>10} {:>9} {:>9} {:>9} {:>7}'.format('stage', 'count', 'total s', 'mean s',
+                                                                       'p50 s', 'p95 s', 'share')]
+        with self._lock:
+            merged = dict()
+            for (stage, _), h in self.histograms.items():
+                m = merged.setdefault(stage, Histogram())
+                m.counts = [a + b for a, b in zip(m.counts, h.counts)]
+                m.count += h.count
+                m.total += h.total
+                m.min = h.min if m.min is None else min(m.min, h.min)
+                m.max = h.max if m.max is None else max(m.max, h.max)
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            marks = list(self.memory_marks)
+        for stage, h in sorted(merged.items(), key=lambda x: -x[1].total):
+            lines.append('{:<18} {:>8} {:>10.2f} {:>9.3f} {:>9.3f} {:>9.3f} {:>7.1%}'.format(
+                stage, h.count, h.total, h.total / h.count, h.quantile(.5), h.quantile(.95),
+                h.total / wall if wall else 0.))
+        pause = sum(totals.get(x, (0, 0.))[1] for x in PAUSE_STAGES)
+        lines.append('deliberate pauses {:.1f}s ({:.1%}), everything else {:.1f}s'.format(
+            pause, pause / wall if wall else 0., wall - pause))
+        if marks:
+            peaks = sorted(mb for _, mb in marks)
+            label, top = max(marks, key=lambda x: x[1])
+            lines.append('memory high-water per sort pass: {} passes, first {:.0f}MB, median {:.0f}MB, '
+                         'last {:.0f}MB, max {:.0f}MB at {}'.format(len(marks), marks[0][1], peaks[len(peaks) // 2],
+                                                                   marks[-1][1], top, label))
+        for (name, key), value in counters + gauges:
+            lines.append('{}{} {}'.format(name, _label_str(key), value))
+        return '\n'.join(lines)
+
+    def prometheus_text(self, prefix='angel_', labels=None):
+        """
+        all metrics in the prometheus text exposition format
+        :param labels: dict of labels added to every series, e.g. the worker of a sharded crawl
+        """
+        const = _label_key(labels)
+        out = []
+        with self._lock:
+            stages = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        if stages:
+            out.append('# TYPE {}stage_seconds histogram'.format(prefix))
+        for (stage, key), h in stages:
+            labels = list(const) + [('stage', stage)] + list(key)
+            cumulative = 0
+            for bound, n in zip(BUCKETS, h.counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                out.append('{}stage_seconds_bucket{} {}'.format(prefix, _label_str(labels, [('le', le)]), cumulative))
+            out.append('{}stage_seconds_sum{} {}'.format(prefix, _label_str(labels), h.total))
+            out.append('{}stage_seconds_count{} {}'.format(prefix, _label_str(labels), h.count))
+        names = sorted(set(name for (name, _), _ in counters))
+        for name in names:
+            out.append('# TYPE {}{}_total counter'.format(prefix, name))
+            for (n, key), value in counters:
+                if n == name:
+                    out.append('{}{}_total{} {}'.format(prefix, name, _label_str(const + key), value))
+        for name in sorted(set(name for (name, _), _ in gauges)):
+            out.append('# TYPE {}{} gauge'.format(prefix, name))
+            for (n, key), value in gauges:
+                if n == name:
+                    out.append('{}{}{} {}'.format(prefix, name, _label_str(const + key), value))
+        return '\n'.join(out) + '\n'
+
+    def write_prometheus(self, file_name, labels=None):
+        """
+        textfile for the node exporter textfile collector, written atomically
+        """
+        tmp_name = file_name + '.tmp'
+        with open(tmp_name, 'w') as f:
+            f.write(self.prometheus_text(labels=labels))
+        os.rename(tmp_name, file_name)
+
+    def write_jsonl(self, file_name):
+        """
+        append one json line per stage, counter and gauge, plus the run totals
+        """
+        now = time.time()
+        with self._lock:
+            stages = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        with open(file_name, 'a') as f:
+            for (stage, key), h in stages:
+                f.write(json.dumps(dict(ts=now, type='stage', stage=stage, labels=dict(key), count=h.count,
+                                        total=h.total, min=h.min, max=h.max, p50=h.quantile(.5),
+                                        p95=h.quantile(.95))) + '\n')
+            for (name, key), value in counters:
+                f.write(json.dumps(dict(ts=now, type='counter', name=name, labels=dict(key), value=value)) + '\n')
+            for (name, key), value in gauges:
+                f.write(json.dumps(dict(ts=now, type='gauge', name=name, labels=dict(key), value=value)) + '\n')
+            f.write(json.dumps(dict(ts=now, type='run', wall=now - self.t_start)) + '\n')
+
+    def serve(self, port=9101):
+        """
+        expose /metrics over http from a daemon thread
+        :return: the server, call shutdown() to stop it
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                data = registry.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = HTTPServer(('', port), Handler)
+        t = threading.Thread(target=server.serve_forever)
+        t.daemon = True
+        t.start()
+        return server
+
+    def reset(self):
+        with self._lock:
+            self.histograms = dict()
+            self.counters = dict()
+            self.gauges = dict()
+            self.memory_marks = []
+            self.t_start = time.time()
+
+
+# process wide registry
+REGISTRY = Metrics()
+timer = REGISTRY.timer
+observe = REGISTRY.observe
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set_gauge
+record_memory = REGISTRY.record_memory
+error = REGISTRY.error
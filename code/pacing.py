@@ -0,0 +1,125 @@
+from __future__ import print_function
+import time
+import random
+import threading
+
+import metrics
+
+
+class AIMDPacer:
+    def __init__(self,
+                 initial_rate=0.2,
+                 floor=0.02,
+                 ceiling=1.,
+                 increase=0.02,
+                 decrease=0.5,
+                 slow_decrease=0.8,
+                 latency_factor=2.,
+                 cooldown_seconds=5.,
+                 jitter=0.25,
+                 max_wait=None
+                 ):
+        """
+        request rate controller, additive increase on every healthy response, multiplicative decrease on
+        timeouts, errors and responses slowing down, kept between floor and ceiling
+        requests are spaced 1 / rate apart, a backed off pacer recovers by increase per successful request
+        :param initial_rate: requests per second
+        :param floor: lowest rate, 0.02 spaces requests 50s apart
+        :param ceiling: highest rate
+        :param increase: added to the rate per successful request
+        :param decrease: the rate is multiplied by it on a failure
+        :param slow_decrease: the rate is multiplied by it when latency rises above latency_factor x its baseline
+        :param latency_factor:
+        :param cooldown_seconds: at most one decrease per cooldown, a burst of failures from one incident
+        or from concurrent requests backs off once
+        :param jitter: intervals vary by up to this fraction, requests do not go out on a fixed beat
+        :param max_wait: no request waits longer than this many seconds, however many are queued, e.g. to stay
+            well within the lease of a frontier job
+        """
+        self.floor = floor
+        self.ceiling = ceiling
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_decrease = slow_decrease
+        self.latency_factor = latency_factor
+        self.cooldown_seconds = cooldown_seconds
+        self.jitter = jitter
+        self.max_wait = max_wait
+
+        self._lock = threading.Lock()
+        self.rate = min(ceiling, max(floor, initial_rate))
+        self.next_time = 0.  # earliest time the next request may go out
+        self.last_decrease = 0.
+        # per kind of request, a browser page load and an http fetch take very different times
+        self.latency = dict()  # moving average of the response time
+        self.baseline = dict()  # lowest moving average seen, creeping up so a lasting change is accepted
+        self.n_success = 0
+        self.n_failures = 0
+        metrics.set_gauge('request_rate', self.rate)
+
+    def set_limits(self, floor, ceiling):
+        with self._lock:
+            self.floor = floor
+            self.ceiling = ceiling
+            self.rate = min(ceiling, max(floor, self.rate))
+        metrics.set_gauge('request_rate', self.rate)
+
+    def reserve(self):
+        """
+        book the next request slot, returns how long the caller has to wait before sending
+        """
+        with self._lock:
+            now = time.time()
+            start = max(now, self.next_time)
+            if self.max_wait is not None:
+                start = min(start, now + self.max_wait)
+            self.next_time = start + (1. + self.jitter * (2 * random.random() - 1)) / self.rate
+        return start - now
+
+    def _decrease(self, factor, kind):
+        now = time.time()
+        if now - self.last_decrease < self.cooldown_seconds:
+            return False
+        self.rate = max(self.floor, self.rate * factor)
+        self.last_decrease = now
+        # the slot already booked is pushed back to the new spacing
+        self.next_time = max(self.next_time, now + 1. / self.rate)
+        metrics.inc('pacing_backoffs', kind=kind)
+        return True
+
+    def success(self, latency=None, kind='page'):
+        """
+        a request came back fine
+        :param latency: seconds the response took, None if not measured
+        :param kind: kind of request, latencies are compared within a kind, e.g. 'page', 'http', 'rows'
+        """
+        with self._lock:
+            self.n_success += 1
+            if latency is not None:
+                avg = self.latency.get(kind)
+                avg = latency if avg is None else .7 * avg + .3 * latency
+                self.latency[kind] = avg
+                self.baseline[kind] = min(self.baseline.get(kind, avg) * 1.02, avg)
+                if avg > self.latency_factor * self.baseline[kind] and avg > 0.1:
+                    self._decrease(self.slow_decrease, 'slow')
+                    metrics.set_gauge('request_rate', self.rate)
+                    return
+            self.rate = min(self.ceiling, self.rate + self.increase)
+            metrics.set_gauge('request_rate', self.rate)
+
+    def failure(self, kind='error'):
+        """
+        a request timed out, failed or returned a page without the expected content
+        :param kind: label of the backoff counter, e.g. 'timeout', 'status_429', 'count_parse'
+        """
+        with self._lock:
+            self.n_failures += 1
+            self._decrease(self.decrease, kind)
+            metrics.set_gauge('request_rate', self.rate)
+
+    def report(self):
+        latencies = ', '.join('{} {:.2f}s (baseline {:.2f}s)'.format(k, v, self.baseline[k])
+                              for k, v in sorted(self.latency.items()))
+        return 'pacing: {:.3f} requests/s (floor {}, ceiling {}), {} ok, {} failed{}'.format(
+            self.rate, self.floor, self.ceiling, self.n_success, self.n_failures,
+            ', latency ' + latencies if latencies else '')
@@ -0,0 +1,209 @@
+from __future__ import print_function
+import os
+import re
+import time
+import uuid
+import zlib
+import socket
+import sqlite3
+import hashlib
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class PageStore:
+    def __init__(self, store_dir, segment_max_bytes=256 * 1024 * 1024, compression=None):
+        """
+        content addressed html archive
+        pages are compressed and appended to large segment files, identical pages are stored once,
+        a sqlite index maps (kind, url) to the latest version and every hash to its place in a segment
+        every process appends to its own segment files, so several crawlers can share one store
+        :param store_dir:
+        :param segment_max_bytes: a new segment is started when the current one grows past this size
+        :param compression: 'zstd' or 'zlib', defaults to zstd when the zstandard package is installed
+        """
+        self.store_dir = store_dir
+        self.segment_dir = os.path.join(store_dir, 'segments')
+        if not os.path.exists(self.segment_dir):
+            os.makedirs(self.segment_dir)
+        self.segment_max_bytes = segment_max_bytes
+        if compression is None:
+            compression = 'zstd' if zstandard is not None else 'zlib'
+        self.compression = compression
+
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(store_dir, 'index.sqlite'), timeout=60, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, segment TEXT, '
+                          'offset INTEGER, length INTEGER, raw_length INTEGER, codec TEXT)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pages (kind TEXT, url TEXT, hash TEXT, ts REAL, '
+                          'PRIMARY KEY (kind, url))')
+        self.conn.commit()
+
+        self._writer = None
+        self._writer_name = None
+        self._readers = dict()
+
+        self.n_puts = 0
+        self.n_dedup = 0
+        self.n_bytes_raw = 0
+        self.n_bytes_stored = 0
+
+    @staticmethod
+    def content_hash(data):
+        return hashlib.sha1(data).hexdigest()
+
+    def _compress(self, data):
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return zlib.compress(data, 6)
+
+    @staticmethod
+    def _decompress(blob, codec):
+        if codec == 'zstd':
+            if zstandard is None:
+                raise ImportError('zstandard is required to read zstd compressed pages')
+            return zstandard.ZstdDecompressor().decompress(blob)
+        return zlib.decompress(blob)
+
+    def _segment_writer(self, n_bytes):
+        if self._writer is None or self._writer.tell() + n_bytes > self.segment_max_bytes:
+            if self._writer is not None:
+                self._writer.close()
+            self._writer_name = 'seg-{}-{}-{}.dat'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+            self._writer = open(os.path.join(self.segment_dir, self._writer_name), 'ab')
+        return self._writer
+
+    def put(self, url, page, kind='company'):
+        """
+        store a page as the latest version of url
+        :param url:
+        :param page: page source, str or utf-8 bytes
+        :param kind: namespace, e.g. 'company' or 'index'
+        :return: content hash
+        """
+        data = page.encode('utf-8') if not isinstance(page, bytes) else page
+        h = self.content_hash(data)
+        with self._lock:
+            self.n_puts += 1
+            self.n_bytes_raw += len(data)
+            if self.conn.execute('SELECT 1 FROM blobs WHERE hash = ?', (h,)).fetchone() is not None:
+                self.n_dedup += 1
+            else:
+                blob = self._compress(data)
+                w = self._segment_writer(len(blob))
+                offset = w.tell()
+                w.write(blob)
+                w.flush()
+                self.n_bytes_stored += len(blob)
+                self.conn.execute('INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?, ?, ?)',
+                                  (h, self._writer_name, offset, len(blob), len(data), self.compression))
+            self.conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)', (kind, url, h, time.time()))
+            self.conn.commit()
+        return h
+
+    def get_hash(self, url, kind='company'):
+        with self._lock:
+            row = self.conn.execute('SELECT hash FROM pages WHERE kind = ? AND url = ?', (kind, url)).fetchone()
+        return None if row is None else row[0]
+
+    def has(self, url, kind='company'):
+        return self.get_hash(url, kind) is not None
+
+    def get_blob(self, h):
+        """
+        :param h: content hash
+        :return: page source as str, or None
+        """
+        with self._lock:
+            row = self.conn.execute('SELECT segment, offset, length, codec FROM blobs WHERE hash = ?',
+                                    (h,)).fetchone()
+            if row is None:
+                return None
+            segment, offset, length, codec = row
+            if segment == self._writer_name:
+                self._writer.flush()
+            if segment not in self._readers:
+                self._readers[segment] = open(os.path.join(self.segment_dir, segment), 'rb')
+            f = self._readers[segment]
+            f.seek(offset)
+            blob = f.read(length)
+        return self._decompress(blob, codec).decode('utf-8', 'replace')
+
+    def get(self, url, kind='company'):
+        h = self.get_hash(url, kind)
+        return None if h is None else self.get_blob(h)
+
+    def urls(self, kind='company'):
+        with self._lock:
+            return [x[0] for x in self.conn.execute('SELECT url FROM pages WHERE kind = ?', (kind,))]
+
+    def report(self):
+        return 'page store: {} pages stored, {} deduplicated, {:.1f}MB raw -> {:.1f}MB on disk'.format(
+            self.n_puts, self.n_dedup, self.n_bytes_raw / 1e6, self.n_bytes_stored / 1e6)
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for f in self._readers.values():
+                f.close()
+            self._readers = dict()
+            self.conn.close()
+
+
+def index_page_key(url, sort_key, click, run=None):
+    """
+    :param url: search url
+    :param sort_key:
+    :param click:
+    :param run: id of the run that crawled the page, starting with its timestamp so later runs sort last,
+        None for pages imported from older versions
+    """
+    if run is None:
+        return '{}#sort={}&click={}'.format(url, sort_key, click)
+    return '{}#run={}&sort={}&click={}'.format(url, run, sort_key, click)
+
+
+INDEX_PAGE_KEY_PATTERN = re.compile(
+    r'^(?P<url>.+)#(?:run=(?P<run>[^&]*)&)?sort=(?P<sort>[^&]*)&click=(?P<click>\d+)$')
+LEGACY_INDEX_PAGE_PATTERN = re.compile(r'^(?P<url>.+)_click_(?P<click>\d+)\.html$')
+
+
+def import_legacy_folders(store, company_page_folder, index_page_folder):
+    """
+    move the one-file-per-page archive into the store, files are kept on disk
+    legacy index pages do not record the sort pass, they are imported with sort key 'unknown'
+    :return: number of files imported
+    """
+    n = 0
+    for fname in os.listdir(company_page_folder):
+        if fname.endswith('.html'):
+            url = fname[:-len('.html')].replace(']]]', '/')
+            if not store.has(url):
+                with open(os.path.join(company_page_folder, fname), 'r', encoding='utf-8') as f:
+                    store.put(url, f.read())
+                n += 1
+    for fname in os.listdir(index_page_folder):
+        m = LEGACY_INDEX_PAGE_PATTERN.match(fname)
+        if m is not None:
+            key = index_page_key(m.group('url').replace(']]]', '/'), 'unknown', int(m.group('click')))
+            if not store.has(key, kind='index'):
+                with open(os.path.join(index_page_folder, fname), 'r', encoding='utf-8') as f:
+                    store.put(key, f.read(), kind='index')
+                n += 1
+    return n
+
+
+if __name__ == '__main__':
+    import AngelScraper as AS
+    a = AS.AngelScraper()
+    n_imported = import_legacy_folders(a.page_store, a.company_page_folder, a.index_page_folder)
+    AS.log_time('highlight')
+    print('imported {} legacy page files'.format(n_imported))
+    print(a.page_store.report())
+    a.page_store.close()
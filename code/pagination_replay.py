@@ -0,0 +1,179 @@
+from __future__ import print_function
+import json
+
+try:
+    from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+except ImportError:
+    from urlparse import urlsplit, urlunsplit, parse_qsl
+    from urllib import urlencode
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+import AngelScraper as AS
+import row_extractor
+import fetch_backends
+import metrics
+
+PAGE_PARAMS = ('page', 'p', 'page_number')
+PAGE_SIZE_PARAMS = ('per_page', 'per', 'page_size', 'limit')
+# headers requests sets itself or that belong to the browser connection
+SKIPPED_HEADERS = ('host', 'content-length', 'cookie', 'connection', 'accept-encoding')
+
+
+def find_pagination_request(events, page_url):
+    """
+    the xhr the page sent for the next batch of rows, from the devtools network events of a click on "more"
+    :param events: list of (method, params) from browser_profile.performance_events
+    :param page_url: url of the search page, requests for the page itself are ignored
+    :return: dict with url, method, headers, post_data and the name of the page parameter, or None
+    """
+    for method, params in reversed(events):
+        if method != 'Network.requestWillBeSent' or params.get('type') not in ('XHR', 'Fetch'):
+            continue
+        request = params['request']
+        if request['url'] == page_url:
+            continue
+        query = parse_qsl(urlsplit(request['url']).query, keep_blank_values=True)
+        form = parse_qsl(request.get('postData') or '', keep_blank_values=True)
+        page_param = next((k for k, v in query + form if k in PAGE_PARAMS and v.isdigit()), None)
+        if page_param is None:
+            continue
+        return dict(url=request['url'], method=request.get('method', 'GET'), headers=request.get('headers', {}),
+                    post_data=request.get('postData'), page_param=page_param)
+    return None
+
+
+def split_rows(fragment):
+    """
+    html of every companies/row element in fragment
+    """
+    starts = [m.start() for m in row_extractor.ROW_MARKER.finditer(fragment)]
+    return [fragment[a:b] for a, b in zip(starts, starts[1:] + [len(fragment)])]
+
+
+def _set_params(pairs, values):
+    return [(k, str(values[k]) if k in values else v) for k, v in pairs]
+
+
+class ReplayPager:
+    def __init__(self, request, page, n_rows, cookies=None, user_agent=None, referer=None, page_size=100,
+                 timeout=25):
+        """
+        replays the captured pagination request with an http client instead of clicking "more" in the browser
+        when the request carries a page size parameter, batches are fetched with page_size rows, starting over
+        from the first batch and skipping the rows the browser already loaded
+        :param request: from find_pagination_request
+        :param page: page source after the click that issued the request
+        :param n_rows: rows on page, header included
+        :param cookies: browser cookies, list of dicts as returned by driver.get_cookies()
+        :param user_agent: of the browser
+        :param referer: the search page url
+        :param page_size: rows per replayed request, if the request has a page size parameter
+        :param timeout:
+        """
+        if requests is None:
+            raise ImportError('requests is required for pagination replay')
+        self.request = request
+        self.timeout = timeout
+        self.page = page
+        self.session = requests.Session()
+        for c in cookies or []:
+            self.session.cookies.set(c['name'], c['value'], domain=c.get('domain'), path=c.get('path', '/'))
+        headers = dict((k, v) for k, v in request['headers'].items() if k.lower() not in SKIPPED_HEADERS)
+        if user_agent:
+            headers['User-Agent'] = user_agent
+        if referer:
+            headers['Referer'] = referer
+        self.session.headers.update(headers)
+
+        parts = urlsplit(request['url'])
+        self.query = parse_qsl(parts.query, keep_blank_values=True)
+        self.form = parse_qsl(request['post_data'] or '', keep_blank_values=True)
+        self.url_parts = parts
+
+        self.page_param = request['page_param']
+        self.size_param = next((k for k, v in self.query + self.form if k in PAGE_SIZE_PARAMS and v.isdigit()), None)
+        if self.size_param is not None:
+            self.page_size = page_size
+            self.next_page = 1
+            self.n_skip = n_rows - 1  # rows already on page, header excluded
+        else:
+            self.page_size = None
+            self.next_page = int(dict(self.query + self.form)[self.page_param]) + 1
+            self.n_skip = 0
+
+        self.last_page = False
+        self.n_requests = 0
+        self.n_bytes = 0
+
+    def _fetch(self, page_number):
+        values = {self.page_param: page_number}
+        if self.size_param is not None:
+            values[self.size_param] = self.page_size
+        url = urlunsplit(self.url_parts[:3] + (urlencode(_set_params(self.query, values)),) + self.url_parts[4:])
+        self.n_requests += 1
+        AS.throttle()
+        try:
+            if self.request['method'] == 'POST':
+                r = self.session.post(url, data=urlencode(_set_params(self.form, values)), timeout=self.timeout)
+            else:
+                r = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            AS.log_time('error')
+            print('pagination replay failed: {} ({})'.format(url, type(e).__name__))
+            metrics.error('replay_fetch', e)
+            fetch_backends.report_failure(e)
+            return None, True
+        self.n_bytes += len(r.content)
+        metrics.inc('replay_bytes', len(r.content))
+        fetch_backends.report_response(r)
+        if r.status_code != 200:
+            AS.log_time('error')
+            print('pagination replay got status {}: {}'.format(r.status_code, url))
+            metrics.error('replay_fetch', kind='status_{}'.format(r.status_code))
+            return None, True
+        try:
+            data = json.loads(r.text)
+        except ValueError:
+            if '<html' in r.text[:1000].lower():
+                # a whole page instead of rows, e.g. the login page once the session expired
+                AS.log_time('error')
+                print('pagination replay got a page instead of rows: {}'.format(url))
+                metrics.error('replay_fetch', kind='not_rows')
+                return None, True
+            return r.text, False  # html fragment
+        if isinstance(data, dict):
+            return data.get('html', ''), bool(data.get('last_page'))
+        return '', True
+
+    def fetch_next(self):
+        """
+        fetch the next batch of rows and append them to the page
+        :return: the grown page source, None if the request failed
+        """
+        rows = []
+        while not rows and not self.last_page:
+            with metrics.timer('replay_fetch'):
+                fragment, last_page = self._fetch(self.next_page)
+            if fragment is None:
+                return None
+            self.next_page += 1
+            batch = split_rows(fragment)
+            self.last_page = last_page or not batch or (self.page_size is not None and len(batch) < self.page_size)
+            n_skipped = min(self.n_skip, len(batch))
+            self.n_skip -= n_skipped
+            rows = batch[n_skipped:]
+        metrics.inc('replay_rows', len(rows))
+
+        # new rows go right before the end of the body, the row parser finds them by their marker
+        i = self.page.rfind('</body>')
+        if i < 0:
+            i = len(self.page)
+        self.page = self.page[:i] + ''.join(rows) + self.page[i:]
+        return self.page
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,59 @@
+from __future__ import print_function
+import os
+import datetime
+
+
+class ScraperPaths:
+    def __init__(self, working_dir=None, output_dir=None):
+        """
+        folders and state files of the scraper, without creating anything or importing the scraper itself
+        ANGEL_WORKING_DIR and ANGEL_OUTPUT_DIR override the defaults, e.g. to run against a scratch output folder
+        :param working_dir: defaults to the folder holding code/
+        :param output_dir: defaults to working_dir/output
+        """
+        if working_dir is None:
+            working_dir = os.environ.get('ANGEL_WORKING_DIR',
+                                         os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.working_dir = working_dir
+        self.code_dir = os.path.join(self.working_dir, 'code')
+
+        if output_dir is None:
+            output_dir = os.environ.get('ANGEL_OUTPUT_DIR', os.path.join(self.working_dir, 'output'))
+        self.output_dir = output_dir
+        self.url_list_folder = os.path.join(self.output_dir, 'url_lists')
+        self.results_folder = os.path.join(self.output_dir, 'results')
+        self.company_page_folder = os.path.join(self.output_dir, 'company_pages')
+        self.index_page_folder = os.path.join(self.output_dir, 'index_pages')
+        self.market_label_size_file_dir = os.path.join(self.output_dir, 'market_label_size')
+        self.debug_dir = os.path.join(self.output_dir, 'debug')
+        self.metrics_dir = os.path.join(self.output_dir, 'metrics')
+        self.result_dataset_dir = os.path.join(self.output_dir, 'results_dataset')
+        self.page_store_dir = os.path.join(self.output_dir, 'page_store')
+
+        self.merged_results_file = os.path.join(self.output_dir, 'results_so_far.csv')
+        self.merge_state_file = os.path.join(self.output_dir, 'results_so_far_state.sqlite')
+
+    def folders(self):
+        return [self.output_dir, self.url_list_folder, self.results_folder, self.company_page_folder,
+                self.index_page_folder, self.market_label_size_file_dir, self.debug_dir, self.metrics_dir]
+
+    def makedirs(self):
+        for d in self.folders():
+            if not os.path.exists(d):
+                os.makedirs(d)
+
+    def url_list_file(self, date=None):
+        """
+        url list of a day, today by default
+        """
+        return os.path.join(self.url_list_folder,
+                            'url_list_{}.csv'.format(datetime.date.today() if date is None else date))
+
+    def frontier_file(self, date=None):
+        return self.url_list_file(date).replace('.csv', '_frontier.sqlite')
+
+    def state_file(self, name):
+        """
+        sqlite state of a component, e.g. 'count_cache', 'seen_companies', 'sort_planner'
+        """
+        return os.path.join(self.output_dir, '{}.sqlite'.format(name))
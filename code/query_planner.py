@@ -0,0 +1,221 @@
+from __future__ import print_function
+import math
+import heapq
+
+import AngelScraper as AS
+import search_query
+
+# order in which filter strings are appended to the root url, same as the nested loops in AngelScraper
+FILTER_ORDER = ['market', 'featured', 'location', 'signal', 'stage', 'raised']
+
+
+class NumericDimension:
+    def __init__(self, name, lo, hi, min_width, log_scale=False, integer=False):
+        """
+        a range filter that can be bisected, e.g. signal[min]/signal[max]
+        :param name: url parameter name
+        :param lo:
+        :param hi:
+        :param min_width: ranges narrower than this are not split any further
+        :param log_scale: split at the geometric mean, for heavy tailed values like money raised
+        :param integer: round split points to integers
+        """
+        self.name = name
+        self.lo = lo
+        self.hi = hi
+        self.min_width = min_width
+        self.log_scale = log_scale
+        self.integer = integer
+
+    def filter_str(self, r):
+        return '&{name}[min]={lo}&{name}[max]={hi}'.format(name=self.name, lo=r[0], hi=r[1])
+
+    def split(self, r):
+        lo, hi = r
+        if hi - lo < 2 * self.min_width:
+            return None
+        if self.log_scale:
+            mid = math.sqrt(max(lo, 1) * hi)
+        else:
+            mid = (lo + hi) / 2.
+        if self.integer:
+            mid = int(round(mid))
+        else:
+            mid = round(mid, 2)
+        if not lo < mid < hi:
+            return None
+        return (lo, mid), (mid, hi)
+
+
+class AdaptivePlanner:
+    def __init__(self, root_url, count_fn, numeric_dims, categorical_dims, cap=400):
+        """
+        recursively partitions the search space until every leaf query returns at most cap companies
+        numeric dimensions are bisected first, since they partition the companies without overlap, except for the
+        companies without a value, which are planned again without that dimension,
+        categorical filters are enumerated once the numeric ranges cannot be narrowed any further
+        :param root_url:
+        :param count_fn: url -> number of companies, or None if the probe failed
+        :param numeric_dims: list of NumericDimension
+        :param categorical_dims: list of (name, [filter strings]), name being one of FILTER_ORDER
+        :param cap: max number of companies a query can page through
+        """
+        self.root_url = root_url
+        self.count_fn = count_fn
+        self.numeric_dims = numeric_dims
+        self.categorical_dims = categorical_dims
+        self.cap = cap
+
+        self.n_probes = 0
+        self.n_probes_skipped = 0
+        self.n_pruned = 0
+        self.n_failed = 0
+        self.n_unset = 0
+        self.url_list = []
+
+    def build_url(self, filters):
+        return search_query.canonical_url(self.root_url + ''.join(filters.get(x, '') for x in FILTER_ORDER))
+
+    def probe(self, filters):
+        self.n_probes += 1
+        return self.count_fn(self.build_url(filters))
+
+    def add_leaf(self, filters, ranges, company_count):
+        url = self.build_url(filters)
+        signal = ranges.get('signal')
+        self.url_list.append(dict(url=url,
+                                  company_count=company_count,
+                                  featured=filters.get('featured', ''),
+                                  signal=signal[1] if signal is not None else None))
+
+    def plan(self):
+        # the root is unfiltered, a range is only added when a query is bisected: companies without a value, e.g.
+        # no money raised reported, match no range at all
+        self._plan(dict(), dict(), self.probe(dict()), 0, 0)
+
+        AS.log_time('highlight')
+        print('adaptive plan: {} queries, {} probes, {} probes skipped, {} subtrees pruned, {} failed probes, '
+              '{} companies without a value of a range filter'.format(
+                  len(self.url_list), self.n_probes, self.n_probes_skipped, self.n_pruned, self.n_failed,
+                  self.n_unset))
+        return self.url_list
+
+    @staticmethod
+    def _narrow(filters, ranges, dim, r):
+        sub_ranges = dict(ranges)
+        sub_ranges[dim.name] = r
+        sub_filters = dict(filters)
+        sub_filters[dim.name] = dim.filter_str(r)
+        return sub_filters, sub_ranges
+
+    def _plan(self, filters, ranges, company_count, i_numeric, i_categorical):
+        if company_count is None:
+            self.n_failed += 1
+            AS.log_time('error')
+            print('count probe failed, dropping: {}'.format(self.build_url(filters)))
+            return
+        if company_count == 0:
+            self.n_pruned += 1
+            return
+        if company_count <= self.cap:
+            self.add_leaf(filters, ranges, company_count)
+            return
+
+        # bisect the first numeric range that is still wide enough
+        while i_numeric < len(self.numeric_dims):
+            dim = self.numeric_dims[i_numeric]
+            unfiltered = dim.name not in ranges
+            halves = dim.split(ranges.get(dim.name, (dim.lo, dim.hi)))
+            if halves is None:
+                i_numeric += 1
+                continue
+
+            (left_filters, left_ranges), (right_filters, right_ranges) = [
+                self._narrow(filters, ranges, dim, r) for r in halves]
+            left_count = self.probe(left_filters)
+            if left_count == 0 and not unfiltered:
+                # the left half is empty, so the right half has the parent's count
+                self.n_probes_skipped += 1
+                right_count = company_count
+            elif left_count is not None and left_count >= company_count:
+                # the left half already accounts for every company, nothing left on the right
+                self.n_probes_skipped += 1
+                right_count = 0
+            else:
+                right_count = self.probe(right_filters)
+
+            self._plan(left_filters, left_ranges, left_count, i_numeric, i_categorical)
+            self._plan(right_filters, right_ranges, right_count, i_numeric, i_categorical)
+
+            # the first split of a dimension leaves out the companies without a value for it, they are reached by
+            # planning the query again without this dimension
+            if unfiltered and left_count is not None and right_count is not None:
+                n_unset = company_count - left_count - right_count
+                if n_unset > 0:
+                    self.n_unset += n_unset
+                    AS.log_time('info')
+                    print('{} companies without {}, planning without it: {}'.format(
+                        n_unset, dim.name, self.build_url(filters)))
+                    self._plan(filters, ranges, company_count, i_numeric + 1, i_categorical)
+            return
+
+        # numeric ranges are exhausted, enumerate categorical filters
+        # categories do not partition the companies, so the parent is kept as well and crawled with several sorts
+        self.add_leaf(filters, ranges, company_count)
+        if i_categorical < len(self.categorical_dims):
+            name, values = self.categorical_dims[i_categorical]
+            for v in values:
+                sub_filters = dict(filters)
+                sub_filters[name] = v
+                self._plan(sub_filters, ranges, self.probe(sub_filters), i_numeric, i_categorical + 1)
+
+
+def greedy_query_cover(url_dicts, links_by_url, cost_fn=None, target_coverage=1., min_new=1):
+    """
+    smallest set of queries that still returns every company seen so far, by greedy weighted set cover
+    the companies each query returned in earlier crawls give the overlaps, the query adding the most companies not
+    covered yet per unit of cost is taken until target_coverage of all observed companies is reached;
+    queries never crawled are always kept, nothing is known about what they return
+    :param url_dicts: candidate queries, dicts with url and company_count
+    :param links_by_url: canonical url -> set of al_links observed for the query
+    :param cost_fn: url dict -> cost of crawling the query, e.g. expected clicks, 1 per query by default
+    :param target_coverage: share of the observed companies to cover
+    :param min_new: queries adding fewer new companies than this are not taken
+    :return: (url dicts to crawl, summary dict)
+    """
+    if cost_fn is None:
+        cost_fn = lambda d: 1.
+    observed = [d for d in url_dicts if links_by_url.get(d['url'])]
+    selected = [d for d in url_dicts if not links_by_url.get(d['url'])]
+    n_unobserved = len(selected)
+
+    universe = set()
+    for d in observed:
+        universe |= links_by_url[d['url']]
+    target = target_coverage * len(universe)
+
+    # lazy greedy: the gain of a query only shrinks as others are taken, so a stale gain is an upper bound and
+    # a query whose refreshed gain still beats the next best on the heap is the best pick
+    costs = [max(cost_fn(d), 1e-9) for d in observed]
+    heap = [(-len(links_by_url[d['url']]) / costs[i], i) for i, d in enumerate(observed)]
+    heapq.heapify(heap)
+    covered = set()
+    cost_all = sum(costs)
+    cost_selected = 0.
+    while heap and len(covered) < target:
+        _, i = heapq.heappop(heap)
+        n_new = len(links_by_url[observed[i]['url']] - covered)
+        if n_new < min_new:
+            continue
+        score = -n_new / costs[i]
+        if heap and score > heap[0][0]:
+            heapq.heappush(heap, (score, i))  # another query may add more now
+            continue
+        selected.append(observed[i])
+        covered |= links_by_url[observed[i]['url']]
+        cost_selected += costs[i]
+
+    summary = dict(n_queries=len(url_dicts), n_unobserved=n_unobserved, n_selected=len(selected),
+                   n_companies=len(universe), n_covered=len(covered), cost_observed=cost_all,
+                   cost_selected=cost_selected)
+    return selected, summary
@@ -0,0 +1,144 @@
+from __future__ import print_function
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+DAY = 24 * 3600
+
+
+def fingerprint(details):
+    """
+    fingerprint of the extracted fields of a page, the raw html changes on every fetch (tokens, ads, counters)
+    """
+    return hashlib.sha1(json.dumps(details, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class RecrawlScheduler:
+    def __init__(self, db_file, initial_interval=14 * DAY, min_interval=DAY, max_interval=180 * DAY,
+                 speedup=0.5, backoff=1.5):
+        """
+        decides when a company page is due for a refresh
+        every page has its own revisit interval: it shrinks when a revisit finds the page changed and grows
+        when the page is unchanged, so volatile companies are refreshed often and static ones rarely
+        :param db_file: sqlite file
+        :param initial_interval: seconds until the first revisit
+        :param min_interval:
+        :param max_interval:
+        :param speedup: interval multiplier after a change
+        :param backoff: interval multiplier after an unchanged revisit
+        """
+        self.initial_interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.speedup = speedup
+        self.backoff = backoff
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, timeout=60, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, fingerprint TEXT, '
+                          'last_fetch REAL, next_due REAL, interval REAL, n_fetches INTEGER, n_changes INTEGER, '
+                          'etag TEXT, last_modified TEXT)')
+        self.conn.commit()
+
+        self.n_due = 0
+        self.n_not_due = 0
+        self.n_changed = 0
+        self.n_unchanged = 0
+        self.n_not_modified = 0  # conditional requests answered with 304
+
+    def _get(self, url):
+        return self.conn.execute('SELECT fingerprint, interval, n_fetches, n_changes FROM pages WHERE url = ?',
+                                 (url,)).fetchone()
+
+    def is_due(self, url):
+        """
+        pages fetched before the scheduler knew about them start with the initial interval from now
+        """
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute('SELECT next_due FROM pages WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                self.conn.execute('INSERT INTO pages (url, last_fetch, next_due, interval, n_fetches, n_changes) '
+                                  'VALUES (?, ?, ?, ?, 0, 0)', (url, now, now + self.initial_interval,
+                                                                self.initial_interval))
+                self.conn.commit()
+                due = False
+            else:
+                due = now >= row[0]
+            if due:
+                self.n_due += 1
+            else:
+                self.n_not_due += 1
+        return due
+
+    def validators(self, url):
+        """
+        :return: headers for a conditional request, empty if the server never sent validators for url
+        """
+        with self._lock:
+            row = self.conn.execute('SELECT etag, last_modified FROM pages WHERE url = ?', (url,)).fetchone()
+        headers = dict()
+        if row is not None and row[0]:
+            headers['If-None-Match'] = row[0]
+        if row is not None and row[1]:
+            headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def set_validators(self, url, etag=None, last_modified=None):
+        with self._lock:
+            self.conn.execute('INSERT OR IGNORE INTO pages (url, n_fetches, n_changes) VALUES (?, 0, 0)', (url,))
+            self.conn.execute('UPDATE pages SET etag = ?, last_modified = ? WHERE url = ?',
+                              (etag, last_modified, url))
+            self.conn.commit()
+
+    def not_modified(self):
+        """
+        count a conditional request answered with 304, called from the fetch threads
+        """
+        with self._lock:
+            self.n_not_modified += 1
+
+    def record(self, url, page_fingerprint):
+        """
+        record a fetch and schedule the next one
+        :param url:
+        :param page_fingerprint: fingerprint of the fetched page
+        :return: True if the page changed since the previous fetch
+        """
+        now = time.time()
+        with self._lock:
+            row = self._get(url)
+            if row is None:
+                old_fingerprint, interval, n_fetches, n_changes = None, self.initial_interval, 0, 0
+            else:
+                old_fingerprint, interval, n_fetches, n_changes = row
+                interval = interval or self.initial_interval
+
+            changed = old_fingerprint is not None and page_fingerprint != old_fingerprint
+
+            if old_fingerprint is None:
+                pass  # first fetch, nothing to compare against
+            elif changed:
+                interval = max(self.min_interval, interval * self.speedup)
+                n_changes += 1
+                self.n_changed += 1
+            else:
+                interval = min(self.max_interval, interval * self.backoff)
+                self.n_unchanged += 1
+
+            self.conn.execute('INSERT OR IGNORE INTO pages (url, n_fetches, n_changes) VALUES (?, 0, 0)', (url,))
+            self.conn.execute('UPDATE pages SET fingerprint = ?, last_fetch = ?, next_due = ?, interval = ?, '
+                              'n_fetches = ?, n_changes = ? WHERE url = ?',
+                              (page_fingerprint, now, now + interval, interval, n_fetches + 1, n_changes, url))
+            self.conn.commit()
+        return changed
+
+    def report(self):
+        return ('recrawl scheduler: {} pages due, {} not due, revisits found {} changed, {} unchanged, '
+                '{} not modified (304)').format(self.n_due, self.n_not_due, self.n_changed, self.n_unchanged,
+                                                self.n_not_modified)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,139 @@
+from __future__ import print_function
+import os
+import re
+import glob
+import time
+import multiprocessing
+
+import pandas as pd
+
+import paths
+import console
+import row_extractor
+import page_store
+import search_query
+
+_store = None  # page store of a worker process
+
+
+def _init_worker(store_dir):
+    global _store
+    _store = page_store.PageStore(store_dir)
+
+
+def find_latest_index_pages(store):
+    """
+    the index page is saved after every click and each save holds all rows loaded so far,
+    so only the highest click of every search url and sort pass needs to be parsed, taken from the latest run
+    that crawled the pass: an older run that got further must not add rows the site no longer returns
+    :param store: page_store.PageStore
+    :return: dict of (search url, sort key) -> page store key
+    """
+    latest = dict()
+    for key in store.urls(kind='index'):
+        m = page_store.INDEX_PAGE_KEY_PATTERN.match(key)
+        if m is None:
+            continue
+        rank = (m.group('run') or '', int(m.group('click')))  # pages imported from older versions come first
+        k = (search_query.canonical_url(m.group('url')), m.group('sort'))
+        if k not in latest or rank > latest[k][0]:
+            latest[k] = (rank, key)
+    return dict((k, x[1]) for k, x in latest.items())
+
+
+def url_metadata(url):
+    """
+    recover the featured and signal columns of a search url when it is missing from the url lists
+    """
+    featured = '&featured=Featured' if '&featured=Featured' in url else ''
+    m = re.search(r'signal\[max\]=([\d.]+)', url)
+    signal = int(float(m.group(1))) if m else None
+    return featured, signal
+
+
+def reparse_index_page(job):
+    """
+    worker: rebuild the entries of one archived search page, attaching details from archived company pages
+    :param job: (url, sort key, page store key, featured, signal score)
+    :return: (url, sort key, list of entries)
+    """
+    url, sort_key, key, featured, signal_score = job
+    page = _store.get(key, kind='index')
+
+    results = row_extractor.IncrementalRowExtractor()
+    try:
+        n_rows = results.update(page)
+    except ValueError:
+        return url, sort_key, []
+
+    entries = []
+    for i in range(1, n_rows):  # row 0 is the table header
+        try:
+            entry = results.extract(i, featured=featured, signal_score=signal_score)
+        except (IndexError, ValueError, AttributeError):
+            continue
+        inner_page = _store.get(entry['al_link'])
+        if inner_page is not None:
+            entry.update(row_extractor.extract_details(inner_page))
+        entries.append(entry)
+    return url, sort_key, entries
+
+
+def reparse_archive(scraper_paths, output_folder=None, processes=None):
+    """
+    regenerate results csv files from the archived html, no browser and no network needed
+    :param scraper_paths: paths.ScraperPaths, the scraper itself is not needed
+    :param output_folder: defaults to output/results_reparse
+    :param processes: size of the process pool, defaults to the number of cores
+    :return: number of entries written
+    """
+    if output_folder is None:
+        output_folder = os.path.join(scraper_paths.output_dir, 'results_reparse')
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    # featured and signal columns come from the url lists, when available
+    url_meta = dict()
+    for f in sorted(glob.glob(os.path.join(scraper_paths.url_list_folder, '*.csv'))):
+        for _, row in pd.read_csv(f).iterrows():
+            featured = row['featured'] if isinstance(row['featured'], str) else ''
+            url_meta[search_query.canonical_url(row['url'])] = (featured, row['signal'])
+
+    store = page_store.PageStore(scraper_paths.page_store_dir)
+    try:
+        index_pages = find_latest_index_pages(store)
+    finally:
+        store.close()
+    jobs = []
+    for (url, sort_key), key in index_pages.items():
+        featured, signal_score = url_meta.get(url, url_metadata(url))
+        jobs.append((url, sort_key, key, featured, signal_score))
+
+    console.log_time('info')
+    print('reparsing {} archived search pages'.format(len(jobs)))
+    t0 = time.time()
+
+    n_entries = 0
+    pool = multiprocessing.Pool(processes=processes, initializer=_init_worker,
+                                initargs=(scraper_paths.page_store_dir,))
+    try:
+        for url, sort_key, entries in pool.imap_unordered(reparse_index_page, jobs, chunksize=4):
+            if not entries:
+                console.log_time('error')
+                print('no rows found in archived page of {} sort={}'.format(url, sort_key))
+                continue
+            output_fname = os.path.join(output_folder, search_query.base_fname(url).replace(
+                '.csv', '_sort={}.csv'.format(sort_key)))
+            pd.DataFrame(entries).to_csv(output_fname, index=False, encoding='utf-8')
+            n_entries += len(entries)
+    finally:
+        pool.close()
+        pool.join()
+
+    console.log_time('highlight')
+    print('reparse wrote {} entries from {} pages in {:.1f}s'.format(n_entries, len(jobs), time.time() - t0))
+    return n_entries
+
+
+if __name__ == '__main__':
+    reparse_archive(paths.ScraperPaths())
@@ -0,0 +1,104 @@
+from __future__ import print_function
+import os
+import sqlite3
+
+import pandas as pd
+
+RESULT_COLUMNS = ['featured', 'score', 'title', 'al_link', 'signal', 'joined_date', 'location', 'market', 'website',
+                  'size', 'stage', 'raised', 'product_desc']
+
+
+class StreamingMerger:
+    def __init__(self, output_file, state_file, key='al_link', columns=None, incremental=True, chunksize=50000):
+        """
+        merge many result csv files into one, dropping rows whose key was already written
+        files are read in chunks and rows are appended to the output as they come, the keys written so far are
+        kept in a hash set and persisted in state_file along with the files already merged
+        :param output_file: merged csv
+        :param state_file: sqlite file with the keys and files merged so far
+        :param key: column identifying a company
+        :param columns: columns of the merged csv, defaults to RESULT_COLUMNS
+        :param incremental: only merge files that are new or changed since the last run, otherwise start over
+        :param chunksize: rows per chunk read
+        """
+        self.output_file = output_file
+        self.key = key
+        self.columns = RESULT_COLUMNS if columns is None else columns
+        self.chunksize = chunksize
+
+        if not incremental:
+            for f in [output_file, state_file]:
+                if os.path.exists(f):
+                    os.remove(f)
+
+        self.conn = sqlite3.connect(state_file)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS merged_files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL)')
+        self.conn.commit()
+
+        self.seen = set(x[0] for x in self.conn.execute('SELECT key FROM seen'))
+        self.merged_files = dict((x[0], (x[1], x[2])) for x in self.conn.execute('SELECT * FROM merged_files'))
+
+        self.n_rows_read = 0
+        self.n_rows_written = 0
+        self.n_files_merged = 0
+
+    def pending_files(self, f_list):
+        """
+        files that are not merged yet, or changed since they were merged
+        """
+        pending = []
+        for f in f_list:
+            st = os.stat(f)
+            if self.merged_files.get(f) != (st.st_size, st.st_mtime):
+                pending.append(f)
+        return pending
+
+    def merge_file(self, f, out):
+        write_header = out.tell() == 0
+        try:
+            reader = pd.read_csv(f, chunksize=self.chunksize)
+            for chunk in reader:
+                self.n_rows_read += len(chunk)
+                if self.key in chunk:
+                    keys = chunk[self.key].astype(str)
+                else:
+                    # no key column, fall back to the whole row
+                    keys = pd.Series([str(x) for x in chunk.itertuples(index=False)], index=chunk.index)
+                new = ~keys.map(self.seen.__contains__) & ~keys.duplicated()
+                if not new.any():
+                    continue
+                new_keys = keys[new].tolist()
+                self.seen.update(new_keys)
+                self.conn.executemany('INSERT OR IGNORE INTO seen VALUES (?)', [(x,) for x in new_keys])
+
+                chunk[new].reindex(columns=self.columns).to_csv(out, header=write_header, index=False,
+                                                                encoding='utf-8')
+                write_header = False
+                self.n_rows_written += len(new_keys)
+                out.flush()
+                self.conn.commit()
+        except pd.errors.EmptyDataError:
+            pass
+
+        out.flush()
+        st = os.stat(f)
+        self.conn.execute('INSERT OR REPLACE INTO merged_files VALUES (?, ?, ?)', (f, st.st_size, st.st_mtime))
+        self.conn.commit()
+        self.n_files_merged += 1
+
+    def merge(self, f_list, progress=None):
+        """
+        :param f_list: csv files to merge
+        :param progress: optional wrapper around the file iterator, e.g. tqdm
+        :return: number of rows appended to the output
+        """
+        pending = self.pending_files(f_list)
+        n_written_before = self.n_rows_written
+        with open(self.output_file, 'a', encoding='utf-8') as out:
+            for f in (pending if progress is None else progress(pending)):
+                self.merge_file(f, out)
+        return self.n_rows_written - n_written_before
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,210 @@
+from __future__ import print_function
+import os
+import uuid
+import datetime
+
+import pandas as pd
+
+import search_query
+from result_merger import RESULT_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+
+# column name -> arrow type name, crawl_date and query are partition keys and live in the directory names
+RESULT_FIELDS = [('featured', 'string'),
+                 ('score', 'float64'),
+                 ('title', 'string'),
+                 ('al_link', 'string'),
+                 ('signal', 'float64'),
+                 ('joined_date', 'timestamp'),
+                 ('location', 'string'),
+                 ('market', 'string'),
+                 ('website', 'string'),
+                 ('size', 'string'),
+                 ('stage', 'string'),
+                 ('raised', 'float64'),
+                 ('product_desc', 'string'),
+                 ('query_url', 'string'),
+                 ('sort_key', 'string'),
+                 ('click', 'int32')]
+
+
+def result_schema():
+    types = dict(string=pa.string(), float64=pa.float64(), int32=pa.int32(), timestamp=pa.timestamp('s'))
+    return pa.schema([(name, types[t]) for name, t in RESULT_FIELDS])
+
+
+def query_key(url):
+    """
+    short, path safe partition value of a search url, the same for every spelling of the query
+    """
+    return search_query.query_key(url)
+
+
+def _to_float(x):
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_str(x):
+    if x is None:
+        return None
+    if isinstance(x, bytes):
+        return x.decode('ascii', 'replace')
+    if isinstance(x, float) and x != x:  # nan from pandas
+        return None
+    return str(x)
+
+
+def typed_row(entry):
+    converters = dict(string=_to_str, float64=_to_float, int32=lambda x: None if x is None else int(x),
+                      timestamp=lambda x: x)
+    return dict((name, converters[t](entry.get(name))) for name, t in RESULT_FIELDS)
+
+
+class ParquetResultSink:
+    def __init__(self, dataset_dir, crawl_date=None):
+        """
+        appends typed result rows to a parquet dataset partitioned as crawl_date=<date>/query=<query key>
+        :param dataset_dir:
+        :param crawl_date: defaults to today
+        """
+        if pa is None:
+            raise ImportError('pyarrow is required for the parquet result sink')
+        self.dataset_dir = dataset_dir
+        self.crawl_date = str(datetime.date.today() if crawl_date is None else crawl_date)
+        self.schema = result_schema()
+        self.n_rows = 0
+
+    def open_pass(self, query_url, sort_key):
+        """
+        :param query_url: search url of the pass
+        :param sort_key:
+        :return: ParquetPassWriter, one file for all the clicks of the pass
+        """
+        part_dir = os.path.join(self.dataset_dir, 'crawl_date={}'.format(self.crawl_date),
+                                'query={}'.format(query_key(query_url)))
+        if not os.path.exists(part_dir):
+            os.makedirs(part_dir)
+        fname = os.path.join(part_dir, 'sort={}_{}.parquet'.format(sort_key, uuid.uuid4().hex[:8]))
+        return ParquetPassWriter(self, fname, query_url, sort_key)
+
+
+class ParquetPassWriter:
+    def __init__(self, sink, fname, query_url, sort_key):
+        """
+        the rows of one sort pass, each click is a row group of a single parquet file
+        the file is written under a name starting with '_', which dataset reads skip, and gets its final name
+        once closed, so an interrupted pass never leaves a file without footer in the dataset
+        """
+        self.sink = sink
+        self.fname = fname
+        self.tmp_fname = os.path.join(os.path.dirname(fname), '_' + os.path.basename(fname))
+        self.query_url = query_url
+        self.sort_key = sort_key
+        self.writer = None
+        self.n_rows = 0
+
+    def append(self, entries, click):
+        """
+        :param entries: list of entry dicts of one click
+        :param click:
+        """
+        if not entries:
+            return
+        rows = [typed_row(dict(entry, query_url=self.query_url, sort_key=self.sort_key, click=click))
+                for entry in entries]
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp_fname, self.sink.schema)
+        self.writer.write_table(pa.Table.from_pylist(rows, schema=self.sink.schema))
+        self.n_rows += len(rows)
+        self.sink.n_rows += len(rows)
+
+    def close(self, keep=True):
+        """
+        :param keep: False drops the rows written so far, e.g. when the pass belongs to another worker now
+        :return: file written, None if the pass had no rows or was dropped
+        """
+        if self.writer is None:
+            return None
+        self.writer.close()
+        self.writer = None
+        if not keep:
+            os.remove(self.tmp_fname)
+            return None
+        os.rename(self.tmp_fname, self.fname)
+        return self.fname
+
+
+class CsvResultSink:
+    def __init__(self, fname, columns=None):
+        """
+        csv file of one sort pass, the rows of every click are appended as they come,
+        so memory does not grow with the length of the search page
+        the rows go to a part file of this pass only and replace fname once closed, a worker whose lease expired
+        never truncates or interleaves with the file of the worker that took the job over
+        :param fname:
+        :param columns: defaults to result_merger.RESULT_COLUMNS
+        """
+        self.fname = fname
+        self.tmp_fname = '{}.{}.part'.format(fname, uuid.uuid4().hex[:8])
+        self.columns = RESULT_COLUMNS if columns is None else columns
+        self.f = open(self.tmp_fname, 'w', encoding='utf-8')
+        self.f.write(','.join(self.columns) + '\n')
+        self.n_rows = 0
+
+    def append(self, entries):
+        """
+        :param entries: list of entry dicts of one click
+        """
+        if entries:
+            pd.DataFrame(entries, columns=self.columns).to_csv(self.f, header=False, index=False)
+            self.f.flush()
+            self.n_rows += len(entries)
+
+    def close(self, keep=True):
+        """
+        :param keep: False drops the part file, e.g. when the pass belongs to another worker now
+        :return: file written, None if dropped or already closed
+        """
+        if self.f is None:
+            return None
+        self.f.close()
+        self.f = None
+        if not keep:
+            os.remove(self.tmp_fname)
+            return None
+        os.replace(self.tmp_fname, self.fname)
+        return self.fname
+
+
+def load_results(dataset_dir, columns=None, crawl_date=None, query_url=None, where=None):
+    """
+    read the result dataset into a pandas DataFrame, only the requested columns and partitions are read
+    :param dataset_dir:
+    :param columns: list of columns, defaults to all
+    :param crawl_date: restrict to one crawl date
+    :param query_url: restrict to one search url
+    :param where: additional pyarrow.dataset expression, e.g. pyarrow.dataset.field('raised') > 1e6
+    :return:
+    """
+    if pa is None:
+        raise ImportError('pyarrow is required to read the parquet result dataset')
+    partitioning = ds.partitioning(pa.schema([('crawl_date', pa.string()), ('query', pa.string())]),
+                                   flavor='hive')
+    dataset = ds.dataset(dataset_dir, format='parquet', partitioning=partitioning)
+
+    expr = where
+    for name, value in [('crawl_date', crawl_date and str(crawl_date)),
+                        ('query', query_url and query_key(query_url))]:
+        if value is not None:
+            e = ds.field(name) == value
+            expr = e if expr is None else expr & e
+    return dataset.to_table(columns=columns, filter=expr).to_pandas()
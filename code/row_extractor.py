@@ -0,0 +1,237 @@
+from __future__ import print_function
+import re
+import datetime
+
+from bs4 import BeautifulSoup
+from lxml import etree
+import lxml.html
+
+RESULTS_MARKER = re.compile(r'class="(?:[^"]*\s)?results(?:\s[^"]*)?"')
+# only inside a div tag, the same string appears in inline scripts selecting the rows
+ROW_MARKER = re.compile(r'<div\b[^<>]*\bdata-_tn=["\']companies/row["\']')
+
+
+def _cls(*names):
+    return ''.join('[contains(concat(" ", normalize-space(@class), " "), " {} ")]'.format(x) for x in names)
+
+
+# compiled once, equivalent to the css selectors used on the BeautifulSoup tree
+X_ROWS = etree.XPath('//div[@data-_tn="companies/row"]')
+X_STARTUP_LINK = etree.XPath('.//a' + _cls('startup-link'))
+X_SIGNAL_IMG = etree.XPath('.//div' + _cls('column', 'signal') + '//img')
+X_JOINED = etree.XPath('.//div' + _cls('column', 'joined') + '/div' + _cls('value'))
+X_LOCATION = etree.XPath('.//div' + _cls('column', 'location') + '//div' + _cls('tag'))
+X_MARKET = etree.XPath('.//div' + _cls('column', 'market') + '//div' + _cls('tag'))
+X_WEBSITE = etree.XPath('.//div' + _cls('column', 'website') + '//a')
+X_SIZE = etree.XPath('.//div' + _cls('column', 'company_size') + '//div' + _cls('value'))
+X_STAGE = etree.XPath('.//div' + _cls('column', 'stage') + '//div' + _cls('value'))
+X_RAISED = etree.XPath('.//div' + _cls('column', 'raised') + '//div' + _cls('value'))
+X_PRODUCT_DESC = etree.XPath('//div' + _cls('product_desc') + '//div' + _cls('content'))
+
+
+def _parse_joined(date_str):
+    date_str = date_str.encode('ascii', errors='replace')
+    date_str = date_str.decode('utf-8').strip().replace('?', '')
+    return datetime.datetime.strptime(date_str, '%b %y')
+
+
+def _parse_raised(money):
+    money = re.sub(r'[^\d.]', '', money)
+    if money:
+        return float(money)
+    return None
+
+
+def extract_row_lxml(a, featured=None, signal_score=None):
+    """
+    build the entry dict of one companies/row element parsed by lxml
+    """
+    entry = dict()
+    link = X_STARTUP_LINK(a)[0]
+    entry['featured'] = featured
+    entry['score'] = signal_score
+    entry['title'] = link.get('title').encode('ascii', errors='replace')
+    entry['al_link'] = link.get('href')
+    entry['signal'] = X_SIGNAL_IMG(a)[0].get('alt')
+
+    date_obj = X_JOINED(a)
+    if date_obj:
+        entry['joined_date'] = _parse_joined(date_obj[0].text_content())
+    else:
+        entry['joined_date'] = None
+
+    location_obj = X_LOCATION(a)
+    if location_obj:
+        entry['location'] = location_obj[0].text_content().strip()
+
+    market_obj = X_MARKET(a)
+    if market_obj:
+        entry['market'] = market_obj[0].text_content().strip()
+
+    website_obj = X_WEBSITE(a)
+    if website_obj and website_obj[0].get('href') is not None:
+        entry['website'] = website_obj[0].get('href')
+
+    entry['size'] = X_SIZE(a)[0].text_content().strip()
+    entry['stage'] = X_STAGE(a)[0].text_content().strip()
+    raised = _parse_raised(X_RAISED(a)[0].text_content().strip())
+    if raised is not None:
+        entry['raised'] = raised
+    return entry
+
+
+def extract_row_soup(a, featured=None, signal_score=None):
+    """
+    build the entry dict of one companies/row element parsed by BeautifulSoup, reference implementation
+    """
+    entry = dict()
+    entry['featured'] = featured
+    entry['score'] = signal_score
+    entry['title'] = a.select('a.startup-link')[0]['title'].encode('ascii', errors='replace')
+    entry['al_link'] = a.select('a.startup-link')[0]['href']
+    entry['signal'] = a.select('div.column.signal')[0]('img')[0]['alt']
+
+    date_obj = a.select('div.column.joined > div.value')
+    if date_obj:
+        entry['joined_date'] = _parse_joined(date_obj[0].get_text())
+    else:
+        entry['joined_date'] = None
+
+    location_obj = a.select('div.column.location div.tag')
+    if location_obj:
+        entry['location'] = location_obj[0].get_text().strip()
+
+    market_obj = a.select('div.column.market div.tag')
+    if market_obj:
+        entry['market'] = market_obj[0].get_text().strip()
+
+    try:
+        entry['website'] = a.select('div.column.website a')[0]['href']
+    except:
+        pass
+
+    entry['size'] = a.select('div.column.company_size div.value')[0].get_text().strip()
+    entry['stage'] = a.select('div.column.stage div.value')[0].get_text().strip()
+    raised = _parse_raised(a.select('div.column.raised div.value')[0].get_text().strip())
+    if raised is not None:
+        entry['raised'] = raised
+    return entry
+
+
+# raw strings returned by the in-browser extraction, in this order
+ROW_FIELDS = ['title', 'al_link', 'signal', 'joined', 'location', 'market', 'website', 'size', 'stage', 'raised']
+
+
+def extract_row_fields(fields, featured=None, signal_score=None):
+    """
+    build the entry dict from the raw strings of one row, None for elements missing from the row
+    :param fields: list in ROW_FIELDS order
+    """
+    f = dict(zip(ROW_FIELDS, fields))
+    for k in ['signal', 'size', 'stage', 'raised']:
+        if f[k] is None:
+            raise IndexError('row has no {} column'.format(k))
+    entry = dict()
+    entry['featured'] = featured
+    entry['score'] = signal_score
+    entry['title'] = f['title'].encode('ascii', errors='replace')
+    entry['al_link'] = f['al_link']
+    entry['signal'] = f['signal']
+
+    if f['joined'] is not None:
+        entry['joined_date'] = _parse_joined(f['joined'])
+    else:
+        entry['joined_date'] = None
+
+    if f['location'] is not None:
+        entry['location'] = f['location'].strip()
+
+    if f['market'] is not None:
+        entry['market'] = f['market'].strip()
+
+    if f['website'] is not None:
+        entry['website'] = f['website']
+
+    entry['size'] = f['size'].strip()
+    entry['stage'] = f['stage'].strip()
+    raised = _parse_raised(f['raised'].strip())
+    if raised is not None:
+        entry['raised'] = raised
+    return entry
+
+
+def extract_details(page):
+    """
+    detail fields of a company page
+    :param page: company page source
+    :return: dict of the fields found on the page
+    """
+    details = dict()
+    if not page.strip():
+        return details
+    product_desc = X_PRODUCT_DESC(lxml.html.document_fromstring(page))
+    if product_desc:
+        details['product_desc'] = product_desc[0].text_content().strip()
+    return details
+
+
+class IncrementalRowExtractor:
+    def __init__(self, method='lxml', parser='lxml'):
+        """
+        keeps track of the companies/row nodes already seen on a growing search page and only parses
+        the html of rows appended since the last update
+        :param method: 'lxml' for compiled xpath selectors, 'bs4' for the BeautifulSoup reference path
+        :param parser: BeautifulSoup parser, only used when method == 'bs4'
+        """
+        self.method = method
+        self.parser = parser
+        self.rows = []
+        self.n_parsed_bytes = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        return self.rows[i]
+
+    def update(self, page):
+        """
+        scan page for row markers and parse the rows beyond the current offset
+        :param page: full page source
+        :return: total number of rows, raises ValueError if the page has no results container
+        """
+        m = RESULTS_MARKER.search(page)
+        if m is None:
+            raise ValueError('no results container on page')
+        markers = [x.start() for x in ROW_MARKER.finditer(page, m.start())]
+        if len(markers) <= len(self.rows):
+            return len(self.rows)
+
+        # parse from the start tag of the first new row on
+        tail = page[markers[len(self.rows)]:]
+        self.n_parsed_bytes += len(tail)
+
+        if self.method == 'bs4':
+            new_rows = BeautifulSoup(tail, self.parser)('div', attrs={'data-_tn': 'companies/row'})
+        else:
+            new_rows = X_ROWS(lxml.html.document_fromstring(tail))
+        self.rows.extend(new_rows[:len(markers) - len(self.rows)])
+        return len(self.rows)
+
+    def release(self, n):
+        """
+        drop the parsed nodes of rows before n once they are written, a parsed tail is freed when all its rows are
+        the row count is kept, so the offsets of later updates are unchanged
+        """
+        for i in range(min(n, len(self.rows))):
+            self.rows[i] = None
+
+    def al_link(self, i):
+        if self.method == 'bs4':
+            return self.rows[i].select('a.startup-link')[0]['href']
+        return X_STARTUP_LINK(self.rows[i])[0].get('href')
+
+    def extract(self, i, featured=None, signal_score=None):
+        if self.method == 'bs4':
+            return extract_row_soup(self.rows[i], featured, signal_score)
+        return extract_row_lxml(self.rows[i], featured, signal_score)
@@ -0,0 +1,41 @@
+from __future__ import print_function
+import hashlib
+
+ROOT_URL = 'https://angel.co/companies?'
+
+
+def canonical_params(url):
+    """
+    filter parameters of a search url, deduplicated and sorted
+    the empty segments left by the '' entries of the filter lists and by doubled '&' disappear, so a url and the
+    same url with '' filters appended map to the same query; parameters are kept exactly as they appear in the
+    url, neither decoded nor dropped when their value is blank ('stage=' stays), since that is what the site gets
+    :param url: search url, or just its query string
+    :return: tuple of 'name=value' strings
+    """
+    query = url.split('?', 1)[1] if '?' in url else url
+    return tuple(sorted(set(x for x in query.split('&') if x)))
+
+
+def canonical_url(url, root_url=ROOT_URL):
+    """
+    one url per query, whatever order the filters were appended in
+    """
+    params = canonical_params(url)
+    if '?' in url:
+        root_url = url.split('?', 1)[0] + '?'
+    return root_url + ''.join('&' + x for x in params)
+
+
+def base_fname(url):
+    """
+    file name of the results of a query, the same for every spelling of the query
+    """
+    return 'results_' + ''.join('_' + x for x in canonical_params(url)) + '.csv'
+
+
+def query_key(url):
+    """
+    short, path safe key of a query, for partitions and cache entries
+    """
+    return hashlib.sha1(canonical_url(url).encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,87 @@
+from __future__ import print_function
+import json
+import math
+import time
+import sqlite3
+import hashlib
+
+
+class BloomFilter:
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        """
+        :param capacity: number of keys the filter is sized for
+        :param error_rate: false positive rate at capacity
+        """
+        self.n_bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, int(round(self.n_bits / float(capacity) * math.log(2))))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+
+    def _positions(self, key):
+        # double hashing, k positions from two 64 bit halves of one digest
+        d = hashlib.md5(key.encode('utf-8')).digest()
+        h1 = int.from_bytes(d[:8], 'little')
+        h2 = int.from_bytes(d[8:], 'little') | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def add(self, key):
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+class SeenIndex:
+    def __init__(self, db_file, capacity=1000000, error_rate=0.001):
+        """
+        companies already crawled under any query, with their detail fields
+        a bloom filter in memory answers most lookups of new companies without touching the disk,
+        an exact sqlite store holds the details of known companies
+        :param db_file: sqlite file
+        :param capacity: expected number of companies, sizes the bloom filter
+        :param error_rate: bloom filter false positive rate
+        """
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file, timeout=60, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS companies (al_link TEXT PRIMARY KEY, details TEXT, ts REAL)')
+        self.conn.commit()
+
+        self.bloom = BloomFilter(capacity, error_rate)
+        for (al_link,) in self.conn.execute('SELECT al_link FROM companies'):
+            self.bloom.add(al_link)
+
+        self.n_lookups = 0
+        self.n_hits = 0
+        self.n_bloom_negatives = 0
+        self.n_false_positives = 0
+
+    def lookup(self, al_link):
+        """
+        :param al_link:
+        :return: dict of cached detail fields, or None if the company was not seen before
+        """
+        self.n_lookups += 1
+        if al_link not in self.bloom:
+            self.n_bloom_negatives += 1
+            return None
+        row = self.conn.execute('SELECT details FROM companies WHERE al_link = ?', (al_link,)).fetchone()
+        if row is None:
+            self.n_false_positives += 1
+            return None
+        self.n_hits += 1
+        return json.loads(row[0])
+
+    def add(self, al_link, details):
+        self.bloom.add(al_link)
+        self.conn.execute('INSERT OR REPLACE INTO companies VALUES (?, ?, ?)',
+                          (al_link, json.dumps(details), time.time()))
+        self.conn.commit()
+
+    def report(self):
+        hit_rate = self.n_hits / float(self.n_lookups) if self.n_lookups else 0.
+        return ('seen index: {} lookups, {} hits ({:.1%}) skipped detail work, {} answered by the bloom filter, '
+                '{} bloom false positives').format(self.n_lookups, self.n_hits, hit_rate, self.n_bloom_negatives,
+                                                   self.n_false_positives)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,60 @@
+from __future__ import print_function
+import os
+import time
+import fcntl
+import struct
+
+import metrics
+
+_STATE = struct.Struct('ddd')  # tokens, last refill time, requests granted
+
+
+class SharedRateBudget:
+    def __init__(self, state_file, requests_per_second=0.5, burst=1):
+        """
+        token bucket shared by every process on the host that opens the same state file
+        the bucket lives in a small file guarded by an exclusive lock, so the total request rate of all
+        workers stays bounded however many of them run
+        :param state_file:
+        :param requests_per_second: sustained rate over all processes
+        :param burst: bucket capacity
+        """
+        self.state_file = state_file
+        self.requests_per_second = float(requests_per_second)
+        self.burst = burst
+
+    def _update(self, take):
+        fd = os.open(self.state_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            data = os.read(fd, _STATE.size)
+            now = time.time()
+            if len(data) == _STATE.size:
+                tokens, last, n_granted = _STATE.unpack(data)
+            else:
+                tokens, last, n_granted = self.burst, now, 0
+            tokens = min(self.burst, tokens + (now - last) * self.requests_per_second)
+            if take:
+                # tokens go negative while requests are queued, each waits for its own refill
+                tokens -= 1
+                n_granted += 1
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, _STATE.pack(tokens, now, n_granted))
+        finally:
+            os.close(fd)  # releases the lock
+        return tokens, n_granted
+
+    def reserve(self):
+        """
+        take a token, returns how long the caller has to wait before sending its request
+        """
+        tokens, _ = self._update(take=True)
+        return 0. if tokens >= 0 else -tokens / self.requests_per_second
+
+    def acquire(self):
+        wait = self.reserve()
+        metrics.observe('budget_wait', wait)
+        time.sleep(wait)
+
+    def n_granted(self):
+        return int(self._update(take=False)[1])
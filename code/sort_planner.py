@@ -0,0 +1,181 @@
+from __future__ import print_function
+import time
+import sqlite3
+import datetime
+
+import metrics
+
+
+class SortPass:
+    def __init__(self, planner, url, sort_key, n_known, follow_up):
+        """
+        yield of one sort pass, click by click
+        :param planner: SortPassPlanner
+        :param url: search url
+        :param sort_key:
+        :param n_known: companies of the query collected earlier in the same crawl
+        :param follow_up: another sort pass of the query already finished in the same crawl
+        """
+        self.planner = planner
+        self.url = url
+        self.sort_key = sort_key
+        self.n_known = n_known
+        self.follow_up = follow_up
+        self.clicks = []  # (rows, new rows) per click
+        self.stopped_early = False
+
+    def record(self, links):
+        """
+        :param links: al_links of the rows added by one click
+        :return: number of links new to the query
+        """
+        n_new = self.planner.add_links(self.url, links)
+        self.clicks.append((len(links), n_new))
+        metrics.inc('sort_pass_rows', len(links), sort=self.sort_key)
+        metrics.inc('sort_pass_new', n_new, sort=self.sort_key)
+        return n_new
+
+    def recent_yield(self):
+        recent = self.clicks[-self.planner.window:]
+        n_rows = sum(x[0] for x in recent)
+        return sum(x[1] for x in recent) / float(n_rows) if n_rows else 0.
+
+    def should_stop(self):
+        """
+        True once the last clicks of a follow-up pass mostly returned companies the query already has
+        the first pass of a query in a crawl is never cut, nor is the retry of a pass that failed
+        """
+        if not self.follow_up or len(self.clicks) < max(self.planner.min_clicks, self.planner.window):
+            return False
+        self.stopped_early = self.recent_yield() < self.planner.min_yield
+        return self.stopped_early
+
+    def finish(self, company_count):
+        """
+        store the yield of the pass and report the coverage of the query against the clicks spent on it
+        :param company_count: companies matching the query, as counted by the site
+        :return: report line
+        """
+        n_rows = sum(x[0] for x in self.clicks)
+        n_new = sum(x[1] for x in self.clicks)
+        self.planner.record_pass(self, n_rows, n_new)
+        if self.stopped_early:
+            metrics.inc('sort_pass_early_stops', sort=self.sort_key)
+        n_covered, n_passes, n_clicks = self.planner.query_totals(self.url)
+        return ('sort={}: {} new of {} rows in {} clicks{}, query coverage {}/{} companies ({:.0%}) '
+                'after {} passes and {} clicks'.format(
+                    self.sort_key, n_new, n_rows, len(self.clicks), ', stopped early' if self.stopped_early else '',
+                    n_covered, company_count, n_covered / float(company_count) if company_count else 0.,
+                    n_passes, n_clicks))
+
+
+class SortPassPlanner:
+    def __init__(self, db_file, window=3, min_yield=0.1, min_clicks=3, prior_yield=0.5, prior_rows=100,
+                 crawl_date=None):
+        """
+        decides the order of the sort passes of a query and when a pass stops being worth its clicks
+        the companies of every query are kept, so each click of a later pass is scored by how many of its rows
+        are new to the query; the yield of the follow-up passes of each sort key decides the order of the keys
+        :param db_file: sqlite file, shared by the workers of a sharded crawl
+        :param window: clicks the recent yield is averaged over
+        :param min_yield: a follow-up pass stops when less than this fraction of its recent rows are new
+        :param min_clicks: clicks a follow-up pass makes before it may stop
+        :param prior_yield: assumed yield of a sort key without history, optimistic so that every key gets tried
+        :param prior_rows: weight of the prior, in rows
+        :param crawl_date: passes and companies are counted per crawl, so a rerun or a resumed crawl starts the
+            coverage of every query over, defaults to today
+        """
+        self.db_file = db_file
+        self.window = window
+        self.min_yield = min_yield
+        self.min_clicks = min_clicks
+        self.prior_yield = prior_yield
+        self.prior_rows = prior_rows
+        self.crawl_date = str(datetime.date.today() if crawl_date is None else crawl_date)
+
+        self.conn = sqlite3.connect(db_file, timeout=60, check_same_thread=False)
+        # companies of every query over all crawls, for the query cover, and per crawl, for the yield of a pass
+        self.conn.execute('CREATE TABLE IF NOT EXISTS query_links (url TEXT, al_link TEXT, PRIMARY KEY (url, al_link))')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS crawl_links (crawl_date TEXT, url TEXT, al_link TEXT, '
+                          'PRIMARY KEY (crawl_date, url, al_link))')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS passes (url TEXT, sort_key TEXT, follow_up INTEGER, '
+                          'clicks INTEGER, rows INTEGER, new INTEGER, stopped_early INTEGER, ts REAL)')
+        if 'crawl_date' not in [x[1] for x in self.conn.execute('PRAGMA table_info(passes)')]:
+            self.conn.execute('ALTER TABLE passes ADD COLUMN crawl_date TEXT')
+        self.conn.commit()
+
+    def sort_yield(self, sort_key):
+        """
+        share of new companies in the rows of follow-up passes of sort_key, shrunk towards the prior
+        """
+        n_rows, n_new = self.conn.execute('SELECT COALESCE(SUM(rows), 0), COALESCE(SUM(new), 0) FROM passes '
+                                          'WHERE sort_key = ? AND follow_up = 1', (sort_key,)).fetchone()
+        return (n_new + self.prior_yield * self.prior_rows) / float(n_rows + self.prior_rows)
+
+    def order(self, sort_keys):
+        """
+        the first key stays first: it collects the bulk of the query whatever it is and the default
+        'signal' order needs no sort click, the follow-up keys go by their yield so far
+        """
+        if len(sort_keys) < 3:
+            return list(sort_keys)
+        return sort_keys[:1] + sorted(sort_keys[1:], key=lambda k: -self.sort_yield(k))
+
+    def start_pass(self, url, sort_key):
+        n_known = self.conn.execute('SELECT COUNT(*) FROM crawl_links WHERE crawl_date = ? AND url = ?',
+                                    (self.crawl_date, url)).fetchone()[0]
+        n_other_passes = self.conn.execute('SELECT COUNT(*) FROM passes WHERE crawl_date = ? AND url = ? '
+                                           'AND sort_key != ?', (self.crawl_date, url, sort_key)).fetchone()[0]
+        return SortPass(self, url, sort_key, n_known, follow_up=n_known > 0 and n_other_passes > 0)
+
+    def add_links(self, url, links):
+        """
+        :return: number of links not collected for url earlier in the crawl
+        """
+        self.conn.executemany('INSERT OR IGNORE INTO query_links VALUES (?, ?)', [(url, x) for x in links])
+        n_before = self.conn.total_changes
+        self.conn.executemany('INSERT OR IGNORE INTO crawl_links VALUES (?, ?, ?)',
+                              [(self.crawl_date, url, x) for x in links])
+        n_new = self.conn.total_changes - n_before
+        self.conn.commit()
+        return n_new
+
+    def record_pass(self, sort_pass, n_rows, n_new):
+        self.conn.execute('INSERT INTO passes (url, sort_key, follow_up, clicks, rows, new, stopped_early, ts, '
+                          'crawl_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                          (sort_pass.url, sort_pass.sort_key, int(sort_pass.follow_up), len(sort_pass.clicks),
+                           n_rows, n_new, int(sort_pass.stopped_early), time.time(), self.crawl_date))
+        self.conn.commit()
+
+    def query_totals(self, url):
+        """
+        :return: (companies collected, passes run, clicks spent) for url in this crawl
+        """
+        n_covered = self.conn.execute('SELECT COUNT(*) FROM crawl_links WHERE crawl_date = ? AND url = ?',
+                                      (self.crawl_date, url)).fetchone()[0]
+        n_passes, n_clicks = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(clicks), 0) FROM passes '
+                                               'WHERE crawl_date = ? AND url = ?', (self.crawl_date, url)).fetchone()
+        return n_covered, n_passes, n_clicks
+
+    def links_by_url(self):
+        """
+        companies collected so far, per query
+        :return: dict url -> set of al_links
+        """
+        links = dict()
+        for url, al_link in self.conn.execute('SELECT url, al_link FROM query_links'):
+            links.setdefault(url, set()).add(al_link)
+        return links
+
+    def report(self):
+        rows = self.conn.execute('SELECT sort_key, COUNT(*), SUM(clicks), SUM(rows), SUM(new), SUM(stopped_early) '
+                                 'FROM passes WHERE follow_up = 1 GROUP BY sort_key ORDER BY sort_key').fetchall()
+        if not rows:
+            return 'sort planner: no follow-up passes yet'
+        return 'sort planner, follow-up passes: ' + ', '.join(
+            '{}: {} passes, {} clicks, {}/{} rows new ({:.0%}), {} stopped early'.format(
+                k, n, clicks, new, n_rows, new / float(n_rows) if n_rows else 0., stops)
+            for k, n, clicks, n_rows, new, stops in rows)
+
+    def close(self):
+        self.conn.close()
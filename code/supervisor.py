@@ -0,0 +1,173 @@
+from __future__ import print_function
+import os
+import time
+import socket
+import argparse
+import multiprocessing
+
+import AngelScraper as AS
+import frontier
+import shared_budget
+
+
+def worker_main(worker_id, frontier_file, budget_file, requests_per_second, burst, scraper_kwargs):
+    """
+    one crawl worker: its own scraper and browser, drawing jobs from the shared frontier
+    and requests from the shared budget
+    """
+    AS.request_budget = shared_budget.SharedRateBudget(budget_file, requests_per_second, burst)
+    a = AS.AngelScraper(**scraper_kwargs)
+    fr = frontier.Frontier(frontier_file)
+    try:
+        a.crawl_frontier(fr, worker_id=worker_id)
+    finally:
+        fr.close()
+        a.close()
+
+
+class Supervisor:
+    def __init__(self, frontier_file, budget_file, n_workers=4, requests_per_second=0.5, burst=1,
+                 max_restarts=5, restart_backoff=30, report_seconds=60, scraper_kwargs=None):
+        """
+        runs the frontier with n_workers processes, restarts workers that crash and reports progress
+        the total request rate is bounded by the shared budget, so adding workers shortens a sweep
+        without hitting the site any harder: a worker sitting in a long pause no longer stalls the others
+        :param frontier_file: sqlite file of the frontier, filled before the workers start
+        :param budget_file: state file of the shared request budget
+        :param n_workers:
+        :param requests_per_second: over all workers
+        :param burst:
+        :param max_restarts: per worker slot
+        :param restart_backoff: seconds before a crashed worker is restarted, doubled on every restart
+        :param report_seconds: interval of the progress report
+        :param scraper_kwargs: passed to AngelScraper in every worker
+        """
+        self.frontier_file = frontier_file
+        self.budget_file = budget_file
+        self.n_workers = n_workers
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_restarts = max_restarts
+        self.restart_backoff = restart_backoff
+        self.report_seconds = report_seconds
+        self.scraper_kwargs = scraper_kwargs or dict()
+
+        # spawned, not forked: workers must not share the parent's sqlite connections or browser sessions
+        self.ctx = multiprocessing.get_context('spawn')
+        self.frontier = frontier.Frontier(frontier_file)
+        self.budget = shared_budget.SharedRateBudget(budget_file, requests_per_second, burst)
+
+        self.slots = []  # per slot: dict(process, worker_id, restarts, restart_at)
+        self.n_crashes = 0
+        self.n_requests_start = 0
+
+    def _start(self, i):
+        slot = self.slots[i]
+        slot['worker_id'] = '{}-w{}-r{}'.format(socket.gethostname(), i, slot['restarts'])
+        slot['process'] = self.ctx.Process(target=worker_main, name=slot['worker_id'], args=(
+            slot['worker_id'], self.frontier_file, self.budget_file, self.requests_per_second, self.burst,
+            dict(self.scraper_kwargs, worker='w{}'.format(i))))
+        slot['process'].start()
+        slot['restart_at'] = None
+        AS.log_time('info')
+        print('started worker {} (pid {})'.format(slot['worker_id'], slot['process'].pid))
+
+    def _work_left(self):
+        stats = self.frontier.stats()
+        return stats.get(frontier.PENDING, 0) + stats.get(frontier.LEASED, 0) > 0
+
+    def _check(self, i):
+        """
+        :return: True while the slot is running or waiting for a restart
+        """
+        slot = self.slots[i]
+        p = slot['process']
+        if p is not None and p.is_alive():
+            return True
+        if p is not None:
+            p.join()
+            slot['process'] = None
+            if p.exitcode == 0:
+                return False  # the frontier was drained
+            self.n_crashes += 1
+            n_released = self.frontier.release_worker(slot['worker_id'],
+                                                      error='worker exited with {}'.format(p.exitcode))
+            AS.log_time('error')
+            print('worker {} exited with {}, {} leased jobs released'.format(slot['worker_id'], p.exitcode,
+                                                                             n_released))
+            if slot['restarts'] >= self.max_restarts or not self._work_left():
+                return False
+            slot['restart_at'] = time.time() + self.restart_backoff * 2 ** slot['restarts']
+            slot['restarts'] += 1
+        if slot['restart_at'] is not None and time.time() >= slot['restart_at']:
+            self._start(i)
+        return True
+
+    def report(self, t0, n_done_start):
+        stats = self.frontier.stats()
+        n_done = stats.get(frontier.DONE, 0)
+        n_left = stats.get(frontier.PENDING, 0) + stats.get(frontier.LEASED, 0)
+        elapsed = time.time() - t0
+        rate = (n_done - n_done_start) / elapsed if elapsed > 0 else 0.
+        eta = '{:.0f}min'.format(n_left / rate / 60) if rate > 0 else 'unknown'
+        n_alive = sum(1 for s in self.slots if s['process'] is not None and s['process'].is_alive())
+        n_requests = self.budget.n_granted()
+        AS.log_time('highlight')
+        print('progress: {} done, {} left, {} failed, {:.2f} jobs/min, eta {}, {}/{} workers alive, '
+              '{} crashes, {} requests ({:.2f}/s)'.format(
+                  n_done, n_left, stats.get(frontier.FAILED, 0), rate * 60, eta, n_alive, len(self.slots),
+                  self.n_crashes, n_requests, (n_requests - self.n_requests_start) / elapsed if elapsed else 0.))
+
+    def run(self):
+        t0 = time.time()
+        n_done_start = self.frontier.stats().get(frontier.DONE, 0)
+        self.n_requests_start = self.budget.n_granted()
+        self.slots = [dict(process=None, worker_id=None, restarts=0, restart_at=None) for _ in range(self.n_workers)]
+        for i in range(self.n_workers):
+            self._start(i)
+
+        last_report = time.time()
+        while True:
+            running = [self._check(i) for i in range(len(self.slots))]
+            if not any(running):
+                break
+            if time.time() - last_report >= self.report_seconds:
+                self.report(t0, n_done_start)
+                last_report = time.time()
+            time.sleep(1)
+
+        self.report(t0, n_done_start)
+        self.frontier.report()
+
+
+def run_sharded(a, n_workers=4, requests_per_second=0.5, burst=1, **kwargs):
+    """
+    crawl a.url_df with n_workers processes sharing one request budget
+    :param a: AngelScraper with url_df loaded
+    :param n_workers:
+    :param requests_per_second: over all workers
+    :param burst:
+    :param kwargs: passed to Supervisor
+    """
+    fr = a.open_frontier(enqueue=True)
+    fr.close()
+    budget_file = os.path.join(a.output_dir, 'request_budget.state')
+    AS.request_budget = shared_budget.SharedRateBudget(budget_file, requests_per_second, burst)
+    kwargs.setdefault('scraper_kwargs', dict(working_dir=a.working_dir, output_dir=a.output_dir))
+    s = Supervisor(fr.db_file, budget_file, n_workers=n_workers, requests_per_second=requests_per_second,
+                   burst=burst, **kwargs)
+    s.run()
+    return s
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='crawl the url list of today with several worker processes')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rps', type=float, default=0.5, help='requests per second over all workers')
+    parser.add_argument('--burst', type=int, default=1)
+    args = parser.parse_args()
+
+    scraper = AS.AngelScraper()
+    scraper.generate_url_list_of_search_pages(use_existing_url_list=True)
+    run_sharded(scraper, n_workers=args.workers, requests_per_second=args.rps, burst=args.burst)
+    scraper.close()
@@ -0,0 +1,53 @@
+import os
+import sys
+import datetime
+
+import pytest
+
+# the scraper modules sit side by side in code/ and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench_server  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def server():
+    """
+    local stand-in of the search and company pages, no request reaches angel.co
+    """
+    srv = bench_server.BenchServer(n_companies=2000).start()
+    yield srv
+    srv.stop()
+
+
+@pytest.fixture
+def no_pacing(monkeypatch):
+    import AngelScraper as AS
+    monkeypatch.setattr(AS, 'pause_scale', 0.)
+
+
+def rows_page(companies, base_url):
+    """
+    search page holding every row of companies, the way page_source looks after enough clicks on "more"
+    """
+    return ('<html><body><div class="results">{}{}</div></body></html>'.format(
+        bench_server.render_header_row(), ''.join(bench_server.render_row(c, base_url) for c in companies)))
+
+
+def expected_entry(c, base_url):
+    """
+    entry dict of a company of the stand-in, as the scraper has always built it
+    """
+    entry = dict(featured=None, score=None, title=c['title'].encode('ascii', errors='replace'),
+                 al_link='{}/{}'.format(base_url, c['slug']), signal=str(int(c['signal'])),
+                 joined_date=datetime.datetime(c['joined'].year, c['joined'].month, 1),
+                 location=c['location'], market=c['market'], size=c['size'], stage=c['stage'])
+    if c['website']:
+        entry['website'] = c['website']
+    if c['raised']:
+        entry['raised'] = float(c['raised'])
+    return entry
+
+
+def extract_all(results, n_rows):
+    return [results.extract(i) for i in range(1, n_rows)]
@@ -0,0 +1,51 @@
+from bs4 import BeautifulSoup
+
+import bench_server
+import browser_rows
+from conftest import rows_page, expected_entry, extract_all
+
+BASE_URL = 'http://127.0.0.1:1'
+
+
+class SoupDriver:
+    """
+    runs the row extraction script of browser_rows with the same css selectors on a static page
+    """
+    def __init__(self, page):
+        self.soup = BeautifulSoup(page, 'lxml')
+
+    def execute_script(self, script, offset, selector):
+        assert script == browser_rows.EXTRACT_ROWS_JS
+        if self.soup.select_one('div.results') is None:
+            return None
+
+        def attr(el, name):
+            return None if el is None else el.get(name)
+
+        def text(el):
+            return None if el is None else el.get_text()
+
+        rows = self.soup.select(selector)
+        out = []
+        for r in rows[offset:]:
+            link = r.select_one('a.startup-link')
+            signal = r.select_one('div.column.signal')
+            out.append([attr(link, 'title'), attr(link, 'href'),
+                        attr(None if signal is None else signal.select_one('img'), 'alt'),
+                        text(r.select_one('div.column.joined > div.value')),
+                        text(r.select_one('div.column.location div.tag')),
+                        text(r.select_one('div.column.market div.tag')),
+                        attr(r.select_one('div.column.website a'), 'href'),
+                        text(r.select_one('div.column.company_size div.value')),
+                        text(r.select_one('div.column.stage div.value')),
+                        text(r.select_one('div.column.raised div.value'))])
+        return dict(n=len(rows), rows=out)
+
+
+def test_browser_rows_match_soup():
+    companies = bench_server.make_universe(60, seed=3)
+    page = rows_page(companies, BASE_URL)
+    results = browser_rows.BrowserRowExtractor(SoupDriver(page))
+    assert results.update() == len(companies) + 1
+    assert browser_rows.compare_with_soup(results, page) == []
+    assert extract_all(results, len(results)) == [expected_entry(c, BASE_URL) for c in companies]
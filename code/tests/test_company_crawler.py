@@ -0,0 +1,25 @@
+import company_crawler
+import metrics
+
+
+def test_failing_fetch_leaves_out_only_its_page():
+    urls = ['http://127.0.0.1:1/c{}'.format(i) for i in range(6)]
+    saved = []
+
+    def fetch(url):
+        if url.endswith('c2'):
+            raise RuntimeError('browser did not start')
+        return 'page of ' + url
+
+    def save(url, page):
+        if url.endswith('c4'):
+            raise IOError('disk full')
+        saved.append(url)
+
+    key = ('errors', metrics._label_key(dict(stage='company_fetch', type='RuntimeError')))
+    n_errors = metrics.REGISTRY.counters.get(key, 0)
+    budget = company_crawler.PolitenessBudget(requests_per_second=None, max_in_flight=3, jitter_seconds=0.)
+    pages = company_crawler.crawl_company_pages(urls, fetch, save=save, budget=budget)
+    assert sorted(pages) == [u for u in urls if not u.endswith(('c2', 'c4'))]
+    assert sorted(saved) == sorted(pages)
+    assert metrics.REGISTRY.counters[key] == n_errors + 1
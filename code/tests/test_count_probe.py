@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import AngelScraper as AS
+
+
+class StubBackend:
+    name = 'stub'
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def fetch(self, url):
+        return self.pages.get(url)
+
+
+@pytest.fixture
+def scraper(tmpdir, no_pacing):
+    a = AS.AngelScraper(output_dir=str(tmpdir), skip_location_filter=True, skip_signal_filter=True,
+                        skip_featured_filter=True)
+    yield a
+    a.close()
+
+
+def test_page_without_count_takes_the_failure_path(scraper, monkeypatch):
+    url = scraper.canonical_url(scraper.root_url + 'stage=Seed')
+    scraper.fetch_backends['selenium'] = StubBackend({url: '<html><body>captcha</body></html>'})
+    failures = []
+    monkeypatch.setattr(AS.pacer, 'failure', failures.append)
+
+    assert scraper.get_company_count_on_search_page(target_url=url) == 0
+    assert failures == ['count_parse']
+    assert [x for x in os.listdir(scraper.debug_dir) if x.startswith('failed_')]
+    # the failure is remembered with the count the probe returned
+    assert scraper.count_cache.get(url) == (True, 0)
+
+
+def test_failed_probes_are_left_out_of_the_url_list(scraper):
+    # nothing can be fetched, every probe fails and is remembered as failed
+    scraper.fetch_backends['selenium'] = StubBackend({})
+    scraper.generate_url_list_of_search_pages()
+    assert len(scraper.url_df) == 0
+    url = scraper.canonical_url(scraper.root_url + '&signal[min]=7&signal[max]=8')
+    assert scraper.count_cache.get(url) == (True, None)
+    # the remembered failure is skipped the same way on the next plan
+    scraper.generate_url_list_of_search_pages()
+    assert len(scraper.url_df) == 0
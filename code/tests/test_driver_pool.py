@@ -0,0 +1,54 @@
+import sys
+import threading
+
+import driver_pool
+
+
+class StubDriver:
+    current_url = 'about:blank'
+
+    def __init__(self):
+        self.n_borrowed = 0
+
+    def execute_script(self, script):
+        pass
+
+    def delete_all_cookies(self):
+        pass
+
+    def get(self, url):
+        pass
+
+    def quit(self):
+        pass
+
+
+def test_concurrent_checkouts_keep_use_counts():
+    pool = driver_pool.DriverPool(size=3, max_uses=7, driver_factory=StubDriver)
+    n_threads, n_rounds = 8, 200
+
+    def borrow():
+        for i in range(n_rounds):
+            dr = pool.checkout()
+            dr.n_borrowed += 1
+            pool.checkin(dr, broken=i % 50 == 49)
+
+    # switch threads as often as possible, so that unlocked updates get interleaved
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    threads = [threading.Thread(target=borrow) for _ in range(n_threads)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert pool.n_checkouts == n_threads * n_rounds
+    assert pool._n_live == len(pool._idle)
+    # only live drivers have a use count, and it counts every time the driver was borrowed
+    assert pool._uses == dict((id(dr), dr.n_borrowed) for dr in pool._idle)
+    assert pool.n_recycled + pool.n_crashed == pool.n_launches - len(pool._idle)
+    pool.close()
+    assert pool._uses == dict()
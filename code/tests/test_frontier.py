@@ -0,0 +1,98 @@
+import time
+
+import AngelScraper as AS
+import frontier
+
+
+def make_frontier(tmpdir, n_jobs=3, **kwargs):
+    fr = frontier.Frontier(str(tmpdir.join('frontier.sqlite')), **kwargs)
+    fr.add_jobs([dict(url='u{}'.format(i), company_count=10) for i in range(n_jobs)], lambda n: ['signal'])
+    return fr
+
+
+def test_jobs_are_leased_once_and_completed(tmpdir):
+    fr = make_frontier(tmpdir)
+    jobs = [fr.lease('a'), fr.lease('b'), fr.lease('a')]
+    assert sorted(x[1]['url'] for x in jobs) == ['u0', 'u1', 'u2']
+    assert fr.lease('b') is None
+    for job_id, _, _ in jobs:
+        fr.complete(job_id, 'a')
+    # complete only counts for the lease owner
+    assert fr.stats() == {frontier.DONE: 2, frontier.LEASED: 1}
+
+
+def test_expired_lease_is_taken_over(tmpdir):
+    fr = make_frontier(tmpdir, n_jobs=1, lease_seconds=0.2)
+    job_id = fr.lease('a')[0]
+    assert fr.lease('b') is None
+    time.sleep(0.3)
+    assert fr.lease('b')[0] == job_id
+    assert not fr.heartbeat(job_id, 'a')
+    assert fr.heartbeat(job_id, 'b')
+
+
+def test_heartbeat_keeps_the_lease(tmpdir):
+    fr = make_frontier(tmpdir, n_jobs=1, lease_seconds=0.3)
+    job_id = fr.lease('a')[0]
+    for _ in range(5):
+        time.sleep(0.1)
+        assert fr.heartbeat(job_id, 'a')
+        assert fr.lease('b') is None
+
+
+def test_job_fails_after_max_attempts(tmpdir):
+    fr = make_frontier(tmpdir, n_jobs=1, max_attempts=2)
+    for _ in range(2):
+        job_id = fr.lease('a')[0]
+        fr.fail(job_id, 'a', error='boom')
+    assert fr.lease('a') is None
+    assert fr.stats() == {frontier.FAILED: 1}
+
+
+class StubScraper:
+    """
+    stands in for AngelScraper in crawl_frontier, each sort pass takes n_clicks clicks of click_seconds
+    """
+    def __init__(self, n_clicks=3, click_seconds=0.1):
+        self.n_clicks = n_clicks
+        self.click_seconds = click_seconds
+        self.n_heartbeats = 0
+        self.urls = []
+
+    def parse_one_sort_pass(self, url_dict, click_sort, heartbeat=None):
+        for _ in range(self.n_clicks):
+            self.n_heartbeats += 1
+            if not heartbeat():
+                return None
+            time.sleep(self.click_seconds)
+        self.urls.append(url_dict['url'])
+        return True
+
+
+def test_crawl_outlasts_the_lease_with_heartbeats(tmpdir):
+    fr = make_frontier(tmpdir, n_jobs=2, lease_seconds=0.2)
+    scraper = StubScraper(n_clicks=4, click_seconds=0.1)
+    AS.AngelScraper.crawl_frontier(scraper, fr, worker_id='a', poll_seconds=0.1)
+    assert scraper.n_heartbeats == 8
+    assert sorted(scraper.urls) == ['u0', 'u1']
+    assert fr.stats() == {frontier.DONE: 2}
+
+
+def test_crawl_waits_for_leases_of_a_dead_run(tmpdir):
+    fr = make_frontier(tmpdir, n_jobs=2, lease_seconds=0.3)
+    fr.lease('dead')  # leased by a run that never comes back
+    scraper = StubScraper(n_clicks=1, click_seconds=0.)
+    AS.AngelScraper.crawl_frontier(scraper, fr, worker_id='a', poll_seconds=0.1)
+    assert sorted(scraper.urls) == ['u0', 'u1']
+    assert fr.stats() == {frontier.DONE: 2}
+
+
+def test_lost_lease_abandons_the_pass(tmpdir):
+    fr = make_frontier(tmpdir, n_jobs=1)
+    job_id = fr.lease('a')[0]
+    fr.release_worker('a')
+    other = fr.lease('b')[0]
+    assert other == job_id
+    assert not fr.heartbeat(job_id, 'a')
+    fr.complete(job_id, 'a')  # a no-op for a worker that lost the lease
+    assert fr.stats() == {frontier.LEASED: 1}
@@ -0,0 +1,24 @@
+import time
+
+import AngelScraper as AS
+import pacing
+
+
+def test_max_wait_caps_every_wait():
+    pacer = pacing.AIMDPacer(initial_rate=0.02, floor=0.02, jitter=0., max_wait=30.)
+    waits = [pacer.reserve() for _ in range(5)]
+    assert waits[0] == 0.
+    assert all(w <= 30. for w in waits)
+
+
+def test_long_pacing_wait_renews_the_lease(monkeypatch):
+    monkeypatch.setattr(AS, 'pacer', pacing.AIMDPacer(initial_rate=2., jitter=0.))
+    monkeypatch.setattr(AS, 'pause_scale', 1.)
+    monkeypatch.setattr(AS, 'heartbeat_seconds', 0.05)
+    beats = []
+    monkeypatch.setattr(AS, 'lease_heartbeat', lambda: beats.append(time.time()) or True)
+    AS.throttle()  # the first request goes out right away
+    t0 = time.time()
+    AS.throttle()  # the second waits half a second
+    assert time.time() - t0 >= 0.45
+    assert len(beats) >= 5
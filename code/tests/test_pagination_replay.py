@@ -0,0 +1,62 @@
+import benchmark
+import pagination_replay
+import row_extractor
+
+
+def replay(url, pages):
+    """
+    rows of a search page paged through by replaying the request of the first click
+    """
+    xhr_url = url.replace('/companies?', '/companies/more?') + '&page=2&per_page=20&sort=signal'
+    events = [('Network.requestWillBeSent', dict(type='XHR', request=dict(
+        url=xhr_url, method='GET', headers={'X-Requested-With': 'XMLHttpRequest'})))]
+    request = pagination_replay.find_pagination_request(events, url)
+    assert request is not None and request['page_param'] == 'page'
+
+    results = row_extractor.IncrementalRowExtractor()
+    n = results.update(pages[1])
+    pager = pagination_replay.ReplayPager(request, pages[1], n, referer=url)
+    try:
+        while not pager.last_page:
+            page = pager.fetch_next()
+            assert page is not None
+            results.update(page)
+    finally:
+        pager.close()
+    return results
+
+
+def test_replay_rows_match_click_rows(server, no_pacing):
+    n_checked = 0
+    for url in benchmark.search_urls(server.base_url, 6):
+        pages = benchmark.loaded_page(server.base_url, url, n_clicks=25)
+        if len(pages) < 3:
+            continue
+        clicked = row_extractor.IncrementalRowExtractor()
+        n_rows = clicked.update(pages[-1])
+        replayed = replay(url, pages)
+        assert len(replayed) == n_rows
+        assert [replayed.extract(i) for i in range(1, n_rows)] == [clicked.extract(i) for i in range(1, n_rows)]
+        n_checked += 1
+    assert n_checked > 0
+
+
+def test_replay_request_error_returns_none(no_pacing):
+    request = dict(url='http://127.0.0.1:9/companies/more?page=2', method='GET', headers={}, post_data=None,
+                   page_param='page')
+    pager = pagination_replay.ReplayPager(request, '<html><body></body></html>', 1, timeout=2)
+    try:
+        assert pager.fetch_next() is None
+    finally:
+        pager.close()
+
+
+def test_replay_answered_with_a_whole_page_returns_none(server, no_pacing):
+    # the search page itself stands in for the login page an expired session gets
+    request = dict(url=server.base_url + '/companies?page=2', method='GET', headers={}, post_data=None,
+                   page_param='page')
+    pager = pagination_replay.ReplayPager(request, '<html><body></body></html>', 1)
+    try:
+        assert pager.fetch_next() is None
+    finally:
+        pager.close()
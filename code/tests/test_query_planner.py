@@ -0,0 +1,51 @@
+import random
+from urllib.parse import urlparse, parse_qsl
+
+import query_planner
+
+ROOT_URL = 'http://127.0.0.1:1/companies?'
+STAGES = ['Seed', 'Series+A', 'Series+B', 'Acquired']
+
+
+def make_companies(n, share_unraised, seed):
+    rnd = random.Random(seed)
+    return [dict(id=i, signal=rnd.uniform(0, 10), stage=rnd.choice(STAGES),
+                 raised=None if rnd.random() < share_unraised else 10 ** rnd.uniform(3, 9))
+            for i in range(n)]
+
+
+def matches(c, url):
+    """
+    filters of a search url as the site applies them, a range matches no company without a value
+    """
+    for k, v in parse_qsl(urlparse(url).query):
+        if k.endswith('[min]') or k.endswith('[max]'):
+            x = c[k[:-5]]
+            if x is None or (x < float(v) if k.endswith('[min]') else x >= float(v)):
+                return False
+        elif k == 'stage' and c['stage'] != v.replace(' ', '+'):
+            return False
+    return True
+
+
+def plan(companies, categorical_dims):
+    numeric_dims = [query_planner.NumericDimension('signal', 0, 10, min_width=0.5),
+                    query_planner.NumericDimension('raised', 0, 1000000000000000, min_width=50000,
+                                                   log_scale=True, integer=True)]
+    planner = query_planner.AdaptivePlanner(ROOT_URL, lambda url: sum(matches(c, url) for c in companies),
+                                            numeric_dims, categorical_dims)
+    return planner.plan()
+
+
+def test_leaves_partition_the_root_when_every_company_has_a_value():
+    companies = make_companies(3000, 0., seed=1)
+    url_list = plan(companies, [])
+    assert all(x['company_count'] <= 400 for x in url_list)
+    assert sum(x['company_count'] for x in url_list) == len(companies)
+
+
+def test_companies_without_a_value_stay_covered():
+    companies = make_companies(3000, 0.3, seed=2)
+    url_list = plan(companies, [('stage', ['&stage={}'.format(x) for x in STAGES])])
+    covered = set(c['id'] for x in url_list for c in companies if matches(c, x['url']))
+    assert covered == set(c['id'] for c in companies)
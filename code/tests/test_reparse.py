@@ -0,0 +1,17 @@
+import page_store
+import reparse
+import search_query
+
+URL = search_query.canonical_url('http://127.0.0.1:1/companies?signal[min]=1&signal[max]=2')
+
+
+def test_latest_run_wins_over_an_older_run_that_got_further(tmpdir):
+    store = page_store.PageStore(str(tmpdir))
+    for run, n_clicks in [(None, 4), ('20260101_120000_w0', 5), ('20260301_090000_w1', 3)]:
+        for click in range(1, n_clicks + 1):
+            store.put(page_store.index_page_key(URL, 'signal', click, run), '{} {}'.format(run, click), kind='index')
+    store.put(page_store.index_page_key(URL, 'joined', 2, '20260101_120000_w0'), 'joined', kind='index')
+    latest = reparse.find_latest_index_pages(store)
+    store.close()
+    assert latest == {(URL, 'signal'): page_store.index_page_key(URL, 'signal', 3, '20260301_090000_w1'),
+                      (URL, 'joined'): page_store.index_page_key(URL, 'joined', 2, '20260101_120000_w0')}
@@ -0,0 +1,45 @@
+import bench_server
+import row_extractor
+from conftest import rows_page, expected_entry, extract_all
+
+BASE_URL = 'http://127.0.0.1:1'
+
+
+def test_lxml_rows_match_soup_and_original_entries():
+    companies = bench_server.make_universe(200, seed=1)
+    page = rows_page(companies, BASE_URL)
+
+    lxml_results = row_extractor.IncrementalRowExtractor(method='lxml')
+    soup_results = row_extractor.IncrementalRowExtractor(method='bs4')
+    n_rows = lxml_results.update(page)
+    assert n_rows == len(companies) + 1
+    assert soup_results.update(page) == n_rows
+
+    lxml_entries = extract_all(lxml_results, n_rows)
+    assert lxml_entries == extract_all(soup_results, n_rows)
+    assert lxml_entries == [expected_entry(c, BASE_URL) for c in companies]
+
+
+def test_incremental_updates_parse_only_new_rows():
+    companies = bench_server.make_universe(100, seed=2)
+    results = row_extractor.IncrementalRowExtractor()
+    entries = []
+    for n in range(20, 101, 20):
+        page = rows_page(companies[:n], BASE_URL)
+        start_row = len(results) or 1
+        n_rows = results.update(page)
+        entries.extend(results.extract(i) for i in range(start_row, n_rows))
+        results.release(n_rows)
+    assert entries == [expected_entry(c, BASE_URL) for c in companies]
+    # the page grew by 20 rows a click, each update parsed the tail from the first new row only
+    assert results.n_parsed_bytes < 2 * len(rows_page(companies, BASE_URL))
+
+
+def test_page_without_results_container_raises():
+    results = row_extractor.IncrementalRowExtractor()
+    try:
+        results.update('<html><body>captcha</body></html>')
+    except ValueError:
+        pass
+    else:
+        assert False, 'expected ValueError'
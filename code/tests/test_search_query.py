@@ -0,0 +1,67 @@
+import count_cache
+import query_planner
+import search_query
+
+ROOT = 'https://angel.co/companies?'
+
+
+def test_filter_order_and_empty_filters_do_not_matter():
+    a = ROOT + '&markets[]=Education&stage[]=Seed&raised[min]=1&raised[max]=400000'
+    b = ROOT + '&raised[min]=1&stage[]=Seed&&raised[max]=400000&markets[]=Education&stage[]=Seed&'
+    assert search_query.canonical_url(a) == search_query.canonical_url(b)
+    assert search_query.query_key(a) == search_query.query_key(b)
+    assert search_query.base_fname(a) == search_query.base_fname(b)
+
+
+def test_parameters_are_kept_as_sent():
+    assert search_query.canonical_params(ROOT + '&stage=&locations[]=London,+GB') == (
+        'locations[]=London,+GB', 'stage=')
+    assert search_query.query_key(ROOT + '&stage=') != search_query.query_key(ROOT)
+
+
+def test_canonical_urls_keep_their_file_names():
+    url = ROOT + '&markets[]=Education&stage[]=Seed'
+    assert search_query.canonical_url(url) == url
+    assert search_query.base_fname(url) == 'results_' + url.replace(ROOT, '').replace('&', '_') + '.csv'
+
+
+def test_count_cache_uses_the_canonical_query(tmpdir):
+    cache = count_cache.CountCache(str(tmpdir.join('count_cache.sqlite')))
+    cache.put(ROOT + '&b=2&a=1&', 42)
+    assert cache.get(ROOT + '&a=1&b=2&a=1') == (True, 42)
+    assert cache.get(ROOT + '&a=1') == (False, None)
+    cache.close()
+
+
+def queries(*counts):
+    return [dict(url='q{}'.format(i), company_count=n) for i, n in enumerate(counts)]
+
+
+def test_cover_drops_queries_other_queries_already_return():
+    links = dict(q0=set('abcdef'), q1=set('abc'), q2=set('def'), q3=set('gh'))
+    selected, summary = query_planner.greedy_query_cover(queries(6, 3, 3, 2), links)
+    assert sorted(x['url'] for x in selected) == ['q0', 'q3']
+    assert summary['n_covered'] == summary['n_companies'] == 8
+
+
+def test_cover_keeps_queries_never_crawled():
+    links = dict(q0=set('abc'), q1=set('ab'))
+    selected, summary = query_planner.greedy_query_cover(queries(3, 2, 50), links)
+    assert sorted(x['url'] for x in selected) == ['q0', 'q2']
+    assert summary['n_unobserved'] == 1
+
+
+def test_cover_weighs_companies_by_cost():
+    # one expensive query returning everything against two cheap ones returning the same together
+    links = dict(q0=set('abcd'), q1=set('ab'), q2=set('cd'))
+    cost = dict(q0=10., q1=1., q2=1.)
+    selected, summary = query_planner.greedy_query_cover(queries(4, 2, 2), links, cost_fn=lambda d: cost[d['url']])
+    assert sorted(x['url'] for x in selected) == ['q1', 'q2']
+    assert summary['cost_selected'] == 2.
+
+
+def test_cover_stops_at_the_target_coverage():
+    links = dict(('q{}'.format(i), set(range(i * 10, i * 10 + 10))) for i in range(10))
+    selected, summary = query_planner.greedy_query_cover(queries(*[10] * 10), links, target_coverage=0.5)
+    assert len(selected) == 5
+    assert summary['n_covered'] == 50
@@ -0,0 +1,257 @@
+import os
+import re
+import time
+import threading
+
+import pytest
+import requests
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.webdriver.common.by import By
+
+import AngelScraper as AS
+import browser_rows
+import driver_pool
+import frontier
+import page_store
+import search_query
+
+
+class FakeElement:
+    def __init__(self, on_click):
+        self.on_click = on_click
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+    def click(self):
+        self.on_click()
+
+
+class FakeBrowser:
+    """
+    just enough of a webdriver for parse_one_sort_pass: pages come from the stand-in server and a click on
+    "more" appends the next batch of rows, the way the page script of the stand-in does
+    """
+    def __init__(self):
+        self.session = requests.Session()
+        self.wait = self
+        self.current_url = 'about:blank'
+        self.url = None
+        self.page = ''
+        self.next_page = 2
+        self.n_page_sources = 0
+
+    def get(self, url):
+        self.current_url = url
+        if url == 'about:blank':
+            self.page = ''
+            return
+        self.url = url
+        self.page = self.session.get(url).text
+        self.next_page = 2
+
+    @property
+    def page_source(self):
+        self.n_page_sources += 1
+        return self.page
+
+    def until(self, condition):
+        try:
+            result = condition(self)
+        except NoSuchElementException:
+            result = False
+        if not result:
+            raise TimeoutException()
+        return result
+
+    def find_element(self, by, value):
+        if by == By.CLASS_NAME and value == 'more' and '<div class="more">' in self.page:
+            return FakeElement(self.more)
+        raise NoSuchElementException(value)
+
+    def more(self):
+        d = self.session.get(self.url.replace('/companies?', '/companies/more?') + '&page={}'.format(
+            self.next_page)).json()
+        self.next_page += 1
+        head, tail = self.page.split('</div><div class="more">', 1)
+        if d['last_page']:
+            self.page = head + d['html'] + '</div>' + tail.split('</div>', 1)[1]
+        else:
+            self.page = head + d['html'] + '</div><div class="more">' + tail
+
+    def execute_script(self, script, *args):
+        if script == browser_rows.COUNT_ROWS_JS:
+            return len(re.findall('data-_tn="companies/row"', self.page))
+        return None
+
+    def execute_async_script(self, script, *args):
+        raise Exception('no async scripts')
+
+    def set_script_timeout(self, timeout):
+        pass
+
+    def delete_all_cookies(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def scraper(tmpdir, no_pacing):
+    a = AS.AngelScraper(output_dir=str(tmpdir))
+    a.driver_pool = driver_pool.DriverPool(size=2, driver_factory=FakeBrowser)
+    a.visit_inner = False
+    yield a
+    a.close()
+
+
+def url_dict(server):
+    """
+    a query of the stand-in with several batches of rows, under the result cap
+    """
+    for lo in range(10):
+        url = '{}/companies?signal[min]={}&signal[max]={}'.format(server.base_url, lo, lo + 1)
+        count = int(re.search(r'([\d,]+) Companies', requests.get(url).text).group(1).replace(',', ''))
+        if 60 < count <= 400:
+            return dict(url=url, fname=search_query.base_fname(url), company_count=count, featured='', signal=1)
+    pytest.skip('no query with several batches in the stand-in')
+
+
+def n_batches(d):
+    return (d['company_count'] + 19) // 20
+
+
+def test_pass_collects_every_row_and_gives_the_driver_back(server, scraper):
+    d = url_dict(server)
+    assert scraper.parse_one_sort_pass(d, 'signal')
+    result_fname = scraper.results_folder + '/' + d['fname'].replace('.csv', '_sort=signal.csv')
+    with open(result_fname) as f:
+        assert sum(1 for _ in f) - 1 == d['company_count']
+    assert scraper.driver_pool._n_live == len(scraper.driver_pool._idle)
+
+
+def test_pass_archives_the_page_before_the_first_click(server, scraper):
+    d = url_dict(server)
+    assert scraper.parse_one_sort_pass(d, 'signal')
+    # the page as loaded is click 1, a query of up to 20 companies has no other page
+    assert scraper.page_store.has(page_store.index_page_key(d['url'], 'signal', 1, scraper.run_id), kind='index')
+
+
+def test_failing_pass_gives_the_driver_back(server, scraper):
+    d = url_dict(server)
+
+    def crash():
+        raise RuntimeError('browser crashed')
+    scraper.page_store.put = lambda *args, **kwargs: crash()
+    for _ in range(scraper.driver_pool.size + 1):
+        with pytest.raises(RuntimeError):
+            scraper.parse_one_sort_pass(d, 'signal')
+    assert scraper.driver_pool._n_live == 0
+
+
+def test_pass_sends_a_heartbeat_per_click_and_stops_when_the_lease_is_lost(server, scraper):
+    d = url_dict(server)
+    beats = []
+    assert scraper.parse_one_sort_pass(d, 'signal', heartbeat=lambda: beats.append(1) or True)
+    # one per click and one before the pass file is written
+    assert len(beats) == n_batches(d) + 1
+
+    beats = []
+    assert scraper.parse_one_sort_pass(d, 'signal', heartbeat=lambda: beats.append(1) or len(beats) < 3) is None
+    assert len(beats) == 3
+    assert scraper.driver_pool._n_live == len(scraper.driver_pool._idle)
+
+
+def test_pass_losing_its_lease_leaves_the_file_of_the_new_owner(server, scraper):
+    d = url_dict(server)
+    result_fname = scraper.results_folder + '/' + d['fname'].replace('.csv', '_sort=signal.csv')
+    with open(result_fname, 'w') as f:
+        f.write('rows of the worker that took the job over\n')
+
+    # the lease expires during the last click, only the check before the file is written notices
+    beats = []
+    assert scraper.parse_one_sort_pass(d, 'signal', heartbeat=lambda: beats.append(1) or len(beats) <= n_batches(d)
+                                       ) is None
+    with open(result_fname) as f:
+        assert f.read() == 'rows of the worker that took the job over\n'
+    assert [x for x in os.listdir(scraper.results_folder) if x.endswith('.part')] == []
+    # nor do its rows reach the parquet dataset
+    assert [x for _, _, files in os.walk(scraper.result_dataset_dir) for x in files] == []
+
+
+class FailingPager:
+    """
+    replayed pagination whose requests fail after the first batches, e.g. once the session expired
+    """
+    def __init__(self, driver, n_batches):
+        # the driver goes back to the pool once the replay starts, the pager keeps a copy of its page
+        self.driver = FakeBrowser()
+        self.driver.url, self.driver.page, self.driver.next_page = driver.url, driver.page, driver.next_page
+        self.n_batches = n_batches
+        self.last_page = False
+        self.n_requests = 0
+        self.n_bytes = 0
+
+    def fetch_next(self):
+        self.n_requests += 1
+        if self.n_requests > self.n_batches:
+            return None
+        self.driver.more()
+        return self.driver.page
+
+    def close(self):
+        pass
+
+
+def test_pass_with_failing_replay_is_not_reported_complete(server, scraper, tmpdir):
+    d = url_dict(server)
+    scraper.pagination = 'replay'
+    scraper.start_replay = lambda driver, url, page, n_rows: FailingPager(driver, 2)
+    assert scraper.parse_one_sort_pass(d, 'signal') is False
+    # the truncated rows are dropped, the retry writes the pass
+    assert os.listdir(scraper.results_folder) == []
+    assert scraper.driver_pool._n_live == len(scraper.driver_pool._idle)
+
+    fr = frontier.Frontier(str(tmpdir.join('frontier.sqlite')), max_attempts=1)
+    fr.add_jobs([d], lambda n: ['signal'])
+    scraper.crawl_frontier(fr, worker_id='a')
+    assert fr.stats() == {frontier.FAILED: 1}
+
+
+def test_frontier_crawl_keeps_its_leases(server, scraper, tmpdir):
+    d = url_dict(server)
+    db_file = str(tmpdir.join('frontier.sqlite'))
+    fr = frontier.Frontier(db_file, lease_seconds=0.5)
+    fr.add_jobs([d], lambda n: ['signal'])
+
+    # another worker keeps asking for work while the pass runs, it must never get the leased job
+    stolen = []
+    done = threading.Event()
+
+    def other_worker():
+        other = frontier.Frontier(db_file, lease_seconds=0.5)
+        while not done.is_set():
+            job = other.lease('b')
+            if job is not None:
+                stolen.append(job)
+                other.fail(job[0], 'b')
+            time.sleep(0.05)
+        other.close()
+
+    t = threading.Thread(target=other_worker)
+    t.start()
+    # slow every click down so the pass lasts several leases
+    more = FakeBrowser.more
+    FakeBrowser.more = lambda self: (time.sleep(0.2), more(self))
+    try:
+        scraper.crawl_frontier(fr, worker_id='a', poll_seconds=0.1)
+    finally:
+        FakeBrowser.more = more
+        done.set()
+        t.join()
+    assert stolen == []
+    assert fr.stats() == {frontier.DONE: 1}